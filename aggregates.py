@@ -0,0 +1,168 @@
+import copy
+import json
+import os
+import threading
+import uuid
+
+from storage import PODZAKAZ, SALES
+
+# После скольких дописанных в журнал изменений итоги переписываются в stats.json целиком
+COMPACT_EVERY = 1000
+
+
+def _empty_totals():
+    return {'count': 0, 'revenue': 0.0}
+
+
+def _empty_stats(kind):
+    if kind == SALES:
+        return {**_empty_totals(), 'categories': {}, 'couriers': {}, 'days': {}}
+    return {**_empty_totals(), 'paid': 0.0, 'remaining': 0.0, 'days': {}}
+
+
+class AggregateStore:
+    """Итоги по продажам и подзаказам, которые обновляются при каждом сохранении.
+
+    Для продаж хранит количество и выручку всего, по категориям, по курьерам
+    (с суммами курьерам) и по дням; для подзаказов — количество, выручку,
+    оплаченные суммы и остаток к оплате. Итоги сохраняются в JSON-файл,
+    поэтому карточки статистики не пересчитывают всю историю.
+
+    Новые записи не переписывают stats.json: их вклад в итоги дописывается
+    строкой в журнал stats.json.log, а файл итогов переписывается целиком
+    раз в COMPACT_EVERY записей (и при пересчете). Строки журнала помечены
+    поколением файла итогов, поэтому журнал, оставшийся от прежнего файла
+    (сбой между записью файла и удалением журнала), повторно не учитывается.
+    """
+
+    def __init__(self, stats_file='stats.json', compact_every=COMPACT_EVERY):
+        self.stats_file = stats_file
+        self.journal_file = stats_file + '.log'
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self.data = {SALES: _empty_stats(SALES), PODZAKAZ: _empty_stats(PODZAKAZ)}
+        self.generation = None
+        self._journal_size = 0
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as file:
+                    saved = json.load(file)
+                for kind in (SALES, PODZAKAZ):
+                    if kind in saved:
+                        self.data[kind] = saved[kind]
+                self.generation = saved.get('generation')
+            except Exception as e:
+                print(f"Ошибка загрузки статистики: {e}")
+        if self.generation is None or not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная при сбое последняя строка журнала
+                    continue
+                if entry.get('generation') == self.generation and entry.get('kind') in self.data:
+                    self._apply(entry['kind'], entry['delta'])
+                    self._journal_size += 1
+
+    def _save(self):
+        """Атомарно записывает итоги в файл и начинает новый журнал; вызывается под блокировкой"""
+        self.generation = uuid.uuid4().hex
+        tmp_file = self.stats_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump({**self.data, 'generation': self.generation}, file, ensure_ascii=False)
+        os.replace(tmp_file, self.stats_file)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._journal_size = 0
+
+    def _append(self, kind, deltas):
+        """Дописывает вклад новых записей в журнал (или сохраняет итоги целиком); вызывается под блокировкой"""
+        if self.generation is None or self._journal_size + len(deltas) > self.compact_every:
+            self._save()
+            return
+        with open(self.journal_file, 'a', encoding='utf-8') as file:
+            file.write(''.join(
+                json.dumps({'generation': self.generation, 'kind': kind, 'delta': delta}, ensure_ascii=False) + '\n'
+                for delta in deltas))
+        self._journal_size += len(deltas)
+
+    @staticmethod
+    def _delta(kind, record):
+        """Вклад записи (SaleRecord или PodzakazRecord) в итоги"""
+        delta = {'day': record.date[:10], 'price': float(record.price or 0)}
+        if kind == SALES:
+            delta['category'] = record.category
+            if record.courier:
+                delta['courier'] = record.courier
+                delta['payout'] = float(record.courier_amount or 0)
+        else:
+            delta['paid'] = float(record.paid or 0)
+            delta['remaining'] = float(record.remaining or 0)
+        return delta
+
+    def _apply(self, kind, delta):
+        """Добавляет вклад записи к итогам; вызывается под блокировкой"""
+        stats = self.data[kind]
+        price = delta['price']
+        stats['count'] += 1
+        stats['revenue'] += price
+
+        day = stats['days'].setdefault(delta['day'], _empty_totals())
+        day['count'] += 1
+        day['revenue'] += price
+
+        if kind == SALES:
+            category = stats['categories'].setdefault(delta['category'], _empty_totals())
+            category['count'] += 1
+            category['revenue'] += price
+
+            if 'courier' in delta:
+                courier = stats['couriers'].setdefault(delta['courier'], {**_empty_totals(), 'payout': 0.0})
+                courier['count'] += 1
+                courier['revenue'] += price
+                courier['payout'] += delta['payout']
+        else:
+            stats['paid'] += delta['paid']
+            stats['remaining'] += delta['remaining']
+
+    def _add(self, kind, record):
+        """Добавляет запись к итогам; вызывается под блокировкой"""
+        delta = self._delta(kind, record)
+        self._apply(kind, delta)
+        return delta
+
+    def add(self, kind, record):
+        """Учитывает новую запись и дописывает ее в журнал итогов"""
+        with self._lock:
+            self._append(kind, [self._add(kind, record)])
+
+    def add_many(self, kind, records):
+        """Учитывает сразу много записей и сохраняет их одной записью на диск"""
+        with self._lock:
+            self._append(kind, [self._add(kind, record) for record in records])
+
+    def rebuild(self, kind, records):
+        """Пересчитывает итоги по всей истории (если файл итогов отстал от данных)"""
+        with self._lock:
+            self.data[kind] = _empty_stats(kind)
+            for record in records:
+                self._add(kind, record)
+            self._save()
+
+    def reset(self, kind):
+        """Обнуляет итоги после очистки истории"""
+        self.rebuild(kind, [])
+
+    def get(self, kind):
+        """Копия текущих итогов вида kind (изменения копии не затрагивают итоги)"""
+        return self.snapshot(kind)
+
+    def snapshot(self, kind):
+        """Копия итогов вида kind, которую можно читать, пока идут записи (например, в другом потоке)"""
+        with self._lock:
+            return copy.deepcopy(self.data[kind])
@@ -0,0 +1,361 @@
+"""Журнал записей только на дописывание: контрольная сумма на каждую запись и групповой fsync.
+
+Формат файла: первая строка — заголовок MAGIC, дальше по строке на запись:
+    <crc32 в hex, 8 знаков> <строка записи в JSON>\\n
+JSON экранирует переводы строк, поэтому запись всегда занимает одну строку.
+Запись, оборванная сбоем (нет перевода строки или не сходится сумма),
+в конце файла отрезается при открытии журнала; испорченная строка в
+середине пропускается при чтении, а следующие за ней записи сохраняются.
+
+Отрезает хвост только владелец журнала (блокировка файла <журнал>.lock):
+другие процессы (экспорт, импорт, служба при открытом приложении) хвост
+не трогают — у работающего владельца это может быть дописываемая запись.
+"""
+import json
+import os
+import threading
+import zlib
+
+from locks import lock_file
+from snapshot import History
+
+MAGIC = b'SALESLOG 1\n'
+
+# Сколько байт с конца файла проверять при восстановлении (оборванной бывает только последняя пачка)
+TAIL_SCAN = 1 << 20
+
+
+def encode_row(row):
+    """Строка журнала для записи (значения — строки в порядке колонок)"""
+    payload = json.dumps(['' if value is None else str(value) for value in row],
+                         ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def checked_payload(line):
+    """JSON записи из строки журнала без перевода строки или None, если не сходится контрольная сумма"""
+    if len(line) < 10 or line[8:9] != b' ':
+        return None
+    payload = line[9:]
+    try:
+        checksum = int(line[:8], 16)
+    except ValueError:
+        return None
+    return payload if zlib.crc32(payload) == checksum else None
+
+
+def decode_payload(payload):
+    try:
+        row = json.loads(payload)
+    except ValueError:
+        return None
+    return row if isinstance(row, list) else None
+
+
+def decode_line(line):
+    """Значения записи из строки журнала или None, если строка оборвана или испорчена"""
+    if not line.endswith(b'\n'):
+        return None
+    payload = checked_payload(line[:-1])
+    return None if payload is None else decode_payload(payload)
+
+
+def parse(data):
+    """Разбирает байты журнала: (записи, конец последней целой строки, конец последней верной записи, испорченных строк)"""
+    payloads = []
+    consumed = good_end = bad = 0
+    while consumed < len(data):
+        newline = data.find(b'\n', consumed)
+        if newline < 0:
+            # Последняя строка еще не дописана (или оборвана) — ее не трогаем
+            break
+        payload = checked_payload(data[consumed:newline])
+        consumed = newline + 1
+        if payload is None:
+            bad += 1
+        else:
+            payloads.append(payload)
+            good_end = consumed
+    try:
+        # Проверенные записи разбираем одним вызовом JSON — так в разы быстрее, чем по строке
+        rows = json.loads(b'[' + b','.join(payloads) + b']')
+    except ValueError:
+        rows = [decode_payload(payload) for payload in payloads]
+        bad += rows.count(None)
+        rows = [row for row in rows if row is not None]
+    return rows, consumed, good_end, bad
+
+
+def fsync_dir(path):
+    """fsync папки, чтобы переименование файла тоже пережило сбой питания"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        # Windows не дает открыть папку как файл; там переименование и так надежно
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AppendLog:
+    """Один файл журнала: дописывание с групповой фиксацией, восстановление хвоста и кэш чтения.
+
+    append() возвращается только после fsync, но пачки, дописанные, пока
+    идет fsync другой пачки, сбрасываются на диск следующим общим fsync:
+    при одновременных сохранениях число fsync растет медленнее числа записей.
+    Переписывание файла (rewrite) идет через временный файл и os.replace.
+    Кэш чтения может начинаться с двоичного снимка (seed, см. snapshot.py).
+    """
+
+    def __init__(self, path, parse_row=list):
+        self.path = path
+        self.parse_row = parse_row
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._fd = None
+        # Номер последней дописанной пачки и последней, подтвержденной fsync
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        # Кэш чтения: записи и до какого байта файл уже разобран
+        self._read_lock = threading.Lock()
+        # Меняется, когда кэш отбрасывает записи (журнал очищен или заменен): читатели хвоста начинают заново
+        self.generation = 0
+        self._reset_cache()
+        # Сколько байт оборванного хвоста отрезано при открытии
+        self.truncated = 0
+        # Блокировка владельца журнала; owner — None, пока владение не проверялось
+        self._owner_fd = None
+        self.owner = None
+
+    def _reset_cache(self):
+        self.generation += 1
+        self.base = None
+        self.records = []
+        self.offset = 0
+        self.file_id = None
+        self.skipped = 0
+
+    def open(self):
+        """Создает журнал или отрезает оборванный хвост и открывает файл на дописывание"""
+        with self._lock:
+            if self._fd is None:
+                self._open_locked()
+
+    def acquire(self):
+        """Берет журнал во владение; False, если им владеет другой работающий процесс"""
+        with self._lock:
+            return self._acquire_locked()
+
+    def _acquire_locked(self):
+        if self.owner is None:
+            self._owner_fd = lock_file(self.path + '.lock')
+            self.owner = self._owner_fd is not None
+        return self.owner
+
+    def _open_locked(self):
+        self._acquire_locked()
+        if self.owner:
+            if not os.path.exists(self.path):
+                self._replace_locked([])
+            else:
+                self._recover_locked()
+        else:
+            self._create_shared()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+
+    def _create_shared(self):
+        """Создает пустой журнал, только если его еще нет (не владельцем: журнал владельца не подменяется)"""
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+        except FileExistsError:
+            with open(self.path, 'rb') as file:
+                self._check_magic(file.read(len(MAGIC)))
+            return
+        try:
+            os.write(fd, MAGIC)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _check_magic(self, head):
+        if head != MAGIC:
+            raise ValueError(f"{self.path}: не журнал записей")
+
+    def _recover_locked(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as file:
+            self._check_magic(file.read(len(MAGIC)))
+            start = max(len(MAGIC), size - TAIL_SCAN)
+            file.seek(start)
+            data = file.read()
+            if start > len(MAGIC):
+                # Кусок до первого перевода строки — конец предыдущей записи
+                first = data.find(b'\n') + 1
+                data = data[first:] if first else b''
+                start += first
+            _, _, good_end, _ = parse(data)
+            if not good_end and start > len(MAGIC):
+                # В хвосте нет ни одной верной записи — проверяем файл целиком
+                start = len(MAGIC)
+                file.seek(start)
+                data = file.read()
+                _, _, good_end, _ = parse(data)
+        end = start + good_end if good_end else start
+        if end < size:
+            # Сбой посреди записи: отрезаем оборванный хвост, чтобы следующие записи не склеились с ним
+            with open(self.path, 'r+b') as file:
+                file.truncate(end)
+                file.flush()
+                os.fsync(file.fileno())
+            self.truncated = size - end
+
+    def append(self, rows):
+        """Дописывает записи одной пачкой и ждет, пока они окажутся на диске"""
+        data = b''.join(encode_row(row) for row in rows)
+        if not data:
+            return
+        with self._lock:
+            if self._fd is None:
+                self._open_locked()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            self._written += 1
+            ticket = self._written
+        self.commit(ticket)
+
+    def commit(self, ticket=None):
+        """Ждет fsync пачки ticket (по умолчанию — всего дописанного); fsync делает первый из ждущих"""
+        with self._lock:
+            if ticket is None:
+                ticket = self._written
+            while self._synced < ticket:
+                if self._syncing:
+                    # fsync уже идет; если он не покроет нашу пачку, следующий сделаем сами
+                    self._committed.wait()
+                    continue
+                self._syncing = True
+                target, fd = self._written, self._fd
+                self._lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                    self._committed.notify_all()
+                self._synced = max(self._synced, target)
+
+    def seed(self, snapshot):
+        """Берет начало истории из снимка: дальше разбирается только журнал после snapshot.source_offset"""
+        with self._read_lock:
+            stat = os.stat(self.path)
+            self._reset_cache()
+            self.base = snapshot
+            self.offset = snapshot.source_offset
+            self.file_id = (stat.st_dev, stat.st_ino)
+
+    def snapshot_state(self):
+        """(снимок или None, записи после него, до какого байта разобран журнал) — для записи нового снимка"""
+        with self._read_lock:
+            return self.base, list(self.records), self.offset
+
+    def read(self):
+        """Все верные записи журнала; при повторном вызове разбирается только дописанное"""
+        with self._read_lock:
+            self._refresh()
+            if self.base is not None:
+                return History(self.base, list(self.records))
+            return list(self.records)
+
+    def since(self, position):
+        """(поколение кэша, записи начиная с номера position) — без копирования всей истории"""
+        with self._read_lock:
+            self._refresh()
+            if self.base is not None:
+                return self.generation, History(self.base, self.records)[position:]
+            return self.generation, self.records[position:]
+
+    def _refresh(self):
+        """Дочитывает журнал в кэш; вызывается под _read_lock"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_cache()
+            return
+
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self.file_id or stat.st_size < self.offset:
+            # Журнал заменен (очистка) или укорочен — перечитываем целиком
+            self._reset_cache()
+            self.file_id = file_id
+
+        if stat.st_size > self.offset:
+            with open(self.path, 'rb') as file:
+                if self.offset == 0:
+                    self._check_magic(file.read(len(MAGIC)))
+                    self.offset = len(MAGIC)
+                file.seek(self.offset)
+                data = file.read()
+            rows, consumed, _, bad = parse(data)
+            self.records.extend(self.parse_row(row) for row in rows)
+            self.offset += consumed
+            self.skipped += bad
+
+    def iter_rows(self):
+        """Записи журнала по одной, без загрузки файла в память"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as file:
+            self._check_magic(file.read(len(MAGIC)))
+            for line in file:
+                row = decode_line(line)
+                if row is not None:
+                    yield row
+
+    def create(self, rows):
+        """Создает журнал из строк rows: они пишутся во временный файл, и журнал появляется только целиком"""
+        with self._lock:
+            if self._fd is not None or os.path.exists(self.path):
+                raise FileExistsError(f"{self.path}: журнал уже есть")
+            self._replace_locked(rows)
+
+    def rewrite(self, transform):
+        """Атомарно переписывает журнал: transform(записи) -> новые строки; дописывание на это время ждет"""
+        with self._lock:
+            while self._syncing:
+                self._committed.wait()
+            if self._fd is None:
+                self._open_locked()
+            rows = transform(self.read())
+            self._replace_locked(rows)
+
+    def _replace_locked(self, rows):
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'wb', buffering=1 << 20) as file:
+            file.write(MAGIC)
+            for row in rows:
+                file.write(encode_row(row))
+            file.flush()
+            os.fsync(file.fileno())
+        # Открытый файл закрываем до подмены: в Windows его иначе нельзя заменить
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        os.replace(tmp_file, self.path)
+        fsync_dir(self.path)
+        self._synced = self._written
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if self._owner_fd is not None:
+                os.close(self._owner_fd)
+                self._owner_fd = None
+            self.owner = None
@@ -0,0 +1,338 @@
+"""Замеры скорости приложения на синтетических данных.
+
+Генерирует правдоподобные продажи и подзаказы (колонки как в sales_data.csv
+и podzakaz_data.csv, категории из SalesApp.categories) нужного объема и
+замеряет: скорость save_sale / save_podzakaz, загрузку истории (время и
+память), расчет статистики и отчетов, построение страницы истории на
+странице-заглушке без окна, запуск (импорт main.py в новом процессе, первый
+кадр формы и готовность истории), запись двоичного снимка истории и
+открытие хранилища по нему. Каждый объем проверяется в отдельной
+временной папке, рабочие файлы приложения не затрагиваются. Хранилище —
+то же, что у приложения (SALES_STORAGE, иначе журнал 'log'), а Google
+Таблицы заменяет локальный sheets_standin.py: замеры не отправляют строки
+в настоящую таблицу.
+
+С --startup-budget проверяется бюджет запуска: импорт и первый кадр формы
+вместе не дольше заданного числа секунд (иначе код выхода 1).
+
+Результаты пишутся в JSON. С --baseline результаты сравниваются с
+сохраненным файлом: замеры, ухудшившиеся больше чем на --threshold,
+выводятся как регрессии (код выхода 1).
+
+Запуск: python benchmark.py [--sizes 1000,100000,1000000] [--output результат.json]
+        [--baseline прошлый.json] [--threshold 0.2] [--min-time 0.01] [--seed 1]
+        [--startup-budget 1.0]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sheets_standin import StandinSheets, start_server
+from storage import DEFAULT_STORAGE, PODZAKAZ, SALES
+
+DEFAULT_SIZES = [1000, 100000]
+
+# Сколько сохранений замерять поверх уже накопленной истории
+SAVE_COUNT = 500
+
+PRODUCTS = ['Платье', 'Блузка', 'Юбка', 'Брюки', 'Джинсы', 'Футболка', 'Свитер', 'Кардиган',
+            'Пальто', 'Куртка', 'Костюм', 'Рубашка', 'Шорты', 'Комбинезон', 'Сумка', 'Шарф']
+COLORS = ['черный', 'белый', 'бежевый', 'красный', 'синий', 'зеленый', 'серый', 'розовый', 'молочный']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '42', '44', '46', '48', '50']
+COURIERS = ['', '', '', 'Арман', 'Даурен', 'Вася', 'Самат']
+
+
+def generate_rows(kind, count, categories, seed=1, days=730):
+    """Строки истории вида kind в порядке дат: за последние days дней до сегодня"""
+    rng = random.Random(seed)
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    step = days * 86400 / max(count, 1)
+    clients = [f"+7 7{rng.randrange(10**8, 10**9)}" for _ in range(max(count // 20, 10))]
+
+    for i in range(count):
+        date = (start + timedelta(seconds=int(i * step))).strftime("%Y-%m-%d %H:%M:%S")
+        product = f"{rng.choice(PRODUCTS)} {rng.randrange(1, 40)}"
+        price = rng.randrange(30, 600) * 100
+        if kind == SALES:
+            courier = rng.choice(COURIERS)
+            yield [date, product, rng.choice(COLORS), rng.choice(SIZES), str(price),
+                   rng.choice(categories), courier, str(rng.choice([1000, 1500, 2000])) if courier else '']
+        else:
+            paid = rng.choice([0, price // 2, price])
+            yield [date, product, rng.choice(COLORS), rng.choice(SIZES), str(price),
+                   str(paid), str(price - paid), rng.choice(clients)]
+
+
+class HeadlessPage:
+    """Заглушка ft.Page без окна: хранит добавленные элементы и считает вызовы update()"""
+
+    def __init__(self):
+        self.controls = []
+        self.overlay = []
+        self.snack_bar = None
+        self.updates = 0
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def clean(self):
+        self.controls = []
+
+    def update(self):
+        self.updates += 1
+
+    def walk(self):
+        """Все элементы страницы с вложенными"""
+        stack = list(self.controls)
+        while stack:
+            control = stack.pop()
+            yield control
+            for name in ('controls', 'content', 'actions'):
+                child = getattr(control, name, None)
+                if isinstance(child, list):
+                    stack.extend(child)
+                elif child is not None and not isinstance(child, str):
+                    stack.append(child)
+
+    def click(self, text):
+        """Нажимает кнопку с надписью text"""
+        for control in self.walk():
+            if getattr(control, 'text', None) == text and getattr(control, 'on_click', None):
+                control.on_click(None)
+                return
+        raise LookupError(f"Кнопка не найдена: {text}")
+
+    def wait_idle(self, timeout=60):
+        """Ждет, пока на странице не останется надписей о работе в фоне (⏳), например сверки при запуске"""
+        deadline = time.monotonic() + timeout
+        while any(str(getattr(control, 'value', '')).startswith('⏳') for control in self.walk()):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Фоновая работа страницы не завершилась")
+            time.sleep(0.05)
+
+
+def import_time():
+    """Время импорта main.py в новом процессе (холодный запуск интерпретатора с кэшем байткода)"""
+    code = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def peak_memory(function, *args):
+    """Пик выделенной памяти (МБ) при вызове function; время под tracemalloc не показательно"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+
+def prepare(app, size, seed):
+    """Наполняет хранилище приложения синтетической историей обоих видов"""
+    for kind in (SALES, PODZAKAZ):
+        chunk = []
+        for row in generate_rows(kind, size, app.categories, seed):
+            chunk.append(row)
+            if len(chunk) >= 10000:
+                app.import_rows(kind, chunk, push_to_sheets=False)
+                chunk = []
+        app.import_rows(kind, chunk, push_to_sheets=False)
+
+
+def run_size(size, seed=1):
+    """Замеры для истории из size записей каждого вида; имена замеров оканчиваются на единицу измерения"""
+    from main import main
+    from sales_app import SalesApp
+    from metrics import metrics
+    from reports import ReportEngine
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='sales-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    opened = []
+
+    def fresh_app():
+        """Новый экземпляр приложения; прошлый закрывается, чтобы новый, как при запуске, владел журналом"""
+        while opened:
+            opened.pop().storage.close()
+        opened.append(SalesApp())
+        return opened[-1]
+
+    try:
+        results['generate_s'], _ = timed(prepare, fresh_app(), size, seed)
+
+        # Загрузка истории с диска — каждый раз в новом экземпляре приложения
+        for kind, name in ((SALES, 'sales'), (PODZAKAZ, 'podzakaz')):
+            app = fresh_app()
+            load = app.get_sales_history if kind == SALES else app.get_podzakaz_history
+            results[f'load_{name}_s'], _ = timed(load)
+            results[f'reload_{name}_s'], _ = timed(load)
+            app = fresh_app()
+            results[f'load_{name}_mb'] = peak_memory(app.get_sales_history if kind == SALES else app.get_podzakaz_history)
+
+            # Статистика: пересчет по всей истории и готовые итоги
+            os.remove(app.stats.stats_file)
+            app = fresh_app()
+            results[f'stats_rebuild_{name}_s'], _ = timed(app.get_statistics, kind)
+            results[f'stats_{name}_s'], _ = timed(app.get_statistics, kind)
+
+        reports = ReportEngine(fresh_app())
+        today = datetime.now()
+        results['report_month_cold_s'], _ = timed(reports.month_report, today.year, today.month)
+        results['report_months_s'], _ = timed(reports.revenue_by_period, 'month')
+
+        # Сохранения поверх накопленной истории (без Google Таблиц)
+        app = fresh_app()
+        rows = list(generate_rows(SALES, SAVE_COUNT, app.categories, seed + 1))
+        elapsed, _ = timed(lambda: [app.save_sale(*row[1:]) for row in rows])
+        results['save_sale_per_s'] = SAVE_COUNT / elapsed
+        rows = list(generate_rows(PODZAKAZ, SAVE_COUNT, app.categories, seed + 1))
+        elapsed, _ = timed(lambda: [app.save_podzakaz(*row[1:]) for row in rows])
+        results['save_podzakaz_per_s'] = SAVE_COUNT / elapsed
+
+        # Построение страниц на заглушке: главная и переходы в историю
+        # Страница открывает свое хранилище (и отправку в локальную замену таблиц)
+        while opened:
+            opened.pop().storage.close()
+        page = HeadlessPage()
+        metrics.reset()
+        results['render_main_s'], _ = timed(main, page)
+        # Первый переход в историю ждет запуска служб в потоке сохранения
+        results['render_history_s'], _ = timed(page.click, "История продаж")
+        startup = metrics.snapshot()
+        results['startup_first_frame_s'] = startup['startup.first_frame']['max_ms'] / 1000
+        results['startup_ready_s'] = startup['startup.ready']['max_ms'] / 1000
+        page.click("Назад к добавлению заказов")
+        results['render_podzakaz_s'], _ = timed(page.click, "Подзаказы")
+        # Повторный переход: страница уже построена, сверяется только разница
+        page.click("Назад к добавлению заказов")
+        results['render_history_again_s'], _ = timed(page.click, "История продаж")
+        # Сверка, начатая при запуске, пишет свое состояние в рабочую папку — ждем ее на главной до выхода из папки
+        page.click("Назад к добавлению заказов")
+        page.wait_idle()
+
+        # Снимок истории: запись и загрузка в новом экземпляре приложения через mmap.
+        # Журнал уже открыт страницей, поэтому эти экземпляры им не владеют — на чтение это не влияет
+        app = fresh_app()
+        app.get_sales_history()
+        app.get_podzakaz_history()
+        results['snapshot_write_s'], _ = timed(app.storage.save_snapshot)
+        results['load_snapshot_sales_s'], _ = timed(lambda: fresh_app().get_sales_history())
+        results['load_snapshot_podzakaz_s'], _ = timed(lambda: fresh_app().get_podzakaz_history())
+    finally:
+        while opened:
+            opened.pop().storage.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold, min_time=0.01):
+    """Список регрессий: (размер, замер, было, стало) для замеров хуже базовых больше чем на threshold.
+
+    Время меньше min_time секунд не сравнивается: на нем заметнее шум, чем изменения кода.
+    """
+    regressions = []
+    for size, metrics in results.items():
+        for name, value in metrics.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or name.startswith('generate'):
+                continue
+            if name.endswith('_s') and not name.endswith('_per_s') and max(base, value) < min_time:
+                continue
+            # Для скоростей (_per_s) больше — лучше, для времени и памяти — меньше
+            change = base / value - 1 if name.endswith('_per_s') else value / base - 1
+            if change > threshold:
+                regressions.append((size, name, base, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости на синтетических данных")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="объемы истории через запятую (например 1000,100000,1000000)")
+    parser.add_argument('--output', default='benchmark.json', help="файл с результатами")
+    parser.add_argument('--baseline', help="файл прошлых результатов для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    parser.add_argument('--min-time', type=float, default=0.01, help="не сравнивать замеры короче (секунд)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--startup-budget', type=float,
+                        help="допустимое время от импорта до первого кадра формы, секунд")
+    args = parser.parse_args(argv)
+
+    # Модули приложения импортируются из папки скрипта, даже когда замеры идут во временной папке
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Отправка в Google Таблицы идет в локальную замену: адрес читается при импорте main.py,
+    # поэтому задается до него (и для импорта в отдельном процессе)
+    server, url = start_server(StandinSheets())
+    os.environ['SALES_WEB_APP_URL'] = url
+    storage = os.environ.get('SALES_STORAGE', DEFAULT_STORAGE)
+    print(f"Хранилище: {storage}, Google Таблицы: {url}")
+
+    results = {}
+    startup_import_s = import_time()
+    print(f"Импорт main.py: {startup_import_s:.4f}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        print(f"Объем {size}...")
+        results[str(size)] = run_size(size, args.seed)
+        results[str(size)]['startup_import_s'] = startup_import_s
+        for name, value in results[str(size)].items():
+            print(f"  {name}: {value:.4f}")
+    server.shutdown()
+
+    report = {
+        'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': storage,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+    over_budget = False
+    if args.startup_budget is not None:
+        for size, metrics in results.items():
+            startup = metrics['startup_import_s'] + metrics['startup_first_frame_s']
+            if startup > args.startup_budget:
+                over_budget = True
+                print(f"БЮДЖЕТ ЗАПУСКА {size}: {startup:.4f} > {args.startup_budget:.4f}")
+        if not over_budget:
+            print("Бюджет запуска соблюден")
+
+    if not args.baseline:
+        return 1 if over_budget else 0
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    for size, name, base, value in regressions:
+        print(f"РЕГРЕССИЯ {size} {name}: {base:.4f} -> {value:.4f}")
+    if not regressions:
+        print("Регрессий нет")
+    return 1 if regressions or over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
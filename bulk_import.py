@@ -0,0 +1,198 @@
+"""Массовый импорт продаж и подзаказов из CSV-файла.
+
+Файл читается построчно, в формате sales_data.csv или podzakaz_data.csv
+(вид определяется по заголовку). Строки проверяются, суммы и даты
+приводятся к формату приложения, повторы уже сохраненных записей
+пропускаются. Записи сохраняются пачками, а в Google Таблицы уходят
+через журнал отправки пакетными запросами.
+
+Запуск: python bulk_import.py файл.csv [--kind sales|podzakaz] [--no-sheets] [--push [--push-timeout 600]]
+"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+from storage import HEADERS, PODZAKAZ, SALES, row_to_record
+
+# Поддерживаемые форматы дат: ГГГГ-ММ-ДД и ДД.ММ.ГГГГ, время (ЧЧ:ММ или ЧЧ:ММ:СС) необязательно
+_TIME = r'(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$'
+ISO_DATE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})' + _TIME)
+DOTTED_DATE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})' + _TIME)
+
+# Колонки с суммами: (номер колонки, обязательна ли)
+AMOUNT_COLUMNS = {
+    SALES: [(4, True), (7, False)],
+    PODZAKAZ: [(4, True), (5, False), (6, False)],
+}
+
+# Сколько секунд --push по умолчанию ждет отправки в Google Таблицы
+PUSH_TIMEOUT = 600
+
+
+def normalize_date(value):
+    """Дата в формате приложения 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' или None, если дату не разобрать"""
+    # Регулярные выражения заметно быстрее strptime на сотнях тысяч строк
+    match = ISO_DATE.match(value)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+    else:
+        match = DOTTED_DATE.match(value)
+        if not match:
+            return None
+        day, month, year, hour, minute, second = match.groups()
+
+    try:
+        date = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+    except ValueError:
+        return None
+    return date.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def normalize_amount(value):
+    """Сумма без пробелов и с точкой ('1 500,50' -> '1500.5', '2000.0' -> '2000') или None"""
+    text = value.replace('\xa0', '').replace(' ', '').replace(',', '.').replace('₸', '')
+    if not text:
+        return ''
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    if amount < 0:
+        return None
+    return str(int(amount)) if amount.is_integer() else str(amount)
+
+
+def normalize_row(kind, row):
+    """Проверяет строку и приводит ее к формату приложения; None — строка с ошибкой"""
+    if len(row) < 8:
+        return None
+    row = [value.strip() for value in row[:8]]
+
+    row[0] = normalize_date(row[0])
+    if row[0] is None or not row[1]:
+        return None
+
+    for column, required in AMOUNT_COLUMNS[kind]:
+        amount = normalize_amount(row[column])
+        if amount is None or (required and not amount):
+            return None
+        row[column] = amount
+    return row
+
+
+def record_digest(record):
+    """SHA-1 всех полей записи: 20 байт вместо самой записи, совпадение у разных записей практически исключено"""
+    return hashlib.sha1('\x1f'.join(map(str, record.key())).encode('utf-8')).digest()
+
+
+def detect_kind(header):
+    for kind, expected in HEADERS.items():
+        if [value.strip().lstrip('\ufeff') for value in header[:8]] == expected:
+            return kind
+    return None
+
+
+def import_csv(app, path, kind=None, push_to_sheets=True, chunk_size=5000):
+    """Импортирует CSV-файл в приложение; возвращает счетчики imported, duplicates, invalid"""
+    result = {'imported': 0, 'duplicates': 0, 'invalid': 0}
+
+    with open(path, 'r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return result
+
+        detected = detect_kind(header)
+        kind = kind or detected
+        if kind is None:
+            raise ValueError("Не удалось определить вид записей по заголовку, укажите --kind")
+        if detected is None:
+            # Файл без заголовка — первая строка тоже данные
+            reader = _prepend(header, reader)
+
+        # Для поиска повторов храним только SHA-1 записей (hash() кортежа может совпасть у разных строк)
+        history = app.get_sales_history() if kind == SALES else app.get_podzakaz_history()
+        seen = {record_digest(record) for record in history}
+        del history
+
+        chunk = []
+        for row in reader:
+            row = normalize_row(kind, row)
+            if row is None:
+                result['invalid'] += 1
+                continue
+
+            key = record_digest(row_to_record(kind, row))
+            if key in seen:
+                result['duplicates'] += 1
+                continue
+            seen.add(key)
+
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                app.import_rows(kind, chunk, push_to_sheets)
+                result['imported'] += len(chunk)
+                chunk = []
+
+        app.import_rows(kind, chunk, push_to_sheets)
+        result['imported'] += len(chunk)
+
+    return result
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт продаж или подзаказов из CSV-файла")
+    parser.add_argument('path', help="CSV-файл в формате sales_data.csv или podzakaz_data.csv")
+    parser.add_argument('--kind', choices=[SALES, PODZAKAZ], help="вид записей, если в файле нет заголовка")
+    parser.add_argument('--no-sheets', action='store_true', help="не отправлять записи в Google Таблицы")
+    parser.add_argument('--push', action='store_true', help="дождаться отправки записей в Google Таблицы")
+    parser.add_argument('--push-timeout', type=float, default=PUSH_TIMEOUT,
+                        help="сколько секунд ждать отправки (по умолчанию %(default)s)")
+    args = parser.parse_args(argv)
+
+    from outbox import SyncOutbox
+    from sales_app import WEB_APP_URL, GoogleSheetsManager, SalesApp
+    from storage import DEFAULT_STORAGE, open_storage
+    from sync import track_outbox
+
+    outbox = None if args.no_sheets else SyncOutbox(GoogleSheetsManager(WEB_APP_URL))
+    if outbox is not None:
+        # Отправленные здесь строки сверка приложения не отправит повторно
+        track_outbox(outbox)
+    app = SalesApp(outbox=outbox, storage=open_storage(os.environ.get('SALES_STORAGE', DEFAULT_STORAGE)))
+
+    started = time.perf_counter()
+    result = import_csv(app, args.path, args.kind, push_to_sheets=not args.no_sheets)
+    print(f"Импортировано: {result['imported']}, повторов: {result['duplicates']}, "
+          f"с ошибками: {result['invalid']} за {time.perf_counter() - started:.1f} с")
+    # Импортированные записи сразу попадают в снимок истории, чтобы приложение не разбирало их при запуске
+    app.storage.save_snapshot()
+
+    if outbox is not None and args.push:
+        outbox.start()
+        deadline = time.monotonic() + args.push_timeout
+        while outbox.pending_count() and time.monotonic() < deadline:
+            print(f"Ожидают отправки в Google Таблицы: {outbox.pending_count()}")
+            time.sleep(min(5, max(0, deadline - time.monotonic())))
+        outbox.stop()
+        if outbox.pending_count():
+            print(f"Не отправлено за {args.push_timeout:g} с: {outbox.pending_count()} "
+                  f"({outbox.last_error}); записи будут отправлены при следующем запуске приложения")
+            return 1
+    elif outbox is not None:
+        print("Записи будут отправлены в Google Таблицы при следующем запуске приложения")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
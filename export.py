@@ -0,0 +1,82 @@
+"""Выгрузка продаж и подзаказов в CSV или JSON.
+
+Записи читаются из хранилища по одной и сразу пишутся в файл, поэтому
+выгрузка не держит историю в памяти целиком.
+
+Запуск: python export.py файл.csv|файл.json [--kind sales|podzakaz] [--month ГГГГ-ММ]
+        [--from ГГГГ-ММ-ДД] [--to ГГГГ-ММ-ДД] [--archive] [--category ...] [--courier ...] [--product ...] [--client ...]
+"""
+import argparse
+import calendar
+import csv
+import json
+import os
+import sys
+
+from storage import DEFAULT_STORAGE, FILTERS, HEADERS, PODZAKAZ, RECORD_TYPES, SALES, open_storage
+
+
+def export_records(records, kind, path, fmt=None):
+    """Записывает записи (SaleRecord или PodzakazRecord) в CSV или JSON; возвращает их количество"""
+    fmt = fmt or ('json' if path.lower().endswith('.json') else 'csv')
+    # Колонки файла истории и необязательные после них (номер подзаказа)
+    header = HEADERS[kind] + list(RECORD_TYPES[kind].EXTRA_HEADER)
+    count = 0
+
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(header)
+            for record in records:
+                row = record.to_row()
+                writer.writerow(row + [''] * (len(header) - len(row)))
+                count += 1
+        elif fmt == 'json':
+            # Массив JSON пишем по элементу, не собирая список в памяти
+            file.write('[')
+            for record in records:
+                file.write(',\n' if count else '\n')
+                json.dump(record.as_dict(), file, ensure_ascii=False)
+                count += 1
+            file.write('\n]\n')
+        else:
+            raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    return count
+
+
+def month_bounds(month):
+    """Первый и последний день месяца 'ГГГГ-ММ'"""
+    year, number = (int(part) for part in month.split('-'))
+    return f"{year}-{number:02d}-01", f"{year}-{number:02d}-{calendar.monthrange(year, number)[1]:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка продаж или подзаказов в CSV/JSON")
+    parser.add_argument('path', help="файл выгрузки (.csv или .json)")
+    parser.add_argument('--kind', choices=[SALES, PODZAKAZ], default=SALES)
+    parser.add_argument('--format', choices=['csv', 'json'], help="формат (по умолчанию — по расширению файла)")
+    parser.add_argument('--month', help="месяц ГГГГ-ММ (вместо --from/--to)")
+    parser.add_argument('--from', dest='date_from', help="с даты ГГГГ-ММ-ДД включительно")
+    parser.add_argument('--to', dest='date_to', help="по дату ГГГГ-ММ-ДД включительно")
+    parser.add_argument('--archive', action='store_true', help="вместе с архивом очищенной истории")
+    for name in sorted(set(FILTERS[SALES]) | set(FILTERS[PODZAKAZ])):
+        parser.add_argument(f'--{name}')
+    args = parser.parse_args(argv)
+
+    date_from, date_to = month_bounds(args.month) if args.month else (args.date_from, args.date_to)
+    filters = {name: getattr(args, name) for name in FILTERS[args.kind]}
+
+    storage = open_storage(os.environ.get('SALES_STORAGE', DEFAULT_STORAGE))
+    try:
+        records = storage.iter_records(args.kind, date_from, date_to, args.archive, **filters)
+        count = export_records(records, args.kind, args.path, args.format)
+    finally:
+        storage.close()
+
+    print(f"Выгружено записей: {count} -> {args.path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
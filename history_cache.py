@@ -0,0 +1,116 @@
+import csv
+import io
+import os
+import threading
+
+from snapshot import History
+
+
+class HistoryCache:
+    """Кэш истории из CSV-файла в памяти с дочитыванием хвоста.
+
+    Помнит, до какого байта файл уже разобран, и при следующем обращении
+    разбирает только дописанные с тех пор строки. Полностью перечитывает
+    файл, только если он был заменен (другой inode), укорочен или
+    перезаписан с тем же размером (изменилось время модификации).
+    Начало истории может браться из двоичного снимка (seed), тогда из файла
+    разбираются только строки после покрытого снимком куска.
+    """
+
+    def __init__(self, path, header, parse_row):
+        self.path = path
+        self.header = header
+        self.parse_row = parse_row
+        self._lock = threading.Lock()
+        # Меняется, когда кэш отбрасывает записи (файл заменен или укорочен): читатели хвоста начинают заново
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self.generation += 1
+        self.base = None
+        self.records = []
+        self.offset = 0
+        self.file_id = None
+        self.mtime = None
+
+    def invalidate(self):
+        """Сбрасывает кэш — следующий вызов get() перечитает файл целиком"""
+        with self._lock:
+            self._reset()
+
+    def seed(self, snapshot):
+        """Берет начало истории из снимка: дальше разбирается только файл после snapshot.source_offset"""
+        with self._lock:
+            stat = os.stat(self.path)
+            self._reset()
+            self.base = snapshot
+            self.offset = snapshot.source_offset
+            self.file_id = (stat.st_dev, stat.st_ino)
+            self.mtime = stat.st_mtime_ns
+
+    def snapshot_state(self):
+        """(снимок или None, записи после него, до какого байта разобран файл) — для записи нового снимка"""
+        with self._lock:
+            return self.base, list(self.records), self.offset
+
+    def get(self):
+        """Возвращает все записи файла, разбирая только новые строки"""
+        with self._lock:
+            self._refresh()
+            if self.base is not None:
+                return History(self.base, list(self.records))
+            return list(self.records)
+
+    def since(self, position):
+        """(поколение кэша, записи начиная с номера position) — без копирования всей истории"""
+        with self._lock:
+            self._refresh()
+            if self.base is not None:
+                return self.generation, History(self.base, self.records)[position:]
+            return self.generation, self.records[position:]
+
+    def _refresh(self):
+        """Дочитывает файл; вызывается под блокировкой"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        file_id = (stat.st_dev, stat.st_ino)
+        if (file_id != self.file_id
+                or stat.st_size < self.offset
+                or (stat.st_size == self.offset and stat.st_mtime_ns != self.mtime)):
+            self._reset()
+            self.file_id = file_id
+
+        if stat.st_size > self.offset:
+            self._read_tail()
+        else:
+            self.mtime = stat.st_mtime_ns
+
+    def _read_tail(self):
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read()
+            self.mtime = os.fstat(file.fileno()).st_mtime_ns
+
+        # Разбираем только завершенные строки: последняя может дописываться прямо сейчас
+        end = data.rfind(b'\n')
+        if end < 0:
+            return
+        chunk = data[:end + 1]
+
+        text = chunk.decode('utf-8-sig' if self.offset == 0 else 'utf-8')
+        rows = csv.reader(io.StringIO(text, newline=''))
+        if self.offset == 0:
+            first = next(rows, None)
+            if first is not None and first != self.header and len(first) >= len(self.header):
+                self.records.append(self.parse_row(first))
+
+        for row in rows:
+            if len(row) >= len(self.header):
+                self.records.append(self.parse_row(row))
+
+        self.offset += len(chunk)
@@ -0,0 +1,109 @@
+"""Нагрузочная проверка отправки в Google Таблицы через GoogleSheetsManager.
+
+Несколько потоков отправляют синтетические продажи (по одной строке или
+пакетами) и замеряют время каждого запроса. Без --url запускается
+локальная замена Web App (sheets_standin.py) с заданными задержкой и сбоями.
+В конце выводятся пропускная способность, p50/p95/p99 и число ошибок.
+
+Запуск: python loadtest.py [--url URL] [--rows 2000] [--concurrency 4] [--batch 50]
+        [--read-timeout 10] [--latency 0.2] [--error-rate 0.05] [--rate-limit 20] ...
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmark import generate_rows
+from metrics import Metrics
+from sheets_standin import add_fault_arguments, sheets_from_args, start_server
+from storage import SALES
+
+
+def run_load(url, rows, concurrency=4, batch=50, connect_timeout=5, read_timeout=10):
+    """Отправляет rows строк в concurrency потоков; возвращает итоги"""
+    from sales_app import CATEGORIES, GoogleSheetsManager, SalesApp
+    from sync import SHEETS_TYPES
+
+    payloads = [(SHEETS_TYPES[SALES], SalesApp.sheets_payload(SALES, row))
+                for row in generate_rows(SALES, rows, CATEGORIES)]
+    size = max(batch, 1)
+    chunks = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+    timings = Metrics(enabled=True, window=len(chunks) * size)
+    counters = {'sent': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def worker():
+        # У каждого потока своя сессия, как у отдельного устройства
+        manager = GoogleSheetsManager(url, connect_timeout, read_timeout, pool_size=1)
+        while True:
+            with lock:
+                if not chunks:
+                    return
+                chunk = chunks.pop()
+            started = time.perf_counter()
+            if batch:
+                results = manager.save_batch(chunk)
+            else:
+                results = [manager.save_to_sheets(data_type, data) for data_type, data in chunk]
+            failed = sum(1 for success, _ in results if not success)
+            timings.record('request', time.perf_counter() - started, failed > 0)
+            with lock:
+                counters['sent'] += len(results) - failed
+                counters['failed'] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stage = timings.snapshot().get('request', {})
+    return {
+        'rows': rows,
+        'sent': counters['sent'],
+        'failed': counters['failed'],
+        'seconds': elapsed,
+        'rows_per_s': counters['sent'] / elapsed if elapsed else 0.0,
+        'requests': stage.get('count', 0),
+        'failed_requests': stage.get('errors', 0),
+        'p50_ms': stage.get('p50_ms', 0.0),
+        'p95_ms': stage.get('p95_ms', 0.0),
+        'p99_ms': stage.get('p99_ms', 0.0),
+        'max_ms': stage.get('max_ms', 0.0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка отправки в Google Таблицы")
+    parser.add_argument('--url', help="адрес Web App (по умолчанию — локальная замена)")
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=50, help="строк в запросе (0 — по одной через save_to_sheets)")
+    parser.add_argument('--connect-timeout', type=float, default=5)
+    parser.add_argument('--read-timeout', type=float, default=10)
+    parser.add_argument('--output', help="файл для итогов в JSON")
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    url = args.url
+    if url is None:
+        _, url = start_server(sheets_from_args(args))
+        print(f"Локальная замена Web App: {url}")
+
+    result = run_load(url, args.rows, args.concurrency, args.batch, args.connect_timeout, args.read_timeout)
+    print(f"Отправлено строк: {result['sent']} из {result['rows']} за {result['seconds']:.1f} с "
+          f"({result['rows_per_s']:.0f} строк/с), ошибок: {result['failed']}")
+    print(f"Запросов: {result['requests']}, с ошибками: {result['failed_requests']}; "
+          f"p50 {result['p50_ms']:.0f} мс, p95 {result['p95_ms']:.0f} мс, "
+          f"p99 {result['p99_ms']:.0f} мс, max {result['max_ms']:.0f} мс")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
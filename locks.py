@@ -0,0 +1,21 @@
+"""Блокировки файлов между процессами: кто из экземпляров (приложение, служба, импорт) владеет файлом."""
+import os
+
+
+def lock_file(path):
+    """Исключительная блокировка файла path без ожидания: дескриптор или None, если файл занят.
+
+    Блокировку снимает ОС при закрытии дескриптора или завершении процесса, в том числе аварийном.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
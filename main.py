@@ -1,219 +1,27 @@
 import flet as ft
-import csv
 import os
-import requests
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from metrics import metrics
+from outbox import SyncOutbox
+from records import format_number
+from reports import ReportEngine
+# Приложение без интерфейса (его же используют служба, импорт и замеры); имена доступны и из main
+from sales_app import CATEGORIES, DEFAULT_WEB_APP_URL, WEB_APP_URL, GoogleSheetsManager, SalesApp
+from search import SearchIndex, SuggestionIndex
+from storage import DEFAULT_STORAGE, PODZAKAZ, SALES, open_storage, row_to_record
+from sync import SyncEngine, track_outbox
 
-class GoogleSheetsManager:
-    def __init__(self, web_app_url):
-        self.web_app_url = web_app_url
-    
-    def save_to_sheets(self, data_type, data):
-        """Отправляет данные в Google Sheets через Web App"""
-        payload = {
-            'type': data_type,
-            **data
-        }
-        
-        try:
-            response = requests.post(self.web_app_url, json=payload)
-            result = response.json()
-            return result['success'], result['message']
-        except Exception as e:
-            return False, f"❌ Ошибка соединения: {str(e)}"
-
-class SalesApp:
-    def __init__(self, sheets_manager=None):
-        self.csv_file = 'sales_data.csv'
-        self.podzakaz_file = 'podzakaz_data.csv'
-        self.categories = ["SET", "Т.люда", "Аня", "Resale", "Подзаказ"]
-        self.sheets_manager = sheets_manager
-        self.create_csv_if_not_exists()
-
-    def create_csv_if_not_exists(self):
-        """Создает файлы для хранения данных, если их нет"""
-        # Основные продажи
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Категория', 'Курьер', 'Сумма курьеру'])
-        
-        # Подзаказы
-        if not os.path.exists(self.podzakaz_file):
-            with open(self.podzakaz_file, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Сколько заплатили', 'Сколько осталось заплатить', 'Связь с клиентом'])
-
-    def save_sale(self, product_name, color, size, price, category, courier_name, courier_amount):
-        """Сохраняет новую продажу в файл и Google Sheets (ТАБЛИЦА ОБЫЧНЫХ ЗАКАЗОВ)"""
-        try:
-            date_to_save = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Сохраняем в локальный CSV
-            data = [
-                date_to_save,
-                product_name,
-                color,
-                size,
-                price,
-                category,
-                courier_name,
-                courier_amount
-            ]
-            
-            with open(self.csv_file, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(data)
-            
-            # Сохраняем в Google Sheets (ТАБЛИЦА ОБЫЧНЫХ ЗАКАЗОВ)
-            if self.sheets_manager:
-                sheets_success, sheets_message = self.sheets_manager.save_to_sheets('order', {
-                    'category': category,
-                    'date': date_to_save,
-                    'product': product_name,
-                    'color': color,
-                    'size': size,
-                    'price': price,
-                    'courier': courier_name or "",
-                    'courier_amount': courier_amount or ""
-                })
-                
-                if sheets_success:
-                    return True, "✅ Данные успешно сохранены в таблицу обычных заказов!"
-                else:
-                    return False, f"❌ Ошибка Google Таблиц: {sheets_message}"
-            
-            return True, "✅ Данные успешно сохранены локально!"
-            
-        except Exception as e:
-            return False, f"❌ Ошибка: {str(e)}"
+# Сколько записей истории показывать за один раз
+HISTORY_PAGE_SIZE = 30
 
-    def save_podzakaz(self, product_name, color, size, price, paid_amount, remaining_amount, client_link):
-        """Сохраняет подзаказ в отдельный файл и Google Sheets (ТАБЛИЦА ПОДЗАКАЗОВ)"""
-        try:
-            date_to_save = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Сохраняем в локальный CSV
-            data = [
-                date_to_save,
-                product_name,
-                color,
-                size,
-                price,
-                paid_amount,
-                remaining_amount,
-                client_link
-            ]
-            
-            with open(self.podzakaz_file, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(data)
-            
-            # Сохраняем в Google Sheets (ОТДЕЛЬНАЯ ТАБЛИЦА ПОДЗАКАЗОВ)
-            if self.sheets_manager:
-                sheets_success, sheets_message = self.sheets_manager.save_to_sheets('podzakaz', {
-                    'date': date_to_save,
-                    'product': product_name,
-                    'color': color,
-                    'size': size,
-                    'price': price,
-                    'courier': "",  # Для подзаказов можно оставить пустым
-                    'courier_amount': "",  # Для подзаказов можно оставить пустым
-                    'paid': paid_amount,
-                    'remaining': remaining_amount or "0",
-                    'client_link': client_link or ""
-                })
-                
-                if sheets_success:
-                    return True, "✅ Подзаказ успешно сохранен в таблицу подзаказов!"
-                else:
-                    return False, f"❌ Ошибка Google Таблиц: {sheets_message}"
-            
-            return True, "✅ Подзаказ успешно сохранен локально!"
-            
-        except Exception as e:
-            return False, f"❌ Ошибка: {str(e)}"
+# Бюджет запуска: за сколько секунд от вызова main() форма должна появиться на экране
+STARTUP_BUDGET = float(os.environ.get('SALES_STARTUP_BUDGET', '0.5'))
 
-    def get_sales_history(self):
-        """Загружает всю историю продаж из файла"""
-        try:
-            if not os.path.exists(self.csv_file):
-                return []
-            
-            with open(self.csv_file, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                rows = list(reader)
-                
-                if rows and rows[0] == ['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Категория', 'Курьер', 'Сумма курьеру']:
-                    rows = rows[1:]
-                
-                history = []
-                for row in rows:
-                    if len(row) >= 8:
-                        history.append({
-                            'Дата': row[0],
-                            'Товар': row[1],
-                            'Цвет': row[2],
-                            'Размер': row[3],
-                            'Цена': row[4],
-                            'Категория': row[5],
-                            'Курьер': row[6],
-                            'Сумма курьеру': row[7]
-                        })
-                
-                return history
-        except Exception as e:
-            print(f"Ошибка загрузки истории: {e}")
-            return []
-
-    def get_podzakaz_history(self):
-        """Загружает историю подзаказов"""
-        try:
-            if not os.path.exists(self.podzakaz_file):
-                return []
-            
-            with open(self.podzakaz_file, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                rows = list(reader)
-                
-                if rows and rows[0] == ['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Сколько заплатили', 'Сколько осталось заплатить', 'Связь с клиентом']:
-                    rows = rows[1:]
-                
-                history = []
-                for row in rows:
-                    if len(row) >= 8:
-                        history.append({
-                            'Дата': row[0],
-                            'Товар': row[1],
-                            'Цвет': row[2],
-                            'Размер': row[3],
-                            'Цена': row[4],
-                            'Сколько заплатили': row[5],
-                            'Сколько осталось заплатить': row[6],
-                            'Связь с клиентом': row[7]
-                        })
-                
-                return history
-        except Exception as e:
-            print(f"Ошибка загрузки подзаказов: {e}")
-            return []
+# Снимок истории обновляется при запуске и сверке, если после прошлого снимка набралось столько записей
+SNAPSHOT_MIN_TAIL = 5000
 
-    def clear_history(self, file_path):
-        """Очищает историю"""
-        try:
-            if file_path == self.csv_file:
-                with open(self.csv_file, 'w', newline='', encoding='utf-8') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Категория', 'Курьер', 'Сумма курьеру'])
-            else:
-                with open(self.podzakaz_file, 'w', newline='', encoding='utf-8') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Сколько заплатили', 'Сколько осталось заплатить', 'Связь с клиентом'])
-            return True
-        except Exception as e:
-            print(f"Ошибка очистки: {e}")
-            return False
 
 def main(page: ft.Page):
     page.title = "Менеджер продаж"
@@ -223,14 +31,130 @@ def main(page: ft.Page):
     page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
     page.vertical_alignment = ft.MainAxisAlignment.START
 
-    # Инициализация менеджера Google Таблиц
-    # ЗАМЕНИ ЭТОТ URL НА СВОЙ URL ИЗ GOOGLE APPS SCRIPT
-    WEB_APP_URL = "https://script.google.com/macros/s/AKfycbz6pbOosDMOZGa-YELYdZSnyMcKnQjI8VN36ycROMV9EBtvyI7DqNMaBt7l_3uR4Y3K/exec"
-    sheets_manager = GoogleSheetsManager(WEB_APP_URL)
-    app = SalesApp(sheets_manager)
+    started = time.perf_counter()
+    service_url = os.environ.get('SALES_SERVICE_URL')
+    # Приложение, журнал отправки и индексы создаются в потоке сохранения после первого кадра
+    # (start_services), чтобы форма открывалась без ожидания диска и сети
+    app = None
+    outbox = None
+    run_sync = None
+    reports = None
+    search_index = None
+    suggestions = None
+    # Запуск служб (Future): пока он не закончился, обращения к истории ждут его
+    services = None
+    
+    # Один поток сохранения: записи сохраняются в порядке ввода, не блокируя форму
+    save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+    
+    def start_services():
+        """Создает хранилище, приложение и индексы и прогревает историю (в потоке сохранения)"""
+        nonlocal app, outbox, run_sync, reports, search_index, suggestions
+        if app is not None and not service_url:
+            # Повторный запуск после ошибки: хранилище прошлой попытки больше не нужно
+            app.storage.close()
+            app = None
+        if service_url:
+            # Касса работает через общую службу (service.py): запись, Google Таблицы и сверка — на ее стороне
+            from service import RemoteSalesApp
+            app = RemoteSalesApp(service_url)
+            run_sync = app.sync
+        else:
+            if outbox is None:
+                # Инициализация менеджера Google Таблиц (сетевой стек загружается при первом запросе)
+                sheets_manager = GoogleSheetsManager(WEB_APP_URL)
+                # Журнал отправки: продажа сохраняется локально сразу, а в таблицу уходит в фоне.
+                # При повторном запуске служб он остается прежним — его журнал на диске занят им же
+                outbox = SyncOutbox(sheets_manager)
+                outbox.add_listener(on_sync_result)
+                # Доставленные журналом строки сверка не отправляет повторно
+                track_outbox(outbox)
+                outbox.start()
+            sheets_manager = outbox.sheets_manager
+            # Хранилище: журнал с контрольными суммами 'log' (по умолчанию), 'csv', 'partitioned' или 'sqlite' —
+            # история из CSV переносится в журнал или базу при первом запуске
+            storage = open_storage(os.environ.get('SALES_STORAGE', DEFAULT_STORAGE))
+            app = SalesApp(sheets_manager, outbox=outbox, storage=storage)
+            # Завершенные периоды ('partitioned') уходят в архив: дальше чтение и запись касаются только текущего
+            app.archive_closed_periods()
+            # Сверка с Google Таблицами идет в том же потоке, что и сохранения
+            run_sync = SyncEngine(app, sheets_manager, outbox=outbox).sync
+        
+        # Отчеты строятся по колоночной копии истории, завершенные периоды кэшируются
+        reports = ReportEngine(app)
+        # Поиск по истории через обратный индекс, который дополняется новыми записями
+        search_index = SearchIndex(app)
+        # Подсказки для полей формы: частые значения из истории, дополняются после каждого сохранения
+        suggestions = SuggestionIndex(app)
+        
+        # Прогрев: история, итоги и подсказки готовы до первого перехода в историю
+        suggestions.refresh()
+        for kind in (SALES, PODZAKAZ):
+            app.get_statistics(kind)
+        # Замеры запуска записываем всегда: они бывают раз за запуск и нужны для проверки бюджета
+        metrics.record('startup.ready', time.perf_counter() - started)
+        # История, разобранная сверх снимка, сохраняется в новый снимок — следующий запуск ее не разбирает
+        save_snapshot(SNAPSHOT_MIN_TAIL)
+    
+    def save_snapshot(min_tail=0):
+        """Записывает двоичный снимок истории для быстрого запуска (в потоке сохранения)"""
+        if app is None or service_url:
+            return
+        try:
+            app.storage.save_snapshot(min_tail)
+        except OSError as e:
+            print(f"Не удалось сохранить снимок истории: {e}")
+    
+    def on_lifecycle_change(e):
+        # Окно свернуто или закрывается — сохраняем снимок, пока приложение еще работает
+        if e.state in (ft.AppLifecycleState.HIDE, ft.AppLifecycleState.PAUSE, ft.AppLifecycleState.DETACH):
+            save_executor.submit(save_snapshot)
     
-    # Переменная для диалога очистки
+    page.on_app_lifecycle_state_change = on_lifecycle_change
+    
+    def launch_services():
+        """Ставит запуск служб в поток сохранения первым; сохранения встают в очередь за ним"""
+        nonlocal services
+        services = save_executor.submit(start_services)
+        services.add_done_callback(on_services_done)
+
+    def on_services_done(future):
+        """Показывает ошибку запуска служб с кнопкой повтора (вызывается из потока сохранения)"""
+        error = future.exception()
+        if error is None:
+            startup_row.visible = False
+        else:
+            print(f"Ошибка запуска: {error}")
+            startup_error.value = f"❌ Не удалось открыть историю: {error}"
+            startup_row.visible = True
+        page.update()
+
+    def retry_services(e=None):
+        """Повторяет запуск служб (например, после восстановления файла истории или связи со службой)"""
+        startup_error.value = "⏳ Повторный запуск..."
+        page.update()
+        launch_services()
+        sync_click()
+
+    def wait_services():
+        """Ждет запуска служб (нужно обработчикам, которые обращаются к истории из потока интерфейса).
+
+        Если запуск не удался, поднимает его исключение — до повторного запуска (retry_services).
+        """
+        services.result()
+
+    def services_ready():
+        """Ждет запуска служб; False, если он не удался (ошибка и кнопка повтора — на главной странице)"""
+        try:
+            wait_services()
+        except Exception:
+            show_main_page()
+            return False
+        return True
+    
+    # Переменные для диалога очистки
     clear_dialog = None
+    clear_target = None
     
     # Поля ввода данных
     product_name = ft.TextField(label="Название товара", hint_text="Введите название товара")
@@ -246,11 +170,39 @@ def main(page: ft.Page):
     category = ft.Dropdown(
         label="Категория товара",
         hint_text="Выберите категорию",
-        options=[ft.dropdown.Option(cat) for cat in app.categories],
+        options=[ft.dropdown.Option(cat) for cat in CATEGORIES],
         on_change=lambda e: on_category_change()
     )
     
     courier_name = ft.TextField(label="Имя курьера (необязательно)", hint_text="Введите имя курьера")
+    
+    def build_suggestions(field, name):
+        """Строка подсказок под полем: частые значения, начинающиеся с введенного текста"""
+        row = ft.Row(wrap=True, spacing=5, visible=False)
+        
+        def pick(value):
+            field.value = value
+            row.visible = False
+            page.update()
+        
+        def on_change(e):
+            text = field.value or ""
+            if suggestions is None or not text.strip():
+                values = []
+            else:
+                values = [value for value in suggestions.lookup(name, text) if value != text]
+            row.controls = [ft.TextButton(value, on_click=lambda e, value=value: pick(value)) for value in values]
+            row.visible = bool(values)
+            page.update()
+        
+        field.on_change = on_change
+        return row
+    
+    product_suggestions = build_suggestions(product_name, 'product')
+    color_suggestions = build_suggestions(color, 'color')
+    size_suggestions = build_suggestions(size, 'size')
+    courier_suggestions = build_suggestions(courier_name, 'courier')
+    suggestion_rows = [product_suggestions, color_suggestions, size_suggestions, courier_suggestions]
     courier_amount = ft.TextField(
         label="Сумма курьеру (необязательно)", 
         hint_text="Введите сумму курьеру",
@@ -274,12 +226,22 @@ def main(page: ft.Page):
     )
     client_link = ft.TextField(label="Связь с клиентом", hint_text="Ссылка или номер", visible=False)
     
+    # Поля формы: при ошибке фонового сохранения введенная запись возвращается в форму
+    form_fields = [product_name, color, size, price, category, courier_name, courier_amount,
+                   paid_amount, remaining_amount, client_link]
+    # Записи, которые не сохранились, пока в форме набиралась следующая, — вернутся, когда форма освободится
+    unsaved_forms = []
+    
     # Поле для сообщений
     result_text = ft.Text("", size=16)
     
+    # Ошибка запуска служб (поврежденный файл истории, недоступная служба) и повтор запуска
+    startup_error = ft.Text("", color="red", size=14, expand=True)
+    startup_row = ft.Row([startup_error, ft.TextButton("Повторить", on_click=retry_services)], visible=False)
+    
     # Индикатор подключения к Google Таблицам
     connection_status = ft.Text("✅ Подключено к Google Таблицам", color="green", size=12, 
-                               visible=bool(WEB_APP_URL and "https://script.google.com/macros/s/AKfycbz6pbOosDMOZGa-YELYdZSnyMcKnQjI8VN36ycROMV9EBtvyI7DqNMaBt7l_3uR4Y3K/exec" not in WEB_APP_URL))
+                               visible=bool(WEB_APP_URL and DEFAULT_WEB_APP_URL not in WEB_APP_URL))
     
     def calculate_remaining():
         """Автоматически рассчитывает остаток оплаты"""
@@ -306,6 +268,8 @@ def main(page: ft.Page):
         # Для подзаказов скрываем поля курьера (они есть в основном объекте)
         courier_name.visible = not is_podzakaz
         courier_amount.visible = not is_podzakaz
+        if is_podzakaz:
+            courier_suggestions.visible = False
         
         page.update()
 
@@ -321,19 +285,13 @@ def main(page: ft.Page):
             show_message("⚠ Введите цену", "orange")
         elif not category.value:
             show_message("⚠ Выберите категорию", "orange")
+        elif category.value == "Подзаказ" and not paid_amount.value:
+            show_message("⚠ Введите сумму оплаты", "orange")
         else:
-            # Показываем индикатор загрузки
-            result_text.value = "⏳ Сохранение данных..."
-            result_text.color = "blue"
-            page.update()
-            
+            # app берется уже в потоке сохранения: запуск служб стоит в той же очереди первым
             if category.value == "Подзаказ":
                 # Сохраняем подзаказ в ТАБЛИЦУ ПОДЗАКАЗОВ
-                if not paid_amount.value:
-                    show_message("⚠ Введите сумму оплаты", "orange")
-                    return
-                
-                success, message = app.save_podzakaz(
+                values = (
                     product_name.value,
                     color.value,
                     size.value,
@@ -342,9 +300,11 @@ def main(page: ft.Page):
                     remaining_amount.value or "0",
                     client_link.value or ""
                 )
+                save = lambda: app.save_podzakaz(*values)
+                kind = PODZAKAZ
             else:
                 # Сохраняем обычный заказ в ТАБЛИЦУ ОБЫЧНЫХ ЗАКАЗОВ
-                success, message = app.save_sale(
+                values = (
                     product_name.value,
                     color.value,
                     size.value,
@@ -353,17 +313,122 @@ def main(page: ft.Page):
                     courier_name.value or "",
                     courier_amount.value or ""
                 )
+                save = lambda: app.save_sale(*values)
+                kind = SALES
             
-            show_message(message, "green" if success else "red")
-            
-            if success:
-                clear_input_fields()
+            # Сохранение идет в фоне, форма сразу готова к следующей записи;
+            # введенные значения хранятся, пока сохранение не закончится
+            product = product_name.value
+            form = {field: field.value for field in form_fields}
+            # Запись для подсказок: после сохранения она попадет в них без чтения истории
+            record = row_to_record(kind, ['', *values])
+            started = time.perf_counter()
+            save_executor.submit(run_save, save).add_done_callback(
+                lambda future: on_save_done(product, form, kind, record, started, future))
+            result_text.value = f"⏳ Сохранение: {product}..."
+            result_text.color = "blue"
+            clear_input_fields()
+            if unsaved_forms:
+                restore_form(unsaved_forms.pop(0))
+
+    def run_save(save):
+        """Сохранение в потоке сохранения; если службы не запустились — их ошибка вместо сохранения"""
+        wait_services()
+        return save()
+
+    def restore_form(form):
+        """Возвращает в форму запись, которую не удалось сохранить"""
+        for field, value in form.items():
+            field.value = value
+        on_category_change()
+
+    def on_save_done(product, form, kind, record, started, future):
+        """Сообщает итог фонового сохранения (вызывается из потока сохранения)"""
+        try:
+            success, message = future.result()
+        except Exception as ex:
+            success, message = False, f"❌ Ошибка: {str(ex)}"
+        if metrics.enabled:
+            # Полное время сохранения: от нажатия кнопки до готового результата
+            metrics.record('save.total', time.perf_counter() - started, not success)
+        
+        if success:
+            if suggestions is not None:
+                suggestions.add(kind, record)
+            # ⚠ — запись сохранена, но в таблицу уйдет позже
+            show_message(f"{message} ({product})", "orange" if message.startswith("⚠") else "green")
+        elif not any(field.value for field in form_fields):
+            restore_form(form)
+            show_message(f"{message} ({product}) — запись возвращена в форму, сохраните ее еще раз", "red")
+        else:
+            # В форме уже набирается следующая запись — не затираем ее
+            unsaved_forms.append(form)
+            show_message(f"{message} ({product}) — запись вернется в форму после текущей", "red")
+
+    def on_sync_result(outcomes):
+        """Показывает итог отправки журнала в Google Таблицы (вызывается из потока отправки)"""
+        failed = [entry for entry, success, _ in outcomes if not success]
+        dead = [entry for entry in failed if entry.get('dead')]
+        pending = outbox.pending_count()
+        
+        if dead:
+            connection_status.value = (f"❌ Google Таблицы отклонили строк: {outbox.dead_count}, "
+                                       f"они сохранены в {outbox.dead_file}")
+            connection_status.color = "red"
+        elif failed:
+            connection_status.value = f"⚠ Нет связи с Google Таблицами, ожидают отправки: {pending}"
+            connection_status.color = "orange"
+        elif pending:
+            connection_status.value = f"⏳ Отправка в Google Таблицы, осталось: {pending}"
+            connection_status.color = "blue"
+        else:
+            connection_status.value = "✅ Все записи отправлены в Google Таблицы"
+            connection_status.color = "green"
+        connection_status.visible = True
+        page.update()
+
+    def sync_click(e=None):
+        """Запускает сверку с Google Таблицами в потоке сохранения"""
+        connection_status.value = "⏳ Сверка с Google Таблицами..."
+        connection_status.color = "blue"
+        connection_status.visible = True
+        page.update()
+        save_executor.submit(run_sync_now).add_done_callback(on_sync_done)
+
+    def run_sync_now():
+        """Сверка в потоке сохранения; ошибка запуска служб показывается как ошибка сверки"""
+        wait_services()
+        result = run_sync()
+        # Сверка бывает раз в несколько минут — заодно обновляем снимок, если история заметно выросла
+        save_snapshot(SNAPSHOT_MIN_TAIL)
+        return result
+
+    def on_sync_done(future):
+        """Показывает итог сверки (вызывается из потока сохранения)"""
+        try:
+            result = future.result()
+        except Exception as ex:
+            result = {'errors': [str(ex)]}
+        # Дописываем в подсказки строки, полученные из таблиц
+        if suggestions:
+            suggestions.refresh()
+        
+        if result['errors']:
+            connection_status.value = f"⚠ Сверка не завершена: {result['errors'][0]}"
+            connection_status.color = "orange"
+        else:
+            connection_status.value = (f"✅ Сверено: отправлено {result['pushed']}, получено {result['pulled']}"
+                                       + (f", доплат {result['payments']}" if result['payments'] else ""))
+            connection_status.color = "green"
+        connection_status.visible = True
+        page.update()
 
     def show_message(message, color):
         """Показывает сообщение пользователю"""
         result_text.value = message
         result_text.color = color
-        page.update()
+        with metrics.timer('ui.update'):
+            page.update()
 
     def clear_input_fields():
         """Очищает все поля ввода"""
@@ -377,6 +442,8 @@ def main(page: ft.Page):
         paid_amount.value = ""
         remaining_amount.value = ""
         client_link.value = ""
+        for row in suggestion_rows:
+            row.visible = False
         
         # Сбрасываем видимость полей подзаказа
         paid_amount.visible = False
@@ -387,23 +454,27 @@ def main(page: ft.Page):
         
         page.update()
 
-    def show_clear_confirmation(file_to_clear, title, is_podzakaz):
+    def show_clear_confirmation(history_view):
         """Показывает диалог подтверждения очистки"""
-        nonlocal clear_dialog
+        nonlocal clear_dialog, clear_target
+        # Диалог создается один раз, поэтому очищаемую страницу запоминаем отдельно
+        clear_target = history_view
         
         def confirm_clear(e):
             """Обработчик кнопки Очистить"""
-            if app.clear_history(file_to_clear):
+            if app.clear_history(clear_target.file_path):
                 # Закрываем диалог СРАЗУ
                 clear_dialog.open = False
                 page.update()
                 
                 # Показываем уведомление об успехе
-                page.snack_bar = ft.SnackBar(content=ft.Text("✅ История успешно очищена"))
+                page.snack_bar = ft.SnackBar(content=ft.Text("✅ История очищена и перенесена в архив"))
                 page.snack_bar.open = True
                 
                 # Обновляем страницу истории (теперь она пустая)
-                show_history_page([], title, file_to_clear, is_podzakaz)
+                clear_target.refresh()
+                save_executor.submit(suggestions.refresh)
+                page.update()
             else:
                 # Показываем уведомление об ошибке
                 page.snack_bar = ft.SnackBar(content=ft.Text("❌ Ошибка при очистке"))
@@ -419,7 +490,7 @@ def main(page: ft.Page):
         if clear_dialog is None:
             clear_dialog = ft.AlertDialog(
                 title=ft.Text("Подтверждение очистки"),
-                content=ft.Text("Вы уверены, что хотите очистить всю историю продаж?\nЭто действие невозможно отменить."),
+                content=ft.Text("Вы уверены, что хотите очистить всю историю продаж?\nЗаписи будут перенесены в архив."),
                 actions=[
                     ft.TextButton("Отмена", on_click=cancel_clear),
                     ft.TextButton("Очистить", on_click=confirm_clear),
@@ -431,173 +502,529 @@ def main(page: ft.Page):
         clear_dialog.open = True
         page.update()
 
-    def show_history_page(history, title, file_path, is_podzakaz=False):
-        """Показывает страницу с историей"""
-        history_content = []
-        
-        if not history:
-            history_content = [
-                ft.Container(
-                    content=ft.Column([
-                        ft.Text("📋", size=64),
-                        ft.Text("Нет записей в истории", size=20, color="grey"),
-                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                    padding=50,
-                    alignment=ft.alignment.center
+    def show_payment_dialog(record):
+        """Диалог доплаты по подзаказу"""
+        amount_field = ft.TextField(label="Сумма оплаты", keyboard_type=ft.KeyboardType.NUMBER, autofocus=True)
+        
+        def confirm_payment(e):
+            success, message = app.add_payment(record, amount_field.value or "")
+            if not success:
+                # Неверная сумма — оставляем диалог открытым
+                amount_field.error_text = message
+                page.update()
+                return
+            payment_dialog.open = False
+            page.snack_bar = ft.SnackBar(content=ft.Text(message))
+            page.snack_bar.open = True
+            # Перестраиваем только карточку этого подзаказа и итоги оплат
+            history_views[PODZAKAZ].replace_card(record)
+            page.update()
+        
+        def cancel_payment(e):
+            payment_dialog.open = False
+            page.update()
+        
+        payment_dialog = ft.AlertDialog(
+            title=ft.Text(f"Оплата: {record.product}"),
+            content=amount_field,
+            actions=[
+                ft.TextButton("Отмена", on_click=cancel_payment),
+                ft.TextButton("Внести", on_click=confirm_payment),
+            ],
+        )
+        page.overlay.append(payment_dialog)
+        payment_dialog.open = True
+        page.update()
+
+    def build_stat_card(label, value, bgcolor):
+        """Создает карточку статистики"""
+        return ft.Container(
+            content=ft.Column([
+                ft.Text(label, size=14, color="grey"),
+                ft.Text(value, size=24, weight=ft.FontWeight.BOLD),
+            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+            padding=15,
+            bgcolor=bgcolor,
+            border_radius=10,
+            expand=1
+        )
+
+    def build_record_card(record, is_podzakaz, balance=None):
+        """Создает карточку одной записи истории (balance — уже известный баланс подзаказа)"""
+        date = record.date[:16]
+        product = record.product
+        color_val = record.color
+        size_val = record.size
+        price_val = format_number(record.price)
+        
+        # Создаем карточку для записи
+        record_card_content = [
+            # Первая строка: товар и цена
+            ft.Row([
+                ft.Text(product, weight=ft.FontWeight.BOLD, expand=1, size=16),
+                ft.Text(f"{price_val} ₸", color="green", weight=ft.FontWeight.BOLD, size=16),
+            ]),
+            # Вторая строка: цвет и размер
+            ft.Text(f"Цвет: {color_val} | Размер: {size_val}"),
+        ]
+        
+        if is_podzakaz:
+            # Для подзаказов — оплата и остаток с учетом доплат
+            if balance is None:
+                balance = app.order_balance(record)
+            paid = format_number(balance.paid if balance else record.paid)
+            remaining = format_number(balance.remaining if balance else record.remaining)
+            client = record.client_link
+        
+            record_card_content.extend([
+                ft.Text(f"Оплачено: {paid} ₸"),
+                ft.Text(f"Осталось: {remaining} ₸"),
+                ft.Text(f"Клиент: {client}") if client else ft.Text("Клиент: не указан", color="grey"),
+            ])
+            if balance and balance.remaining > 0:
+                record_card_content.append(
+                    ft.TextButton("Внести оплату", on_click=lambda e: show_payment_dialog(record))
                 )
-            ]
         else:
-            total_sales = len(history)
-            total_revenue = sum(float(record.get('Цена', 0)) for record in history)
+            # Для обычных заказов
+            category_val = record.category
+            courier_val = record.courier
+            courier_amount_val = format_number(record.courier_amount)
+            
+            record_card_content.extend([
+                ft.Text(f"Категория: {category_val}"),
+                *([ft.Text(f"Курьер: {courier_val}")] if courier_val else []),
+                *([ft.Text(f"Сумма курьеру: {courier_amount_val} ₸")] if courier_amount_val else []),
+            ])
+        
+        record_card_content.append(ft.Text(f"Дата: {date}", size=12, color="grey"))
+        
+        record_card = ft.Card(
+            content=ft.Container(
+                ft.Column(record_card_content, spacing=5),
+                padding=15,
+            ),
+            margin=ft.margin.only(bottom=10),
+        )
+        
+        return record_card
+
+    class HistoryView:
+        """Страница истории одного вида: строится один раз и при каждом показе обновляется по разнице.
+
+        Карточки записей кэшируются по id записи. Если с прошлого показа
+        история только дописалась, строятся карточки одних новых записей и
+        вставляются в начало списка, а в карточках статистики меняются только
+        значения. Заново список строится лишь после очистки или если история
+        изменилась не дописыванием.
+        """
+
+        def __init__(self, kind, title, file_path):
+            self.kind = kind
+            self.is_podzakaz = kind == PODZAKAZ
+            self.title = title
+            self.file_path = file_path
+            self.history = []
+            self.last_id = None
+            # Записи, которые листает список (вся история или результаты поиска), и сколько уже показано
+            self.records = []
+            self.shown = 0
+            self.filtered = False
+            # id записи -> карточка; rendered — id карточек, которые сейчас в списке
+            self.cards = {}
+            self.rendered = set()
+            
+            self.stat_cards = [
+                build_stat_card("Всего продаж", "0", "#0d47a1"),
+                build_stat_card("Общая выручка", "0 ₸", "#1b5e20"),
+            ]
+            stat_rows = [ft.Row(self.stat_cards)]
+            if self.is_podzakaz:
+                payment_cards = [
+                    build_stat_card("Оплачено", "0 ₸", "#004d40"),
+                    build_stat_card("Осталось оплатить", "0 ₸", "#b71c1c"),
+                ]
+                self.stat_cards.extend(payment_cards)
+                stat_rows.append(ft.Row(payment_cards))
+            
+            self.search_field = ft.TextField(
+                label="Поиск",
+                hint_text="Клиент, курьер, товар, цвет, размер" if self.is_podzakaz else "Товар, цвет, размер, категория, курьер",
+                on_submit=self.apply_search,
+                expand=True
+            )
+            self.date_from_field = ft.TextField(label="С даты", hint_text="ГГГГ-ММ-ДД", on_submit=self.apply_search, expand=1)
+            self.date_to_field = ft.TextField(label="По дату", hint_text="ГГГГ-ММ-ДД", on_submit=self.apply_search, expand=1)
+            self.unpaid_checkbox = ft.Checkbox(label="Только с остатком к оплате", visible=self.is_podzakaz,
+                                               on_change=self.apply_search)
+            self.found_text = ft.Text("", color="grey")
+            
+            # Записи показываем страницами (новые сверху), следующая страница — по кнопке
+            self.records_column = ft.Column(spacing=0)
+            self.more_button = ft.TextButton("Показать еще", on_click=self.show_more, visible=False)
             
-            history_content = [
+            self.empty = ft.Container(
+                content=ft.Column([
+                    ft.Text("📋", size=64),
+                    ft.Text("Нет записей в истории", size=20, color="grey"),
+                ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                padding=50,
+                alignment=ft.alignment.center
+            )
+            self.content = ft.Column([
                 ft.Text(title, size=24, weight=ft.FontWeight.BOLD),
-                
-                # Карточки статистики
+                *stat_rows,
+                ft.Divider(),
+                ft.Row([self.search_field, ft.IconButton(icon=ft.Icons.SEARCH, on_click=self.apply_search)]),
+                ft.Row([self.date_from_field, self.date_to_field]),
+                self.unpaid_checkbox,
+                self.found_text,
+                self.records_column,
+                self.more_button,
+            ], visible=False)
+            # Кнопку очистки показываем только если есть история
+            self.clear_button = ft.OutlinedButton(
+                "Очистить историю",
+                on_click=lambda e: show_clear_confirmation(self),
+                style=ft.ButtonStyle(color="red"),
+                visible=False
+            )
+            self.view = ft.Column([
+                self.empty,
+                self.content,
                 ft.Row([
-                    ft.Container(
-                        content=ft.Column([
-                            ft.Text("Всего продаж", size=14, color="grey"),
-                            ft.Text(str(total_sales), size=24, weight=ft.FontWeight.BOLD),
-                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                        padding=15,
-                        bgcolor="#0d47a1",
-                        border_radius=10,
-                        expand=1
-                    ),
-                    ft.Container(
-                        content=ft.Column([
-                            ft.Text("Общая выручка", size=14, color="grey"),
-                            ft.Text(f"{total_revenue:,.0f} ₸", size=24, weight=ft.FontWeight.BOLD),
-                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                        padding=15,
-                        bgcolor="#1b5e20",
-                        border_radius=10,
-                        expand=1
+                    ft.ElevatedButton(
+                        "Назад к добавлению заказов",
+                        on_click=lambda e: show_main_page(),
+                        style=ft.ButtonStyle(padding=20)
                     ),
-                ]),
-                ft.Divider(),
-            ]
+                    self.clear_button,
+                ], alignment=ft.MainAxisAlignment.CENTER),
+            ], scroll=ft.ScrollMode.ADAPTIVE)
+
+        def card(self, record, balance=None):
+            """Карточка записи из кэша; строится только при первом показе записи"""
+            record_id = record.record_id()
+            if record_id in self.rendered:
+                # Одинаковые строки дают одинаковый id, а один элемент нельзя показать в списке дважды
+                return build_record_card(record, self.is_podzakaz, balance)
+            self.rendered.add(record_id)
+            card = self.cards.get(record_id)
+            if card is None:
+                card = self.cards[record_id] = build_record_card(record, self.is_podzakaz, balance)
+            return card
+
+        def build_cards(self, records):
+            """Карточки записей; балансы подзаказов без готовой карточки запрашиваются одним вызовом"""
+            if not self.is_podzakaz:
+                return [self.card(record) for record in records]
+            missing = [record for record in records if record.record_id() not in self.cards]
+            balances = {record.record_id(): balance
+                        for record, balance in zip(missing, app.order_balances(missing))}
+            return [self.card(record, balances.get(record.record_id())) for record in records]
+
+        def update_stats(self):
+            """Меняет только значения в карточках статистики"""
+            # Итоги берем из хранилища статистики, а не пересчитываем по всей истории
+            stats = app.get_statistics(self.kind)
+            values = [str(stats['count']), f"{stats['revenue']:,.0f} ₸"]
+            if self.is_podzakaz:
+                # Оплату и остаток берем из журнала доплат
+                total_paid, receivables = app.receivables()
+                values.extend([f"{total_paid:,.0f} ₸", f"{receivables:,.0f} ₸"])
+            for card, value in zip(self.stat_cards, values):
+                card.content.controls[1].value = value
+
+        def show_more(self, e=None):
+            """Добавляет в список следующую страницу записей"""
+            start = len(self.records) - 1 - self.shown
+            stop = max(-1, start - HISTORY_PAGE_SIZE)
+            self.records_column.controls.extend(self.build_cards([self.records[index] for index in range(start, stop, -1)]))
+            self.shown += start - stop
+            self.update_more_button()
+            if e is not None:
+                page.update()
+
+        def update_more_button(self):
+            remaining = len(self.records) - self.shown
+            self.more_button.text = f"Показать еще ({remaining})"
+            self.more_button.visible = remaining > 0
+
+        def render(self):
+            """Заново заполняет список первой страницей записей (карточки берутся из кэша)"""
+            self.records_column.controls.clear()
+            self.rendered.clear()
+            self.shown = 0
+            self.show_more()
+
+        def refresh(self):
+            """Сверяет страницу с текущей историей и меняет только то, что изменилось"""
+            history = app.get_sales_history() if self.kind == SALES else app.get_podzakaz_history()
+            known = len(self.history)
+            appended = len(history) >= known and (
+                not known or history[known - 1].record_id() == self.last_id)
+            self.history = history
+            self.last_id = history[-1].record_id() if history else None
             
-            # Показываем все записи (новые сверху)
-            for record in reversed(history):
-                date = record.get('Дата', '')[:16]
-                product = record.get('Товар', '')
-                color_val = record.get('Цвет', '')
-                size_val = record.get('Размер', '')
-                price_val = record.get('Цена', '')
-                category_val = record.get('Категория', '')
-                courier_val = record.get('Курьер', '')
-                courier_amount_val = record.get('Сумма курьеру', '')
-                
-                # Создаем карточку для записи
-                record_card_content = [
-                    # Первая строка: товар и цена
-                    ft.Row([
-                        ft.Text(product, weight=ft.FontWeight.BOLD, expand=1, size=16),
-                        ft.Text(f"{price_val} ₸", color="green", weight=ft.FontWeight.BOLD, size=16),
-                    ]),
-                    # Вторая строка: цвет и размер
-                    ft.Text(f"Цвет: {color_val} | Размер: {size_val}"),
-                ]
-                
-                if is_podzakaz:
-                    # Для подзаказов
-                    paid = record.get('Сколько заплатили', '')
-                    remaining = record.get('Сколько осталось заплатить', '')
-                    client = record.get('Связь с клиентом', '')
-                    
-                    record_card_content.extend([
-                        ft.Text(f"Оплачено: {paid} ₸"),
-                        ft.Text(f"Осталось: {remaining} ₸"),
-                        ft.Text(f"Клиент: {client}") if client else ft.Text("Клиент: не указан", color="grey"),
-                    ])
+            if not appended:
+                # Очистка или импорт задним числом: старые карточки больше не нужны
+                self.cards.clear()
+                self.reset_search()
+            if self.filtered:
+                if len(history) != known:
+                    # Новые записи могут попасть в результаты поиска — выполняем его заново
+                    self.apply_search()
+            elif not appended or not known or len(history) - known > HISTORY_PAGE_SIZE:
+                # Первый показ или много новых записей: строим первую страницу заново
+                self.records = history
+                self.render()
+            elif len(history) > known:
+                # Дописались новые записи: вставляем в начало только их карточки
+                new_cards = self.build_cards(history[known:][::-1])
+                self.records_column.controls[0:0] = new_cards
+                self.records = history
+                self.shown += len(new_cards)
+                self.update_more_button()
+            
+            self.update_stats()
+            self.empty.visible = not history
+            self.content.visible = bool(history)
+            self.clear_button.visible = bool(history)
+
+        def reset_search(self):
+            self.search_field.value = ""
+            self.date_from_field.value = ""
+            self.date_to_field.value = ""
+            self.unpaid_checkbox.value = False
+            self.found_text.value = ""
+            self.filtered = False
+
+        def replace_card(self, record):
+            """Перестраивает карточку одной записи (после доплаты) и итоги оплат"""
+            record_id = record.record_id()
+            old_card = self.cards.pop(record_id, None)
+            if old_card is not None and old_card in self.records_column.controls:
+                self.rendered.discard(record_id)
+                index = self.records_column.controls.index(old_card)
+                self.records_column.controls[index] = self.card(record)
+            self.update_stats()
+
+        def apply_search(self, e=None):
+            """Показывает только записи, найденные по индексу"""
+            try:
+                date_from = datetime.strptime(self.date_from_field.value, "%Y-%m-%d") if self.date_from_field.value else None
+                date_to = datetime.strptime(self.date_to_field.value, "%Y-%m-%d") if self.date_to_field.value else None
+            except ValueError:
+                self.found_text.value = "⚠ Введите дату в формате ГГГГ-ММ-ДД"
+                page.update()
+                return
+            
+            self.filtered = bool(self.search_field.value or date_from or date_to or self.unpaid_checkbox.value)
+            if self.filtered:
+                if self.search_field.value or date_from or date_to:
+                    results = search_index.search(self.kind, self.search_field.value or "", date_from, date_to,
+                                                  unpaid=self.unpaid_checkbox.value)
                 else:
-                    # Для обычных заказов
-                    record_card_content.extend([
-                        ft.Text(f"Категория: {category_val}"),
-                        *([ft.Text(f"Курьер: {courier_val}")] if courier_val else []),
-                        *([ft.Text(f"Сумма курьеру: {courier_amount_val} ₸")] if courier_amount_val else []),
-                    ])
-                
-                record_card_content.append(ft.Text(f"Дата: {date}", size=12, color="grey"))
-                
-                record_card = ft.Card(
-                    content=ft.Container(
-                        ft.Column(record_card_content, spacing=5),
-                        padding=15,
-                    ),
-                    margin=ft.margin.only(bottom=10),
-                )
-                
-                history_content.append(record_card)
+                    # Открытые подзаказы берем прямо из индекса остатков
+                    results = app.open_podzakaz()
+                # Результаты идут новыми первыми, а список листается с конца
+                self.records = results[::-1]
+                self.found_text.value = f"Найдено: {len(results)}"
+            else:
+                self.records = self.history
+                self.found_text.value = ""
+            
+            self.render()
+            if e is not None:
+                page.update()
+
+    history_views = {}
+
+    def show_history_view(kind):
+        """Показывает страницу истории kind, создавая ее при первом переходе"""
+        with metrics.timer('ui.history'):
+            if not services_ready():
+                return
+            view = history_views.get(kind)
+            if view is None:
+                if kind == SALES:
+                    view = HistoryView(SALES, "История продаж", app.csv_file)
+                else:
+                    view = HistoryView(PODZAKAZ, "История подзаказов", app.podzakaz_file)
+                history_views[kind] = view
+            view.refresh()
+            show_view(view.view)
+
+    def show_history(e):
+        """Показывает страницу с историей продаж"""
+        show_history_view(SALES)
+
+    def show_podzakaz_history(e):
+        """Показывает страницу с историей подзаказов"""
+        show_history_view(PODZAKAZ)
+
+    def show_reports(e):
+        """Показывает отчет за текущий месяц и выручку по месяцам"""
+        if not services_ready():
+            return
+        today = datetime.now()
+        report = reports.month_report(today.year, today.month, top=5)
+        months = reports.revenue_by_period('month')[-12:]
         
-        # Создаем кнопки
-        buttons = [
+        def report_rows(items):
+            return [ft.Text(f"{name}: {count} шт. — {revenue:,.0f} ₸") for name, count, revenue in items] or \
+                [ft.Text("Нет данных", color="grey")]
+        
+        report_content = [
+            ft.Text(f"Отчет за {today.strftime('%m.%Y')}", size=24, weight=ft.FontWeight.BOLD),
+            ft.Row([
+                build_stat_card("Продаж за месяц", str(report['count']), "#0d47a1"),
+                build_stat_card("Выручка за месяц", f"{report['revenue']:,.0f} ₸", "#1b5e20"),
+            ]),
+            ft.Text("По категориям", size=18, weight=ft.FontWeight.BOLD),
+            *report_rows((name, item['count'], item['revenue']) for name, item in report['categories'].items()),
+            ft.Text("Популярные товары", size=18, weight=ft.FontWeight.BOLD),
+            *report_rows((item['name'], item['count'], item['revenue']) for item in report['top_products']),
+            ft.Text("Курьеры", size=18, weight=ft.FontWeight.BOLD),
+            *([ft.Text(f"{item['name']}: {item['count']} доставок, к выплате {item['payout']:,.0f} ₸")
+               for item in report['couriers']] or [ft.Text("Нет данных", color="grey")]),
+            ft.Divider(),
+            ft.Text("Выручка по месяцам", size=18, weight=ft.FontWeight.BOLD),
+            *report_rows((item['period'], item['count'], item['revenue']) for item in reversed(months)),
             ft.ElevatedButton(
-                "Назад к добавлению заказов", 
+                "Назад к добавлению заказов",
                 on_click=lambda e: show_main_page(),
                 style=ft.ButtonStyle(padding=20)
-            )
+            ),
         ]
         
-        # Добавляем кнопку очистки только если есть история
-        if history:
-            buttons.append(
-                ft.OutlinedButton(
-                    "Очистить историю", 
-                    on_click=lambda e: show_clear_confirmation(file_path, title, is_podzakaz),
-                    style=ft.ButtonStyle(color="red")
-                )
-            )
+        extra_view.controls = report_content
+        show_view(extra_view)
+
+    def show_diagnostics(e=None):
+        """Показывает замеры времени по этапам: p50/p95/p99 и ошибки"""
+        stages = metrics.snapshot()
+        
+        def toggle(e):
+            metrics.enabled = not metrics.enabled
+            show_diagnostics()
+        
+        def reset(e):
+            metrics.reset()
+            show_diagnostics()
+        
+        def dump(e):
+            path = metrics.dump()
+            page.snack_bar = ft.SnackBar(content=ft.Text(f"✅ Замеры сохранены в {os.path.abspath(path)}"))
+            page.snack_bar.open = True
+            page.update()
         
-        history_content.append(ft.Row(buttons, alignment=ft.MainAxisAlignment.CENTER))
+        rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(name)),
+                ft.DataCell(ft.Text(str(stage['count']))),
+                ft.DataCell(ft.Text(f"{stage['p50_ms']:.1f}")),
+                ft.DataCell(ft.Text(f"{stage['p95_ms']:.1f}")),
+                ft.DataCell(ft.Text(f"{stage['p99_ms']:.1f}")),
+                ft.DataCell(ft.Text(str(stage['errors']), color="red" if stage['errors'] else None)),
+            ])
+            for name, stage in stages.items()
+        ]
+        
+        # Журнал отправки в Google Таблицы (при работе через службу он на ее стороне)
+        outbox_info = []
+        if outbox is not None and not service_url:
+            outbox_info = [
+                ft.Text(f"Ожидают отправки в Google Таблицы: {outbox.pending_count()}"),
+                ft.Text(f"Отклонено таблицами за запуск: {outbox.dead_count}"
+                        + (f" (сохранены в {outbox.dead_file})" if outbox.dead_count else ""),
+                        color="red" if outbox.dead_count else None),
+            ]
+            if outbox.handler_errors:
+                outbox_info.append(ft.Text(f"Ошибок обработки итогов отправки: {outbox.handler_errors}", color="red"))
+            if outbox.last_error:
+                outbox_info.append(ft.Text(f"Последняя ошибка отправки: {outbox.last_error}", color="orange"))
         
-        # Показываем страницу истории
-        page.clean()
-        page.add(ft.Column(history_content, scroll=ft.ScrollMode.ADAPTIVE))
+        extra_view.controls = [
+            ft.Text("Диагностика", size=24, weight=ft.FontWeight.BOLD),
+            ft.Text("Замеры включены" if metrics.enabled else "Замеры выключены",
+                    color="green" if metrics.enabled else "grey"),
+            *outbox_info,
+            ft.DataTable(
+                columns=[ft.DataColumn(ft.Text(name)) for name in ("Этап", "Вызовов", "p50, мс", "p95, мс", "p99, мс", "Ошибок")],
+                rows=rows,
+            ) if rows else ft.Text("Нет замеров", color="grey"),
+            ft.Row([
+                ft.OutlinedButton("Выключить замеры" if metrics.enabled else "Включить замеры", on_click=toggle),
+                ft.OutlinedButton("Сбросить", on_click=reset),
+                ft.OutlinedButton("Сохранить в файл", on_click=dump),
+            ]),
+            ft.ElevatedButton(
+                "Назад к добавлению заказов",
+                on_click=lambda e: show_main_page(),
+                style=ft.ButtonStyle(padding=20)
+            ),
+        ]
+        show_view(extra_view)
 
-    def show_history(e):
-        """Показывает страницу с историей продаж"""
-        history = app.get_sales_history()
-        show_history_page(history, "История продаж", app.csv_file)
+    # Форма ввода, страницы истории и страница отчетов/диагностики создаются один раз
+    # и остаются на странице; переход между ними только меняет видимость
+    main_view = ft.Column([
+        ft.Row([
+            ft.Text("Добавление продажи", size=24, weight=ft.FontWeight.BOLD, expand=True),
+            connection_status,
+            ft.IconButton(icon=ft.Icons.SYNC, tooltip="Сверить с Google Таблицами", on_click=sync_click),
+        ]),
+        ft.Divider(),
+        startup_row,
+        product_name,
+        product_suggestions,
+        color,
+        color_suggestions,
+        size,
+        size_suggestions,
+        price,
+        category,
+        courier_name,
+        courier_suggestions,
+        courier_amount,
+        paid_amount,
+        remaining_amount,
+        client_link,
+        ft.Row([
+            ft.ElevatedButton("Сохранить", on_click=save_click, style=ft.ButtonStyle(color="white")),
+            ft.OutlinedButton("История продаж", on_click=show_history),
+            ft.OutlinedButton("Подзаказы", on_click=show_podzakaz_history),
+            ft.OutlinedButton("Отчеты", on_click=show_reports),
+            ft.OutlinedButton("Диагностика", on_click=show_diagnostics),
+        ]),
+        result_text,
+    ], scroll=ft.ScrollMode.ADAPTIVE)
+    extra_view = ft.Column(scroll=ft.ScrollMode.ADAPTIVE)
 
-    def show_podzakaz_history(e):
-        """Показывает страницу с историей подзаказов"""
-        history = app.get_podzakaz_history()
-        show_history_page(history, "История подзаказов", app.podzakaz_file, is_podzakaz=True)
+    def show_view(view):
+        """Показывает одну из созданных страниц и скрывает остальные"""
+        if view not in page.controls:
+            page.controls.append(view)
+        for control in page.controls:
+            control.visible = control is view
+        page.update()
 
     def show_main_page():
         """Показывает главную страницу с формой ввода"""
-        page.clean()
-        page.add(
-            ft.Column([
-                ft.Row([
-                    ft.Text("Добавление продажи", size=24, weight=ft.FontWeight.BOLD, expand=True),
-                    connection_status,
-                ]),
-                ft.Divider(),
-                product_name,
-                color,
-                size,
-                price,
-                category,
-                courier_name,
-                courier_amount,
-                paid_amount,
-                remaining_amount,
-                client_link,
-                ft.Row([
-                    ft.ElevatedButton("Сохранить", on_click=save_click, style=ft.ButtonStyle(color="white")),
-                    ft.OutlinedButton("История продаж", on_click=show_history),
-                    ft.OutlinedButton("Подзаказы", on_click=show_podzakaz_history),
-                ]),
-                result_text,
-            ], scroll=ft.ScrollMode.ADAPTIVE)
-        )
+        show_view(main_view)
 
     # Запускаем приложение с главной страницы
     show_main_page()
+    first_frame = time.perf_counter() - started
+    metrics.record('startup.first_frame', first_frame)
+    if first_frame > STARTUP_BUDGET:
+        print(f"⚠ Запуск: форма открылась за {first_frame:.2f} с, бюджет {STARTUP_BUDGET:.2f} с")
+    
+    # Хранилище и индексы поднимаются уже после первого кадра, сохранения встают в очередь за ними
+    launch_services()
+    # При запуске досылаем записи, накопленные без связи, и забираем изменения таблиц
+    sync_click()
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
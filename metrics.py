@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Сколько последних замеров хранить по каждому этапу
+WINDOW = 1000
+
+
+class StageStats:
+    """Последние замеры одного этапа (скользящее окно) и счетчики вызовов и ошибок"""
+
+    __slots__ = ('samples', 'count', 'errors', 'max')
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.max = 0.0
+
+    def add(self, elapsed, failed):
+        self.samples.append(elapsed)
+        self.count += 1
+        if failed:
+            self.errors += 1
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def summary(self):
+        """Перцентили p50/p95/p99 и максимум в миллисекундах"""
+        ordered = sorted(self.samples)
+
+        def percentile(share):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': self.max * 1000,
+        }
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.started, exc_type is not None)
+        return False
+
+
+class _NullTimer:
+    """Пустой замер, когда инструментирование выключено: ничего не считает и не выделяет памяти"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Замеры времени горячих участков: запись в файл, запрос к Web App, разбор ответа, обновление экрана.
+
+    Использование: with metrics.timer('sheets.post'): ... — время попадает
+    в окно последних замеров этапа, исключение считается ошибкой.
+    Выключенные замеры почти ничего не стоят: timer() возвращает общий
+    пустой объект.
+    """
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name, elapsed, failed=False):
+        """Добавляет замер этапа (секунды)"""
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageStats(self.window)
+            stage.add(elapsed, failed)
+
+    def error(self, name):
+        """Считает ошибку этапа без замера времени (например, неуспешный ответ Web App)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageStats(self.window)
+            stage.errors += 1
+
+    def snapshot(self):
+        """Итоги по всем этапам: имя -> count, errors, p50_ms, p95_ms, p99_ms, max_ms"""
+        with self._lock:
+            return {name: stage.summary() for name, stage in sorted(self.stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def dump(self, path='metrics.json'):
+        """Записывает итоги в JSON-файл; возвращает путь"""
+        data = {
+            'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'enabled': self.enabled,
+            'stages': self.snapshot(),
+        }
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, path)
+        return path
+
+
+# Общие замеры приложения; включаются переменной окружения SALES_METRICS=1 или на экране диагностики
+metrics = Metrics(enabled=os.environ.get('SALES_METRICS') == '1')
@@ -0,0 +1,345 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from locks import lock_file
+
+# Сколько раз подряд Web App может отклонить строку, прежде чем она уйдет в файл отклоненных
+MAX_REJECTIONS = 3
+
+
+class Rejected(str):
+    """Сообщение об отказе Web App принять строку (ответ получен, но success=false).
+
+    В отличие от ошибок сети и сервера, повтор такой строки обычно не помогает.
+    """
+
+
+class SyncOutbox:
+    """Локальная очередь отправки данных в Google Таблицы (write-behind).
+
+    Каждая запись сначала дописывается в журнал на диске, после чего
+    сохранение сразу считается выполненным. Фоновый поток отправляет
+    записи из журнала в Google Таблицы, повторяя неудачные попытки
+    с экспоненциальной задержкой. После перезапуска приложения
+    неотправленные записи продолжают отправляться с того же места.
+
+    Если менеджер таблиц умеет отправлять пакеты (save_batch), записи
+    уходят пачками: пакет отправляется, когда набралось batch_size записей
+    или самая старая запись ждет дольше batch_max_age секунд.
+
+    Ошибки сети и сервера повторяются без ограничения, а строку, которую
+    Web App отклонил max_rejections раз подряд (Rejected), журнал переносит
+    в файл отклоненных (sync_outbox.dead.jsonl), чтобы она не задерживала
+    остальные записи. Число отказов дописывается в журнал и переживает
+    перезапуск.
+
+    Подписчики узнают об итогах пакета до того, как журнал отметит его
+    записи отправленными: при сбое между этими шагами запись отправится
+    повторно, но не пропадет из подтверждений сверки (track_outbox).
+
+    Журнал принадлежит одному процессу (блокировка файла .lock). Второй
+    экземпляр на тех же файлах (импорт или служба при открытом приложении)
+    пишет в свой журнал sync_outbox-<pid>-<метка>.jsonl; записи, которые он
+    не успел отправить, владелец основного журнала забирает при запуске.
+    """
+
+    def __init__(self, sheets_manager, journal_file='sync_outbox.jsonl',
+                 base_delay=1.0, max_delay=300.0, batch_size=50, batch_max_age=2.0,
+                 max_rejections=MAX_REJECTIONS):
+        self.sheets_manager = sheets_manager
+        self.base_journal = journal_file
+        stem, ext = os.path.splitext(journal_file)
+        self.dead_file = f"{stem}.dead{ext}"
+        self._lock_fd = lock_file(journal_file + '.lock')
+        if self._lock_fd is None:
+            # Основной журнал занят другим экземпляром — пишем в свой, чтобы не удалить чужие записи
+            journal_file = f"{stem}-{os.getpid()}-{uuid.uuid4().hex[:8]}{ext}"
+            self._lock_fd = lock_file(journal_file + '.lock')
+        self.journal_file = journal_file
+        self.done_file = journal_file + '.done'
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.batch_max_age = batch_max_age
+        self.max_rejections = max_rejections
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = []
+        # Пакет, который сейчас отправляется: его записи считаются неотправленными, пока не оповещены подписчики
+        self._in_flight = []
+        self._stopped = False
+        self._thread = None
+        self._failures = 0
+        self._listeners = []
+        self.last_error = ""
+        # Сколько строк за этот запуск перенесено в файл отклоненных
+        self.dead_count = 0
+        # Сколько раз за этот запуск подписчик (add_listener) завершился ошибкой
+        self.handler_errors = 0
+
+        self._pending = self._read_pending(self.journal_file, self.done_file)
+        if self.journal_file == self.base_journal:
+            self._adopt_orphans()
+
+    def _read_pending(self, journal_file, done_file):
+        """Неотправленные записи журнала journal_file (без отмеченных в done_file)"""
+        done_ids = set()
+        if os.path.exists(done_file):
+            with open(done_file, 'r', encoding='utf-8') as file:
+                done_ids = {line.strip() for line in file if line.strip()}
+
+        if not os.path.exists(journal_file):
+            return []
+
+        pending = {}
+        with open(journal_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная при сбое последняя строка журнала
+                    continue
+                entry_id = entry.get('id')
+                if entry_id in done_ids:
+                    continue
+                if 'data' not in entry:
+                    # Отметка об отказе Web App: сколько раз подряд отклонена записанная выше строка
+                    if entry_id in pending:
+                        pending[entry_id]['rejections'] = entry.get('rejections', 0)
+                    continue
+                # Повтор id бывает, если сбой прервал перенос чужого журнала — второй раз не берем
+                pending.setdefault(entry_id, entry)
+        return list(pending.values())
+
+    def _adopt_orphans(self):
+        """Забирает записи из журналов других экземпляров, завершившихся до их отправки"""
+        stem, ext = os.path.splitext(self.base_journal)
+        known = {entry.get('id') for entry in self._pending}
+        for lock_path in sorted(glob.glob(glob.escape(stem) + '-*' + ext + '.lock')):
+            path = lock_path[:-len('.lock')]
+            fd = lock_file(lock_path)
+            if fd is None:
+                # Экземпляр еще работает и сам отправит свои записи
+                continue
+            try:
+                entries = [entry for entry in self._read_pending(path, path + '.done')
+                           if entry.get('id') not in known]
+                if entries:
+                    # Сначала дописываем к себе, потом удаляем чужой журнал: при сбое записи не потеряются
+                    self._append_line(self.journal_file,
+                                      '\n'.join(json.dumps(entry, ensure_ascii=False) for entry in entries))
+                    self._pending.extend(entries)
+                for name in (path, path + '.done'):
+                    if os.path.exists(name):
+                        os.remove(name)
+            finally:
+                os.close(fd)
+            os.remove(lock_path)
+
+    def _append_line(self, path, line):
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def enqueue(self, data_type, data):
+        """Записывает данные в журнал и ставит их в очередь на отправку"""
+        return self.enqueue_many(data_type, [data])[0]
+
+    def enqueue_many(self, data_type, items):
+        """Записывает в журнал сразу много строк одной записью на диск (например, при импорте)"""
+        now = time.time()
+        entries = [
+            {'id': uuid.uuid4().hex, 'type': data_type, 'data': data, 'created': now}
+            for data in items
+        ]
+        if not entries:
+            return []
+        with self._wakeup:
+            self._append_line(self.journal_file, '\n'.join(json.dumps(entry, ensure_ascii=False) for entry in entries))
+            self._pending.extend(entries)
+            self._wakeup.notify()
+        return [entry['id'] for entry in entries]
+
+    def add_listener(self, callback):
+        """Подписывает на результаты отправки.
+
+        callback вызывается из фонового потока после каждой попытки отправки
+        пакета со списком кортежей (запись журнала, успех, сообщение). У строк,
+        перенесенных в файл отклоненных, в записи журнала стоит 'dead': True.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, outcomes):
+        for callback in list(self._listeners):
+            try:
+                callback(outcomes)
+            except Exception as e:
+                print(f"Ошибка обработчика отправки: {e}")
+                with self._lock:
+                    self.handler_errors += 1
+                    self.last_error = f"Ошибка обработчика отправки: {e}"
+
+    def pending_count(self):
+        """Количество записей, еще не отправленных в Google Таблицы"""
+        with self._lock:
+            return len(self._pending)
+
+    def pending_ids(self, data_type=None):
+        """id строк (data['id']) вида data_type, которые еще не отправлены (или о них еще не оповещены подписчики).
+
+        Учитываются и журналы других экземпляров (импорт, служба): их записи тоже дойдут до таблицы.
+        """
+        with self._lock:
+            entries = self._pending + self._in_flight
+        stem, ext = os.path.splitext(self.base_journal)
+        for path in [self.base_journal] + glob.glob(glob.escape(stem) + '-*' + ext):
+            if path != self.journal_file:
+                entries = entries + self._read_pending(path, path + '.done')
+        return {entry['data'].get('id') for entry in entries
+                if (data_type is None or entry.get('type') == data_type) and isinstance(entry.get('data'), dict)}
+
+    def start(self):
+        """Запускает фоновую отправку журнала"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='sheets-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Останавливает фоновую отправку (журнал остается на диске)"""
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        """Останавливает отправку и отпускает журнал (его сможет забрать другой экземпляр)"""
+        self.stop()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            if self.journal_file != self.base_journal and not os.path.exists(self.journal_file):
+                os.remove(self.journal_file + '.lock')
+
+    def wake(self):
+        """Прерывает ожидание перед повторной попыткой (например, при появлении сети)"""
+        with self._wakeup:
+            self._failures = 0
+            self._wakeup.notify_all()
+
+    def _next_delay(self):
+        return min(self.base_delay * (2 ** (self._failures - 1)), self.max_delay)
+
+    def _take_batch(self):
+        """Ждет срабатывания условия отправки и возвращает пакет; вызывается под блокировкой"""
+        while True:
+            while not self._pending and not self._stopped:
+                self._wakeup.wait()
+            if self._stopped:
+                return None
+
+            # Повторные попытки после ошибки и загрузка журнала при старте не ждут набора пакета
+            if self._failures or len(self._pending) >= self.batch_size:
+                return self._pending[:self.batch_size]
+
+            age = time.time() - self._pending[0].get('created', 0)
+            if age >= self.batch_max_age:
+                return self._pending[:self.batch_size]
+            self._wakeup.wait(self.batch_max_age - age)
+
+    def _send(self, batch):
+        """Результаты (успех, сообщение) по одному на запись пакета; исключение считается ошибкой всего пакета"""
+        try:
+            if len(batch) > 1 and hasattr(self.sheets_manager, 'save_batch'):
+                results = list(self.sheets_manager.save_batch([(entry['type'], entry['data']) for entry in batch]))
+            else:
+                results = [self.sheets_manager.save_to_sheets(entry['type'], entry['data']) for entry in batch]
+        except Exception as e:
+            return [(False, f"Ошибка отправки: {e}")] * len(batch)
+        # Ответ не на все строки пакета: строки без ответа повторяются, лишние ответы отбрасываются
+        missing = [(False, f"Нет ответа на строку ({len(results)} из {len(batch)})")] * (len(batch) - len(results))
+        return results[:len(batch)] + missing
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                batch = self._take_batch()
+                if batch is None:
+                    return
+                self._in_flight = batch
+
+            results = self._send(batch)
+
+            with self._wakeup:
+                sent, dead, rejected, errors = [], [], [], []
+                for entry, (success, message) in zip(batch, results):
+                    if success:
+                        sent.append(entry)
+                        continue
+                    if isinstance(message, Rejected):
+                        entry['rejections'] = entry.get('rejections', 0) + 1
+                        if entry['rejections'] >= self.max_rejections:
+                            dead.append((entry, message))
+                            continue
+                        rejected.append(entry)
+                    errors.append(message)
+                if rejected:
+                    self._append_line(self.journal_file, '\n'.join(
+                        json.dumps({'id': entry['id'], 'rejections': entry['rejections']}) for entry in rejected))
+                if dead:
+                    self._dead_letter(dead)
+                done = sent + [entry for entry, _ in dead]
+                done_ids = {entry['id'] for entry in done}
+                self._pending = [entry for entry in self._pending if entry['id'] not in done_ids]
+                if errors:
+                    self._failures += 1
+                    self.last_error = errors[0]
+                else:
+                    self._failures = 0
+                    self.last_error = ""
+
+            # Сначала подписчики (подтверждения сверки), потом отметка в журнале: сбой между ними
+            # приведет к повторной отправке, а не к строке, о доставке которой сверка не узнала
+            self._notify([(entry, success, message) for entry, (success, message) in zip(batch, results)])
+            with self._wakeup:
+                if done:
+                    self._mark_done(done)
+                self._in_flight = []
+
+            if errors:
+                with self._wakeup:
+                    if not self._stopped:
+                        self._wakeup.wait(self._next_delay())
+
+    def _dead_letter(self, rejected):
+        """Переносит отклоненные строки в файл отклоненных; вызывается под блокировкой"""
+        now = time.time()
+        lines = []
+        for entry, message in rejected:
+            entry['dead'] = True
+            lines.append(json.dumps({**entry, 'error': str(message), 'failed': now}, ensure_ascii=False))
+        self._append_line(self.dead_file, '\n'.join(lines))
+        self.dead_count += len(rejected)
+        print(f"Google Таблицы отклонили строк: {len(rejected)} ({rejected[0][1]}), они сохранены в {self.dead_file}")
+
+    def _mark_done(self, entries):
+        """Отмечает в журнале записи, уже убранные из очереди, как отправленные; вызывается под блокировкой"""
+        if self._pending:
+            self._append_line(self.done_file, '\n'.join(entry['id'] for entry in entries))
+            return
+
+        # Все отправлено — журнал больше не нужен (он только наш: другие экземпляры пишут в свои)
+        for path in (self.journal_file, self.done_file):
+            if os.path.exists(path):
+                os.remove(path)
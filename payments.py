@@ -0,0 +1,206 @@
+import csv
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from records import format_number, parse_number
+
+# Заголовок журнала оплат подзаказов
+LEDGER_HEADER = ['Дата', 'Подзаказ', 'Сумма']
+
+
+def order_id(record):
+    """Постоянный идентификатор подзаказа (PodzakazRecord.record_id: номер из строки или хэш старой строки)"""
+    return record.record_id()
+
+
+def new_order_id():
+    """Номер нового подзаказа, который сохраняется вместе со строкой"""
+    return uuid.uuid4().hex[:16]
+
+
+class OrderBalance:
+    """Текущий баланс подзаказа: сколько оплачено и сколько осталось с учетом всех доплат"""
+
+    __slots__ = ('order_id', 'record', 'paid', 'remaining')
+
+    def __init__(self, order_id, record):
+        self.order_id = order_id
+        self.record = record
+        self.paid = record.paid or 0
+        self.remaining = record.remaining or 0
+
+    @property
+    def client(self):
+        return self.record.client_link
+
+    def __repr__(self):
+        return f"OrderBalance({self.order_id!r}, paid={self.paid}, remaining={self.remaining})"
+
+
+class PaymentLedger:
+    """Журнал доплат по подзаказам и индекс остатков к оплате.
+
+    Доплаты только дописываются в CSV-файл журнала, строки истории
+    подзаказов не переписываются. В памяти поддерживаются баланс каждого
+    подзаказа, открытые (с остатком) подзаказы по клиентам и общая сумма
+    к получению, поэтому доплата, список должников и итог не перебирают
+    всю историю. История и журнал разбираются один раз — при первом обращении
+    (ensure_loaded) и под блокировкой, поэтому подзаказ, сохраненный во время
+    загрузки, не теряется и не учитывается дважды.
+    """
+
+    def __init__(self, ledger_file='podzakaz_payments.csv'):
+        self.ledger_file = ledger_file
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.orders = {}
+        # Открытые подзаказы: id -> баланс, и они же по клиентам
+        self.open_orders = {}
+        self.clients = {}
+        self.client_totals = {}
+        self.total_paid = 0
+        self.receivables = 0
+
+    def ensure_loaded(self, load_history):
+        """Строит индекс при первом обращении; load_history() вызывается под блокировкой индекса"""
+        with self._lock:
+            if not self.loaded:
+                self.reload(load_history)
+
+    def reload(self, load_history):
+        """Перестраивает индекс по истории load_history() (например, после переноса периодов в архив)"""
+        with self._lock:
+            self.load(load_history())
+
+    def load(self, records):
+        """Строит индекс по истории подзаказов и применяет все доплаты из журнала"""
+        with self._lock:
+            self._reset()
+            for record in records:
+                self._add_order(record)
+            for _, paid_order, amount in self._read_ledger():
+                balance = self.orders.get(paid_order)
+                if balance is not None:
+                    self._apply(balance, amount)
+            self.loaded = True
+
+    def _read_ledger(self):
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'r', newline='', encoding='utf-8-sig') as file:
+            for row in csv.reader(file):
+                if len(row) < len(LEDGER_HEADER) or row[:len(LEDGER_HEADER)] == LEDGER_HEADER:
+                    continue
+                amount = parse_number(row[2])
+                if amount:
+                    yield row[0], row[1], amount
+
+    def _add_order(self, record):
+        paid_order = order_id(record)
+        if paid_order in self.orders:
+            # Подзаказ уже учтен: он попал и в загруженную историю, и в add_orders,
+            # или это старый подзаказ без номера, полностью совпадающий с другим (для таблицы это одна строка)
+            return self.orders[paid_order]
+        balance = OrderBalance(paid_order, record)
+        self.orders[balance.order_id] = balance
+        self.total_paid += balance.paid
+        if balance.remaining > 0:
+            self._open(balance)
+        return balance
+
+    def _open(self, balance):
+        client = balance.client
+        self.open_orders[balance.order_id] = balance
+        self.clients.setdefault(client, {})[balance.order_id] = balance
+        self.client_totals[client] = self.client_totals.get(client, 0) + balance.remaining
+        self.receivables += balance.remaining
+
+    def _close(self, balance):
+        client = balance.client
+        del self.open_orders[balance.order_id]
+        del self.clients[client][balance.order_id]
+        if not self.clients[client]:
+            del self.clients[client]
+            del self.client_totals[client]
+
+    def _apply(self, balance, amount):
+        # Сумма к получению уменьшается не больше, чем на остаток подзаказа
+        covered = min(amount, max(balance.remaining, 0))
+        balance.paid += amount
+        balance.remaining -= amount
+        self.total_paid += amount
+        if covered:
+            self.receivables -= covered
+            self.client_totals[balance.client] -= covered
+            if balance.remaining <= 0:
+                self._close(balance)
+
+    def add_orders(self, records):
+        """Учитывает новые подзаказы (если индекс еще не построен, они попадут в него при загрузке из хранилища)"""
+        with self._lock:
+            if self.loaded:
+                for record in records:
+                    self._add_order(record)
+
+    def add_payment(self, paid_order, amount, date=None):
+        """Записывает доплату по подзаказу в журнал и обновляет остатки; возвращает баланс подзаказа"""
+        if isinstance(amount, str):
+            amount = parse_number(amount)
+        if amount is None or amount <= 0:
+            raise ValueError("Сумма оплаты должна быть больше нуля")
+        date = date or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with self._lock:
+            balance = self.orders.get(paid_order)
+            if balance is None:
+                raise KeyError(f"Подзаказ не найден: {paid_order}")
+            if amount > balance.remaining:
+                raise ValueError(f"Сумма больше остатка ({format_number(balance.remaining)} ₸)")
+
+            is_new = not os.path.exists(self.ledger_file)
+            with open(self.ledger_file, 'a', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                if is_new:
+                    writer.writerow(LEDGER_HEADER)
+                writer.writerow([date, paid_order, format_number(amount)])
+                file.flush()
+                os.fsync(file.fileno())
+
+            self._apply(balance, amount)
+            return balance
+
+    def balance(self, paid_order):
+        with self._lock:
+            return self.orders.get(paid_order)
+
+    def list_open(self, client=None):
+        """Подзаказы с остатком к оплате (новые первыми), всего или одного клиента"""
+        with self._lock:
+            orders = self.clients.get(client, {}) if client is not None else self.open_orders
+            return list(orders.values())[::-1]
+
+    def open_order_ids(self):
+        """Номера подзаказов с остатком к оплате"""
+        with self._lock:
+            return list(self.open_orders)
+
+    def client_balance(self, client):
+        """Сколько всего должен клиент"""
+        with self._lock:
+            return self.client_totals.get(client, 0)
+
+    def invalidate(self):
+        """Индекс перестроится по истории при следующем обращении (например, если новый подзаказ не удалось учесть)"""
+        with self._lock:
+            self.loaded = False
+
+    def reset(self):
+        """Очищает индекс после очистки истории подзаказов (журнал доплат остается на диске)"""
+        with self._lock:
+            self._reset()
+            self.loaded = True
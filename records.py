@@ -0,0 +1,212 @@
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from sys import intern
+
+# Время записи хранится целым числом секунд от 1970-01-01 (время кассы, без часового пояса)
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_timestamp(value):
+    """Секунды от 1970-01-01 для строки 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (0, если дату не разобрать)"""
+    try:
+        moment = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        return 0
+    return ((moment.toordinal() - EPOCH_ORDINAL) * 86400
+            + moment.hour * 3600 + moment.minute * 60 + moment.second)
+
+
+def format_timestamp(timestamp):
+    return (EPOCH + timedelta(seconds=timestamp)).strftime(DATE_FORMAT)
+
+
+def parse_number(value):
+    """Сумма из строки: int, Decimal для дробных или None для пустых и нечисловых значений"""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    text = str(value).replace('\xa0', '').replace(' ', '').replace(',', '.')
+    if not text:
+        return None
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    return int(number) if number == number.to_integral_value() else number
+
+
+def format_number(value):
+    """Сумма для CSV и экрана: '' для пустой, без лишних нулей для дробной"""
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        return format(value.normalize(), 'f')
+    return str(value)
+
+
+class Record(ABC):
+    """Общая часть записей истории.
+
+    Записи занимают мало памяти: __slots__ вместо словаря, суммы разобраны
+    в числа один раз при чтении, дата хранится числом секунд, а повторяющиеся
+    строки (товар, цвет, размер и т. п.) интернируются.
+
+    Если дату или сумму разобрать не удалось ('15.03.2024 10:00', '1 500 тг'),
+    дата считается нулевой, а сумма пустой, но исходный текст таких полей
+    хранится в raw ({поле: текст}, у обычных записей None) и возвращается
+    в to_row() без изменений — перенос и выгрузка не портят историю.
+    """
+
+    __slots__ = ('timestamp', 'product', 'color', 'size', 'price', 'raw')
+
+    # Поля в порядке колонок CSV после даты и числовые поля среди них
+    FIELDS = ()
+    NUMBER_FIELDS = ()
+    # Строковые поля после основных колонок, которых может не быть в старых строках
+    EXTRA_FIELDS = ()
+    HEADER = ()
+    # Заголовки колонок EXTRA_FIELDS в выгрузке (в CSV-файлах истории их нет)
+    EXTRA_HEADER = ()
+
+    @classmethod
+    @abstractmethod
+    def from_row(cls, row):
+        """Запись из строки CSV (список строк в порядке колонок файла)"""
+
+    def _keep_raw(self, row):
+        """Запоминает исходный текст полей строки row, которые не удалось разобрать"""
+        raw = {}
+        if not self.timestamp:
+            raw['date'] = row[0]
+        for position, name in enumerate(self.FIELDS, 1):
+            if name in self.NUMBER_FIELDS and getattr(self, name) is None and row[position]:
+                raw[name] = row[position]
+        self.raw = raw or None
+
+    @property
+    def date(self):
+        """Дата и время строкой 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (или исходный текст, если дату не удалось разобрать)"""
+        if self.raw is not None and 'date' in self.raw:
+            return self.raw['date']
+        return format_timestamp(self.timestamp)
+
+    @property
+    def day(self):
+        """Порядковый номер дня (как date.toordinal())"""
+        return EPOCH_ORDINAL + self.timestamp // 86400
+
+    def to_row(self):
+        """Строка CSV в порядке колонок файла"""
+        row = [self.date] + [
+            format_number(getattr(self, name)) if name in self.NUMBER_FIELDS else getattr(self, name)
+            for name in self.FIELDS
+        ]
+        if self.raw is not None:
+            for position, name in enumerate(self.FIELDS, 1):
+                if name in self.raw:
+                    row[position] = self.raw[name]
+        return row
+
+    def record_id(self):
+        """Постоянный идентификатор записи: хэш ее строки (строки истории не меняются).
+
+        Совпадает у полностью одинаковых записей, сохраненных в одну секунду, —
+        для Google Таблиц это одна и та же запись.
+        """
+        return hashlib.sha1('\x1f'.join(self.to_row()).encode('utf-8')).hexdigest()[:16]
+
+    def key(self):
+        """Значения всех полей кортежем — для поиска одинаковых записей"""
+        key = (self.timestamp,) + tuple(getattr(self, name) for name in self.FIELDS)
+        if self.raw is not None:
+            key += (tuple(sorted(self.raw.items())),)
+        return key
+
+    def as_dict(self):
+        """Словарь с русскими ключами, как в заголовке выгрузки; необязательные колонки — '' у старых строк"""
+        header = self.HEADER + self.EXTRA_HEADER
+        row = self.to_row()
+        return dict(zip(header, row + [''] * (len(header) - len(row))))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_row()!r})"
+
+
+class SaleRecord(Record):
+    """Продажа: дата, товар, цвет, размер, цена, категория, курьер, сумма курьеру"""
+
+    __slots__ = ('category', 'courier', 'courier_amount')
+
+    FIELDS = ('product', 'color', 'size', 'price', 'category', 'courier', 'courier_amount')
+    NUMBER_FIELDS = ('price', 'courier_amount')
+    HEADER = ('Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Категория', 'Курьер', 'Сумма курьеру')
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        record.timestamp = parse_timestamp(row[0])
+        record.product = intern(row[1])
+        record.color = intern(row[2])
+        record.size = intern(row[3])
+        record.price = parse_number(row[4])
+        record.category = intern(row[5])
+        record.courier = intern(row[6])
+        record.courier_amount = parse_number(row[7])
+        record.raw = None
+        if not record.timestamp or (record.price is None and row[4]) or (record.courier_amount is None and row[7]):
+            record._keep_raw(row)
+        return record
+
+
+class PodzakazRecord(Record):
+    """Подзаказ: дата, товар, цвет, размер, цена, оплачено, остаток, связь с клиентом и номер подзаказа.
+
+    Номер (девятая колонка) выдается при сохранении и не совпадает даже
+    у одинаковых подзаказов, сохраненных в одну секунду. У подзаказов,
+    сохраненных до появления номера, его нет (''), и номером служит хэш строки.
+    """
+
+    __slots__ = ('paid', 'remaining', 'client_link', 'order_id')
+
+    FIELDS = ('product', 'color', 'size', 'price', 'paid', 'remaining', 'client_link')
+    NUMBER_FIELDS = ('price', 'paid', 'remaining')
+    EXTRA_FIELDS = ('order_id',)
+    HEADER = ('Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Сколько заплатили', 'Сколько осталось заплатить', 'Связь с клиентом')
+    EXTRA_HEADER = ('Номер подзаказа',)
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        record.timestamp = parse_timestamp(row[0])
+        record.product = intern(row[1])
+        record.color = intern(row[2])
+        record.size = intern(row[3])
+        record.price = parse_number(row[4])
+        record.paid = parse_number(row[5])
+        record.remaining = parse_number(row[6])
+        record.client_link = intern(row[7])
+        record.order_id = (row[8] or '') if len(row) > 8 else ''
+        record.raw = None
+        if (not record.timestamp or (record.price is None and row[4])
+                or (record.paid is None and row[5]) or (record.remaining is None and row[6])):
+            record._keep_raw(row)
+        return record
+
+    def to_row(self):
+        row = super().to_row()
+        if self.order_id:
+            row.append(self.order_id)
+        return row
+
+    def record_id(self):
+        """Номер подзаказа из строки, а у старых подзаказов без номера — хэш строки"""
+        return self.order_id or super().record_id()
@@ -0,0 +1,278 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+from storage import PODZAKAZ, SALES
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Текстовые колонки, которые хранятся кодами из таблицы строк: имя колонки -> поле записи
+STRING_FIELDS = {
+    SALES: {'product': 'product', 'color': 'color', 'size': 'size', 'category': 'category', 'courier': 'courier'},
+    PODZAKAZ: {'product': 'product', 'color': 'color', 'size': 'size', 'client': 'client_link'},
+}
+# Вторая и третья числовые колонки: сумма курьеру у продаж, оплата и остаток у подзаказов
+AMOUNT_FIELDS = {
+    SALES: ('courier_amount', None),
+    PODZAKAZ: ('paid', 'remaining'),
+}
+
+
+def to_ordinal(value):
+    """Порядковый номер дня для даты, datetime или строки 'ГГГГ-ММ-ДД...'"""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+def period_key(ordinal, granularity):
+    """Ключ периода, в который попадает день: '2024-05-17', '2024-W20' или '2024-05'"""
+    day = date.fromordinal(ordinal)
+    if granularity == 'day':
+        return day.isoformat()
+    if granularity == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == 'month':
+        return f"{day.year}-{day.month:02d}"
+    raise ValueError(f"Неизвестный период: {granularity}")
+
+
+def period_bounds(ordinal, granularity):
+    """Первый и последний день (порядковые номера) периода, в который попадает день"""
+    day = date.fromordinal(ordinal)
+    if granularity == 'day':
+        return ordinal, ordinal
+    if granularity == 'week':
+        first = ordinal - day.weekday()
+        return first, first + 6
+    if granularity == 'month':
+        first = day.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        return first.toordinal(), following.toordinal() - 1
+    raise ValueError(f"Неизвестный период: {granularity}")
+
+
+class HistoryColumns:
+    """История одного вида в колоночном виде.
+
+    Даты хранятся порядковыми номерами дней, суммы — в массивах double,
+    текстовые поля — кодами в таблице уникальных строк. Записи только
+    дописываются, поэтому колонки растут вместе с историей.
+    """
+
+    def __init__(self, kind, generation=None):
+        self.kind = kind
+        # Поколение истории, из которой построены колонки (см. BaseStorage.read_since)
+        self.generation = generation
+        # size — число записей в колонках, consumed — сколько записей истории просмотрено
+        self.size = 0
+        self.consumed = 0
+        self.day = array('l')
+        self.price = array('d')
+        self.amount = array('d')
+        self.remaining = array('d')
+        self.codes = {field: array('l') for field in STRING_FIELDS[kind]}
+        self.strings = {field: [] for field in STRING_FIELDS[kind]}
+        self._string_index = {field: {} for field in STRING_FIELDS[kind]}
+        self.first_day = None
+        self.last_day = None
+        self._in_order = True
+        self._order = None
+
+    def extend(self, records):
+        """Дописывает записи; возвращает множество дней, в которые они попали"""
+        amount_field, remaining_field = AMOUNT_FIELDS[self.kind]
+        fields = STRING_FIELDS[self.kind].items()
+        days = set()
+        last_day = self.day[-1] if self.size else 0
+        for record in records:
+            self.consumed += 1
+            if not record.timestamp:
+                # Дату записи не удалось разобрать
+                continue
+            ordinal = record.day
+            if ordinal < last_day:
+                self._in_order = False
+            last_day = ordinal
+            days.add(ordinal)
+
+            self.day.append(ordinal)
+            self.price.append(float(record.price or 0))
+            self.amount.append(float(getattr(record, amount_field) or 0))
+            self.remaining.append(float(getattr(record, remaining_field) or 0) if remaining_field else 0.0)
+            for field, attribute in fields:
+                value = getattr(record, attribute)
+                index = self._string_index[field]
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(self.strings[field])
+                    self.strings[field].append(value)
+                self.codes[field].append(code)
+            self.size += 1
+
+        self._order = None
+        if days:
+            self.first_day = min(days) if self.first_day is None else min(self.first_day, min(days))
+            self.last_day = max(days) if self.last_day is None else max(self.last_day, max(days))
+        return days
+
+    def select(self, first_day, last_day):
+        """Номера записей с днями в диапазоне [first_day, last_day]"""
+        if self._in_order:
+            return range(bisect_left(self.day, first_day), bisect_right(self.day, last_day))
+
+        # Записи дописывались не по порядку дат (например, при импорте) — ищем по отсортированной перестановке
+        if self._order is None:
+            self._order = array('l', sorted(range(self.size), key=self.day.__getitem__))
+            self._ordered_days = array('l', (self.day[i] for i in self._order))
+        lo = bisect_left(self._ordered_days, first_day)
+        hi = bisect_right(self._ordered_days, last_day)
+        return self._order[lo:hi]
+
+    def column_sum(self, column, rows):
+        """Сумма колонки по выбранным записям: для диапазона — сумма среза массива"""
+        if isinstance(rows, range):
+            return sum(column[rows.start:rows.stop])
+        return sum(column[row] for row in rows)
+
+    def group_sum(self, keys, values, rows):
+        """Группировка: код или ключ -> [количество, сумма] по выбранным записям"""
+        if isinstance(rows, range):
+            # Записи идут подряд: один проход по срезам колонок без обращения по номеру
+            pairs = zip(keys[rows.start:rows.stop], values[rows.start:rows.stop])
+        else:
+            pairs = ((keys[row], values[row]) for row in rows)
+        totals = {}
+        for key, value in pairs:
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [1, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+        return totals
+
+
+class ReportEngine:
+    """Отчеты по истории продаж и подзаказов.
+
+    Загружает историю в колоночный вид и дочитывает только новые записи
+    (app.history_since), не копируя всю историю на каждый отчет.
+    Итоги по завершенным периодам кэшируются и пересчитывается только
+    текущий период (или период, в который попали импортированные задним
+    числом записи).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self.columns = {SALES: HistoryColumns(SALES), PODZAKAZ: HistoryColumns(PODZAKAZ)}
+        self._cache = {}
+
+    def refresh(self, kind):
+        """Подгружает новые записи истории; если история очищена или заменена — перестраивает колонки"""
+        columns = self.columns[kind]
+        while True:
+            generation, records = self.app.history_since(kind, columns.consumed)
+            if generation == columns.generation:
+                break
+            # Другое поколение: история очищена (даже если после этого дописано больше, чем было) — читаем заново
+            columns = self.columns[kind] = HistoryColumns(kind, generation)
+            self._cache = {key: value for key, value in self._cache.items() if key[0] != kind}
+
+        days = columns.extend(records)
+        if days:
+            # Кэш завершенных периодов сбрасываем, только если в них попали новые записи
+            self._cache = {
+                key: value for key, value in self._cache.items()
+                if key[0] != kind or not any(key[1] <= day <= key[2] for day in days)
+            }
+        return columns
+
+    def _cached(self, kind, first_day, last_day, name, compute):
+        key = (kind, first_day, last_day, name)
+        if key in self._cache:
+            return self._cache[key]
+        result = compute()
+        # Кэшируем только завершенные периоды: в текущий еще добавляются записи
+        if last_day < date.today().toordinal():
+            self._cache[key] = result
+        return result
+
+    def revenue_by_period(self, granularity='month', kind=SALES):
+        """Количество и выручка по дням, неделям или месяцам: список словарей по возрастанию периода"""
+        with self._lock:
+            columns = self.refresh(kind)
+            if not columns.size:
+                return []
+
+            result = []
+            first_day, last_day = period_bounds(columns.first_day, granularity)
+            while first_day <= columns.last_day:
+                count, revenue = self._cached(kind, first_day, last_day, 'totals',
+                                              lambda: self._totals(columns, first_day, last_day))
+                if count:
+                    result.append({'period': period_key(first_day, granularity), 'count': count, 'revenue': revenue})
+                first_day, last_day = period_bounds(last_day + 1, granularity)
+            return result
+
+    def _totals(self, columns, first_day, last_day):
+        rows = columns.select(first_day, last_day)
+        return len(rows), columns.column_sum(columns.price, rows)
+
+    def summary(self, date_from, date_to, kind=SALES, top=10):
+        """Отчет за период (даты включительно): выручка, категории, топ товаров/цветов/размеров, курьеры"""
+        first_day, last_day = to_ordinal(date_from), to_ordinal(date_to)
+        with self._lock:
+            columns = self.refresh(kind)
+            return self._cached(kind, first_day, last_day, ('summary', top),
+                                lambda: self._summary(columns, first_day, last_day, top))
+
+    def month_report(self, year, month, kind=SALES, top=10):
+        """Отчет за календарный месяц"""
+        first_day, last_day = period_bounds(date(year, month, 1).toordinal(), 'month')
+        return self.summary(date.fromordinal(first_day), date.fromordinal(last_day), kind, top)
+
+    def _top(self, columns, field, rows, top):
+        groups = columns.group_sum(columns.codes[field], columns.price, rows)
+        strings = columns.strings[field]
+        ranked = sorted(groups.items(), key=lambda item: (-item[1][0], -item[1][1]))[:top]
+        return [{'name': strings[code], 'count': count, 'revenue': revenue} for code, (count, revenue) in ranked]
+
+    def _summary(self, columns, first_day, last_day, top):
+        rows = columns.select(first_day, last_day)
+        price = columns.price
+        report = {
+            'date_from': date.fromordinal(first_day).isoformat(),
+            'date_to': date.fromordinal(last_day).isoformat(),
+            'count': len(rows),
+            'revenue': columns.column_sum(price, rows),
+            'top_products': self._top(columns, 'product', rows, top),
+            'top_colors': self._top(columns, 'color', rows, top),
+            'top_sizes': self._top(columns, 'size', rows, top),
+        }
+
+        if columns.kind == PODZAKAZ:
+            report['paid'] = columns.column_sum(columns.amount, rows)
+            report['remaining'] = columns.column_sum(columns.remaining, rows)
+            return report
+
+        categories = columns.group_sum(columns.codes['category'], price, rows)
+        report['categories'] = {
+            columns.strings['category'][code]: {'count': count, 'revenue': revenue}
+            for code, (count, revenue) in categories.items()
+        }
+
+        couriers = columns.codes['courier']
+        payouts = columns.group_sum(couriers, columns.amount, rows)
+        revenue = columns.group_sum(couriers, price, rows)
+        report['couriers'] = sorted((
+            {'name': columns.strings['courier'][code], 'count': count, 'payout': payout, 'revenue': revenue[code][1]}
+            for code, (count, payout) in payouts.items()
+            if columns.strings['courier'][code]
+        ), key=lambda item: -item['payout'])
+        return report
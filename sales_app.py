@@ -0,0 +1,518 @@
+import os
+from datetime import datetime
+from aggregates import AggregateStore
+from metrics import metrics
+from outbox import Rejected
+from payments import PaymentLedger, new_order_id, order_id
+from records import format_number, parse_number
+from storage import DEFAULT_STORAGE, PODZAKAZ, SALES, open_storage, row_to_record
+from sync import SHEETS_TYPES
+
+# URL веб-приложения Google Apps Script
+# ЗАМЕНИ ЭТОТ URL НА СВОЙ URL ИЗ GOOGLE APPS SCRIPT
+DEFAULT_WEB_APP_URL = "https://script.google.com/macros/s/AKfycbz6pbOosDMOZGa-YELYdZSnyMcKnQjI8VN36ycROMV9EBtvyI7DqNMaBt7l_3uR4Y3K/exec"
+# Переменная окружения SALES_WEB_APP_URL подменяет адрес, например на локальную замену (sheets_standin.py)
+WEB_APP_URL = os.environ.get('SALES_WEB_APP_URL', DEFAULT_WEB_APP_URL)
+
+# Категории продаж; "Подзаказ" сохраняется в отдельную таблицу
+CATEGORIES = ["SET", "Т.люда", "Аня", "Resale", "Подзаказ"]
+
+# Доплата по подзаказу: Web App находит строку подзаказа по order_id и обновляет оплату и остаток
+SHEETS_PAYMENT_TYPE = 'payment'
+
+# Итог сохранения: (отправка в Google Таблицы в фоне, сразу в таблицу, только локально)
+SAVED_MESSAGES = {
+    SALES: ("✅ Данные сохранены! Отправка в Google Таблицы идет в фоне",
+            "✅ Данные успешно сохранены в таблицу обычных заказов!",
+            "✅ Данные успешно сохранены локально!"),
+    PODZAKAZ: ("✅ Подзаказ сохранен! Отправка в Google Таблицы идет в фоне",
+               "✅ Подзаказ успешно сохранен в таблицу подзаказов!",
+               "✅ Подзаказ успешно сохранен локально!"),
+}
+
+class PartialImport(Exception):
+    """Пачка строк записана в хранилище не целиком: первые stored строк сохранены (и учтены), остальные нет"""
+
+    def __init__(self, stored, error):
+        super().__init__(str(error))
+        self.stored = stored
+
+
+class GoogleSheetsManager:
+    # Тип пакетного запроса к Web App: {type: 'batch', rows: [{type: 'order' | 'podzakaz', ...}, ...]}
+    # Ответ: {success, message, results: [{success, message}, ...]} — по одному результату на строку
+    BATCH_TYPE = 'batch'
+    # Запрос изменений в таблице: {type: 'changes', sheet: 'order' | 'podzakaz', since: курсор, limit}
+    # Ответ: {success, rows: [{id, date, product, ...}, ...], cursor, has_more} — строки, добавленные
+    # или измененные после курсора; курсор непрозрачный, его выдает Web App
+    CHANGES_TYPE = 'changes'
+
+    def __init__(self, web_app_url, connect_timeout=10, read_timeout=60, pool_size=4):
+        self.web_app_url = web_app_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self._session = None
+        # None — еще неизвестно, поддерживает ли Web App пакетные запросы и выдачу изменений
+        self.batch_supported = None
+        self.changes_supported = None
+    
+    @property
+    def session(self):
+        """Одна сессия на все запросы: соединение и TLS переиспользуются (keep-alive).
+
+        requests импортируется и сессия создается при первом запросе, а не при
+        запуске: без связи и до первой отправки сетевой стек не нужен.
+        """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+    
+    def save_to_sheets(self, data_type, data):
+        """Отправляет данные в Google Sheets через Web App"""
+        payload = {
+            'type': data_type,
+            **data
+        }
+        
+        try:
+            with metrics.timer('sheets.post'):
+                response = self.session.post(self.web_app_url, json=payload, timeout=self.timeout)
+            with metrics.timer('sheets.parse'):
+                result = response.json()
+            if not result['success']:
+                metrics.error('sheets.post')
+                if response.status_code == 200:
+                    # Web App ответил и отказал в этой строке — повтор вряд ли поможет
+                    return False, Rejected(result['message'])
+            return result['success'], result['message']
+        except Exception as e:
+            return False, f"❌ Ошибка соединения: {str(e)}"
+
+    def save_batch(self, rows):
+        """Отправляет несколько строк одним запросом.
+
+        rows — список пар (тип, данные), где тип 'order' или 'podzakaz'.
+        Возвращает список (успех, сообщение) для каждой строки в том же порядке.
+        Если Web App не поддерживает пакетные запросы, строки отправляются по одной.
+        """
+        if not rows:
+            return []
+        
+        if self.batch_supported is False:
+            return [self.save_to_sheets(data_type, data) for data_type, data in rows]
+        
+        payload = {
+            'type': self.BATCH_TYPE,
+            'rows': [{'type': data_type, **data} for data_type, data in rows]
+        }
+        
+        try:
+            with metrics.timer('sheets.batch_post'):
+                response = self.session.post(self.web_app_url, json=payload, timeout=self.timeout)
+        except Exception as e:
+            # Нет связи — по одной строке отправить тоже не получится
+            return [(False, f"❌ Ошибка соединения: {str(e)}")] * len(rows)
+        
+        try:
+            with metrics.timer('sheets.parse'):
+                result = response.json()
+        except ValueError:
+            result = None
+        
+        if response.status_code != 200:
+            # Временный сбой сервера (500, 429 и т. п.) — не повод отказываться от пакетов
+            message = result.get('message') if isinstance(result, dict) else None
+            return [(False, f"❌ Ошибка сервера {response.status_code}: {message or ''}")] * len(rows)
+        
+        results = result.get('results') if isinstance(result, dict) else None
+        if not isinstance(results, list) or len(results) != len(rows):
+            if isinstance(result, dict) and 'results' not in result and result.get('success') is False:
+                # Скрипт явно отказался от запроса типа 'batch' — это старый скрипт без пакетов,
+                # дальше отправляем по одной строке
+                self.batch_supported = False
+            # Непонятный ответ (страница ошибки вместо JSON, неполный пакет) — этот пакет по одной строке,
+            # а следующий снова пробуем целиком
+            return [self.save_to_sheets(data_type, data) for data_type, data in rows]
+        
+        self.batch_supported = True
+        return [(True, item.get('message', '')) if item.get('success') else (False, Rejected(item.get('message', '')))
+                for item in results]
+
+    def fetch_changes(self, data_type, since=None, limit=500):
+        """Строки таблицы data_type ('order' или 'podzakaz'), измененные после курсора since.
+
+        Возвращает (успех, строки, новый курсор, есть ли еще строки). Если Web App
+        не умеет выдавать изменения, возвращает (False, [], since, False).
+        """
+        if self.changes_supported is False:
+            return False, [], since, False
+        
+        payload = {'type': self.CHANGES_TYPE, 'sheet': data_type, 'since': since or '', 'limit': limit}
+        try:
+            with metrics.timer('sheets.changes'):
+                response = self.session.post(self.web_app_url, json=payload, timeout=self.timeout)
+            with metrics.timer('sheets.parse'):
+                result = response.json()
+        except Exception as e:
+            print(f"Ошибка получения изменений: {e}")
+            return False, [], since, False
+        
+        if response.status_code != 200:
+            return False, [], since, False
+        
+        rows = result.get('rows') if isinstance(result, dict) else None
+        if not isinstance(rows, list):
+            # Старый скрипт без выдачи изменений
+            self.changes_supported = False
+            return False, [], since, False
+        
+        self.changes_supported = True
+        return bool(result.get('success', True)), rows, result.get('cursor', since), bool(result.get('has_more'))
+
+class SalesApp:
+    def __init__(self, sheets_manager=None, outbox=None, storage=None, stats=None, payments=None):
+        self.csv_file = 'sales_data.csv'
+        self.podzakaz_file = 'podzakaz_data.csv'
+        self.categories = list(CATEGORIES)
+        self.sheets_manager = sheets_manager
+        # Если задан журнал отправки, Google Таблицы обновляются в фоне
+        self.outbox = outbox
+        # По умолчанию — то же хранилище, что у приложения (SALES_STORAGE, иначе журнал 'log')
+        self.storage = storage or open_storage(os.environ.get('SALES_STORAGE', DEFAULT_STORAGE),
+                                               self.csv_file, self.podzakaz_file)
+        # Итоги для карточек статистики обновляются при каждом сохранении
+        self.stats = stats or AggregateStore()
+        self._stats_checked = set()
+        # Доплаты по подзаказам и остатки к оплате
+        self.payments = payments or PaymentLedger()
+
+    @staticmethod
+    def sheets_payload(kind, row):
+        """Данные для Web App из строки истории (в порядке колонок CSV).
+
+        id — постоянный идентификатор записи, idempotency_key — ключ, по которому
+        Web App пропускает повторно присланную строку (повтор после сбоя сети).
+        """
+        record_id = row_to_record(kind, row).record_id()
+        identity = {'id': record_id, 'idempotency_key': f"{SHEETS_TYPES[kind]}:{record_id}"}
+        if kind == SALES:
+            date, product, color, size, price, category, courier_name, courier_amount = row[:8]
+            return {
+                **identity,
+                'category': category,
+                'date': date,
+                'product': product,
+                'color': color,
+                'size': size,
+                'price': price,
+                'courier': courier_name or "",
+                'courier_amount': courier_amount or ""
+            }
+        
+        date, product, color, size, price, paid_amount, remaining_amount, client_link = row[:8]
+        return {
+            **identity,
+            'order_id': record_id,
+            'date': date,
+            'product': product,
+            'color': color,
+            'size': size,
+            'price': price,
+            'courier': "",  # Для подзаказов можно оставить пустым
+            'courier_amount': "",  # Для подзаказов можно оставить пустым
+            'paid': paid_amount,
+            'remaining': remaining_amount or "0",
+            'client_link': client_link or ""
+        }
+
+    def save_sale(self, product_name, color, size, price, category, courier_name, courier_amount):
+        """Сохраняет новую продажу в файл и Google Sheets (ТАБЛИЦА ОБЫЧНЫХ ЗАКАЗОВ)"""
+        try:
+            date_to_save = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            # Сохраняем в локальное хранилище
+            data = [
+                date_to_save,
+                product_name,
+                color,
+                size,
+                price,
+                category,
+                courier_name,
+                courier_amount
+            ]
+            
+            with metrics.timer('storage.append'):
+                self.storage.append(SALES, data)
+        except Exception as e:
+            return False, f"❌ Ошибка: {str(e)}"
+        
+        # Сохраняем в Google Sheets (ТАБЛИЦА ОБЫЧНЫХ ЗАКАЗОВ)
+        return self._after_append(SALES, data)
+
+    def save_podzakaz(self, product_name, color, size, price, paid_amount, remaining_amount, client_link):
+        """Сохраняет подзаказ в отдельный файл и Google Sheets (ТАБЛИЦА ПОДЗАКАЗОВ)"""
+        try:
+            date_to_save = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            # Сохраняем в локальное хранилище
+            data = [
+                date_to_save,
+                product_name,
+                color,
+                size,
+                price,
+                paid_amount,
+                remaining_amount,
+                client_link,
+                new_order_id()
+            ]
+            
+            with metrics.timer('storage.append'):
+                self.storage.append(PODZAKAZ, data)
+        except Exception as e:
+            return False, f"❌ Ошибка: {str(e)}"
+        
+        # Сохраняем в Google Sheets (ОТДЕЛЬНАЯ ТАБЛИЦА ПОДЗАКАЗОВ)
+        return self._after_append(PODZAKAZ, data)
+
+    def _after_append(self, kind, data):
+        """Итоги, остатки и отправка в Google Таблицы для строки, уже записанной в хранилище.
+
+        Запись к этому моменту сохранена, поэтому сбой этих шагов не считается
+        ошибкой сохранения — иначе запись сохранили бы еще раз, и она задвоилась.
+        Итоги и остатки в таком случае пересчитываются по истории при следующем
+        обращении, а строку, не попавшую в таблицу, досылает сверка.
+        """
+        queued, sent, local = SAVED_MESSAGES[kind]
+        self._index_records(kind, [row_to_record(kind, data)])
+        
+        sheets_data = self.sheets_payload(kind, data)
+        try:
+            if self.outbox:
+                self.outbox.enqueue(SHEETS_TYPES[kind], sheets_data)
+                return True, queued
+            if self.sheets_manager:
+                sheets_success, sheets_message = self.sheets_manager.save_to_sheets(SHEETS_TYPES[kind], sheets_data)
+                if not sheets_success:
+                    return True, f"⚠ Сохранено локально, ошибка Google Таблиц: {sheets_message}"
+                return True, sent
+        except Exception as e:
+            return True, f"⚠ Сохранено локально, в Google Таблицы запись отправит сверка: {e}"
+        return True, local
+
+    def _index_records(self, kind, records):
+        """Учитывает в итогах и остатках записи, уже записанные в хранилище.
+
+        Сбой не отменяет сохранения: итоги сверит с историей get_statistics,
+        а индекс остатков перестроится при следующем обращении.
+        """
+        try:
+            with metrics.timer('stats.add'):
+                self.stats.add_many(kind, records)
+        except Exception as e:
+            print(f"Ошибка обновления итогов: {e}")
+            self._stats_checked.discard(kind)
+        if kind == PODZAKAZ:
+            try:
+                self.payments.add_orders(records)
+            except Exception as e:
+                print(f"Ошибка обновления остатков: {e}")
+                self.payments.invalidate()
+
+    @staticmethod
+    def with_order_ids(kind, rows):
+        """Строки с номерами подзаказов: новым — свой номер, строки из таблицы (сверка) приходят со своим"""
+        if kind != PODZAKAZ:
+            return rows
+        return [row if len(row) > 8 and row[8] else list(row[:8]) + [new_order_id()] for row in rows]
+
+    def import_rows(self, kind, rows, push_to_sheets=True):
+        """Сохраняет пачку готовых строк: одна запись в хранилище, итоги и журнал отправки.
+
+        Если запись в хранилище не удалась, поднимается PartialImport с числом
+        строк, которые все же оказались в истории (они учтены, как при успехе).
+        Сбои после записи, как и у save_sale, сохранение не отменяют.
+        """
+        if not rows:
+            return
+        rows = self.with_order_ids(kind, rows)
+        try:
+            self.storage.append_many(kind, rows)
+        except Exception as e:
+            stored = self._stored_count(kind, rows)
+            if stored:
+                self._after_import(kind, rows[:stored], push_to_sheets)
+            raise PartialImport(stored, e) from e
+        self._after_import(kind, rows, push_to_sheets)
+
+    def _stored_count(self, kind, rows):
+        """Сколько первых строк rows оказалось в конце истории (после сбоя записи пачки)"""
+        try:
+            history = self.storage.load(kind)
+        except Exception:
+            return 0
+        wanted = [row_to_record(kind, row).record_id() for row in rows]
+        tail = [record.record_id() for record in history[-len(rows):]]
+        # Строки дописываются по порядку, поэтому сохраненные — начало пачки в самом конце истории
+        return next((count for count in range(min(len(rows), len(tail)), 0, -1)
+                     if tail[len(tail) - count:] == wanted[:count]), 0)
+
+    def _after_import(self, kind, rows, push_to_sheets):
+        self._index_records(kind, [row_to_record(kind, row) for row in rows])
+        if not push_to_sheets:
+            return
+        payloads = [self.sheets_payload(kind, row) for row in rows]
+        try:
+            if self.outbox:
+                self.outbox.enqueue_many(SHEETS_TYPES[kind], payloads)
+            elif self.sheets_manager:
+                self.sheets_manager.save_batch([(SHEETS_TYPES[kind], payload) for payload in payloads])
+        except Exception as e:
+            print(f"Ошибка отправки в Google Таблицы, строки дошлет сверка: {e}")
+
+    def get_sales_history(self):
+        """Загружает всю историю продаж"""
+        try:
+            with metrics.timer('history.load'):
+                return self.storage.load(SALES)
+        except Exception as e:
+            print(f"Ошибка загрузки истории: {e}")
+            return []
+
+    def get_podzakaz_history(self):
+        """Загружает историю подзаказов"""
+        try:
+            with metrics.timer('history.load'):
+                return self.storage.load(PODZAKAZ)
+        except Exception as e:
+            print(f"Ошибка загрузки подзаказов: {e}")
+            return []
+
+    def history_since(self, kind, position):
+        """(поколение истории, записи после первых position) — см. BaseStorage.read_since"""
+        try:
+            with metrics.timer('history.since'):
+                return self.storage.read_since(kind, position)
+        except Exception as e:
+            print(f"Ошибка загрузки истории: {e}")
+            return None, []
+
+    def archive_closed_periods(self):
+        """Убирает в архив завершенные периоды истории (хранилище 'partitioned'); возвращает {вид: ключи периодов}.
+
+        Подзаказы с остатком к оплате остаются в истории вместе со своим периодом,
+        итоги и индекс остатков пересчитываются по оставшейся истории.
+        """
+        def unpaid(record):
+            balance = self.order_balance(record)
+            return balance is None or balance.remaining > 0
+
+        archived = {}
+        for kind in (SALES, PODZAKAZ):
+            keys = self.storage.archive_closed(kind, keep=unpaid if kind == PODZAKAZ else None)
+            if not keys:
+                continue
+            archived[kind] = keys
+            self.stats.rebuild(kind, self.storage.load(kind))
+            if kind == PODZAKAZ:
+                self.payments.reload(self.get_podzakaz_history)
+        return archived
+
+    def get_statistics(self, kind):
+        """Итоги для карточек статистики: kind — SALES или PODZAKAZ"""
+        if kind not in self._stats_checked:
+            # Один раз за запуск сверяем итоги с историей: после сбоя файл итогов мог отстать
+            history = self.storage.load(kind)
+            if self.stats.get(kind)['count'] != len(history):
+                self.stats.rebuild(kind, history)
+            self._stats_checked.add(kind)
+        return self.stats.get(kind)
+
+    def query_sales(self, date_from=None, date_to=None, category=None, courier=None, product=None):
+        """Продажи за период (даты включительно) с отбором по категории, курьеру или товару"""
+        return self.storage.query(SALES, date_from, date_to, category=category, courier=courier, product=product)
+
+    def query_podzakaz(self, date_from=None, date_to=None, product=None, client=None):
+        """Подзаказы за период (даты включительно) с отбором по товару или клиенту"""
+        return self.storage.query(PODZAKAZ, date_from, date_to, product=product, client=client)
+
+    def iter_sales(self, date_from=None, date_to=None, category=None, courier=None, product=None):
+        """Продажи по одной (без загрузки всей истории) с отбором по периоду, категории, курьеру или товару"""
+        return self.storage.iter_records(SALES, date_from, date_to, category=category, courier=courier, product=product)
+
+    def iter_podzakaz(self, date_from=None, date_to=None, product=None, client=None):
+        """Подзаказы по одному (без загрузки всей истории) с отбором по периоду, товару или клиенту"""
+        return self.storage.iter_records(PODZAKAZ, date_from, date_to, product=product, client=client)
+
+    def payment_ledger(self):
+        """Журнал доплат; индекс остатков строится по истории подзаказов при первом обращении"""
+        self.payments.ensure_loaded(self.get_podzakaz_history)
+        return self.payments
+
+    def add_payment(self, record, amount):
+        """Записывает доплату по подзаказу и отправляет новые оплату и остаток в таблицу подзаказов"""
+        amount = parse_number(amount) if isinstance(amount, str) else amount
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            balance = self.payment_ledger().add_payment(order_id(record), amount, date)
+        except (KeyError, ValueError) as e:
+            return False, f"❌ {e.args[0]}"
+        
+        sheets_data = {
+            'idempotency_key': f"{SHEETS_PAYMENT_TYPE}:{balance.order_id}:{date}:{format_number(amount)}",
+            'order_id': balance.order_id,
+            'date': date,
+            'order_date': record.date,
+            'product': record.product,
+            'client_link': record.client_link,
+            'amount': format_number(amount),
+            'paid': format_number(balance.paid),
+            'remaining': format_number(balance.remaining),
+        }
+        if self.outbox:
+            self.outbox.enqueue(SHEETS_PAYMENT_TYPE, sheets_data)
+        elif self.sheets_manager:
+            sheets_success, sheets_message = self.sheets_manager.save_to_sheets(SHEETS_PAYMENT_TYPE, sheets_data)
+            if not sheets_success:
+                # Доплата уже в журнале, повторять ее не нужно
+                return True, f"⚠ Оплата сохранена локально, ошибка Google Таблиц: {sheets_message}"
+        return True, f"✅ Оплата внесена, осталось: {format_number(balance.remaining)} ₸"
+
+    def order_balance(self, record):
+        """Текущие оплата и остаток подзаказа с учетом доплат"""
+        return self.payment_ledger().balance(order_id(record))
+
+    def order_balances(self, records):
+        """Балансы подзаказов records (None для неизвестных) — одним вызовом на страницу карточек"""
+        ledger = self.payment_ledger()
+        return [ledger.balance(order_id(record)) for record in records]
+
+    def open_podzakaz(self, client=None):
+        """Подзаказы с остатком к оплате (новые первыми), всего или одного клиента"""
+        return [balance.record for balance in self.payment_ledger().list_open(client)]
+
+    def receivables(self):
+        """Оплачено и осталось получить по всем подзаказам"""
+        ledger = self.payment_ledger()
+        return ledger.total_paid, ledger.receivables
+
+    def clear_history(self, file_path):
+        """Очищает историю: записи переносятся в архив хранилища, а не удаляются"""
+        try:
+            kind = SALES if file_path == self.csv_file else PODZAKAZ
+            self.storage.clear(kind)
+            self.stats.reset(kind)
+            if kind == PODZAKAZ:
+                self.payments.reset()
+            return True
+        except Exception as e:
+            print(f"Ошибка очистки: {e}")
+            return False
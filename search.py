@@ -0,0 +1,380 @@
+import heapq
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import date
+
+from payments import order_id
+from reports import to_ordinal
+from snapshot import value_counts
+from storage import PODZAKAZ, SALES
+
+# Поля, по которым ищем: имя фильтра -> поле записи
+SEARCH_FIELDS = {
+    SALES: {'product': 'product', 'color': 'color', 'size': 'size', 'category': 'category', 'courier': 'courier'},
+    PODZAKAZ: {'product': 'product', 'color': 'color', 'size': 'size', 'client': 'client_link'},
+}
+
+# Поля формы с подсказками; курьер есть только у продаж
+SUGGEST_FIELDS = {
+    SALES: ('product', 'color', 'size', 'courier'),
+    PODZAKAZ: ('product', 'color', 'size'),
+}
+
+# Сколько подсказок показывать и сколько готовых ответов держать в кэше
+SUGGEST_LIMIT = 5
+SUGGEST_CACHE_SIZE = 10000
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(value):
+    """Слова значения в нижнем регистре; значение целиком тоже считается словом (для телефонов и ссылок)"""
+    text = str(value).strip().lower()
+    if not text:
+        return set()
+    tokens = set(_WORD.findall(text))
+    tokens.add(text)
+    return tokens
+
+
+def query_tokens(text):
+    """Слова поискового запроса в нижнем регистре"""
+    return _WORD.findall(str(text).lower())
+
+
+class Postings:
+    """Объединение нескольких списков номеров записей (каждый по возрастанию).
+
+    Проверка вхождения идет двоичным поиском, поэтому большие списки
+    не приходится превращать в множества при пересечении.
+    """
+
+    def __init__(self, lists):
+        self.lists = lists
+        self.size = sum(len(rows) for rows in lists)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, position):
+        for rows in self.lists:
+            i = bisect_left(rows, position)
+            if i < len(rows) and rows[i] == position:
+                return True
+        return False
+
+    def __iter__(self):
+        for rows in self.lists:
+            yield from rows
+
+
+class FieldIndex:
+    """Обратный индекс одного поля: слово -> номера записей (по возрастанию)"""
+
+    def __init__(self):
+        self.postings = {}
+        self._sorted_tokens = []
+        self._dirty = False
+
+    def add(self, position, value):
+        for token in tokenize(value):
+            rows = self.postings.get(token)
+            if rows is None:
+                rows = self.postings[token] = array('l')
+                self._dirty = True
+            rows.append(position)
+
+    def lookup(self, prefix):
+        """Номера записей, у которых есть слово, начинающееся с prefix"""
+        if self._dirty:
+            self._sorted_tokens = sorted(self.postings)
+            self._dirty = False
+        tokens = self._sorted_tokens
+        start = bisect_left(tokens, prefix)
+        end = bisect_left(tokens, prefix + '\uffff', start)
+        return Postings([self.postings[token] for token in tokens[start:end]])
+
+
+class HistoryIndex:
+    """Индекс истории одного вида: поля, даты и номера подзаказов"""
+
+    def __init__(self, kind, generation=None):
+        self.kind = kind
+        # Поколение истории, по которой построен индекс (см. BaseStorage.read_since)
+        self.generation = generation
+        self.records = []
+        self.fields = {name: FieldIndex() for name in SEARCH_FIELDS[kind]}
+        self.days = array('l')
+        # Номер подзаказа -> позиции его строк (у старых строк без номера одинаковые строки дают один номер)
+        self.orders = {}
+        self._in_order = True
+        self._order = None
+
+    def extend(self, records):
+        fields = [(self.fields[name], attribute) for name, attribute in SEARCH_FIELDS[self.kind].items()]
+        for record in records:
+            position = len(self.records)
+            self.records.append(record)
+            for index, attribute in fields:
+                index.add(position, getattr(record, attribute))
+
+            day = record.day
+            if self.days and day < self.days[-1]:
+                self._in_order = False
+            self.days.append(day)
+
+            if self.kind == PODZAKAZ:
+                self.orders.setdefault(order_id(record), []).append(position)
+        self._order = None
+
+    def date_range(self, first_day, last_day):
+        """Номера записей с днями в диапазоне [first_day, last_day]"""
+        if self._in_order:
+            return range(bisect_left(self.days, first_day), bisect_right(self.days, last_day))
+
+        # Записи дописывались не по порядку дат (например, при импорте) — ищем по отсортированной перестановке
+        if self._order is None:
+            self._order = array('l', sorted(range(len(self.days)), key=self.days.__getitem__))
+            self._ordered_days = array('l', (self.days[i] for i in self._order))
+        lo = bisect_left(self._ordered_days, first_day)
+        hi = bisect_right(self._ordered_days, last_day)
+        return set(self._order[lo:hi])
+
+    def positions(self, order_ids):
+        """Номера записей подзаказов order_ids по возрастанию"""
+        return array('l', sorted(position for paid_order in order_ids for position in self.orders.get(paid_order, ())))
+
+
+class SearchIndex:
+    """Поиск по истории продаж и подзаказов без перебора всех записей.
+
+    Для каждого поля строится обратный индекс слов с поиском по началу слова.
+    Новые записи дописываются в индекс при следующем поиске: у хранилища
+    запрашиваются только записи после уже проиндексированных
+    (app.history_since). Индекс перестраивается, только если история
+    очищена или заменена (сменилось поколение).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self.indexes = {SALES: HistoryIndex(SALES), PODZAKAZ: HistoryIndex(PODZAKAZ)}
+
+    def refresh(self, kind):
+        """Дописывает в индекс новые записи истории"""
+        index = self.indexes[kind]
+        while True:
+            generation, records = self.app.history_since(kind, len(index.records))
+            if generation == index.generation:
+                break
+            index = self.indexes[kind] = HistoryIndex(kind, generation)
+        index.extend(records)
+        return index
+
+    def search(self, kind, text='', date_from=None, date_to=None, unpaid=False, limit=None, **fields):
+        """Ищет записи (новые первыми).
+
+        text — слова для поиска по всем полям (каждое слово — по началу),
+        fields — отбор по отдельным полям из SEARCH_FIELDS[kind], например
+        courier='Вася' или client='+7701'; unpaid — только подзаказы с остатком к оплате.
+        Остаток меняется с доплатами, поэтому открытые подзаказы берутся из журнала оплат.
+        """
+        open_orders = self.app.payment_ledger().open_order_ids() if unpaid else None
+        with self._lock:
+            index = self.refresh(kind)
+            candidates = []
+
+            for token in query_tokens(text):
+                matches = [field.lookup(token) for field in index.fields.values()]
+                candidates.append(Postings([rows for postings in matches for rows in postings.lists]))
+
+            for name, value in fields.items():
+                if value is None or value == '':
+                    continue
+                field = index.fields[name]
+                for token in query_tokens(value):
+                    candidates.append(field.lookup(token))
+
+            if unpaid:
+                candidates.append(Postings([index.positions(open_orders)]))
+
+            if date_from or date_to:
+                first_day = to_ordinal(date_from) if date_from else 0
+                last_day = to_ordinal(date_to) if date_to else date.max.toordinal()
+                candidates.append(index.date_range(first_day, last_day))
+
+            if not candidates:
+                positions = range(len(index.records) - 1, -1, -1)
+            else:
+                # Начинаем с самого короткого списка и проверяем его номера по остальным
+                candidates.sort(key=len)
+                found = set(candidates[0])
+                for other in candidates[1:]:
+                    if not found:
+                        break
+                    found = {position for position in found if position in other}
+                positions = sorted(found, reverse=True)
+
+            if limit is not None:
+                positions = positions[:limit]
+            return [index.records[position] for position in positions]
+
+
+class PrefixIndex:
+    """Значения одного поля с частотой: подсказки по началу значения, частые первыми.
+
+    Ключи (значения в нижнем регистре) лежат в отсортированном списке,
+    диапазон ключей с нужным началом находится двоичным поиском. Ответы
+    кэшируются по введенному тексту; новое значение сбрасывает в кэше
+    только ответы для своих начал.
+    """
+
+    def __init__(self, limit=SUGGEST_LIMIT):
+        self.limit = limit
+        self.counts = {}
+        # Ключ -> значение в том написании, в каком оно встретилось первым
+        self.values = {}
+        self.keys = []
+        self._cache = {}
+
+    def extend(self, values):
+        """Добавляет много значений сразу: список ключей сортируется один раз"""
+        self.extend_counts(Counter(values))
+
+    def extend_counts(self, counts):
+        """Добавляет значения с числом повторов ({значение: сколько раз})"""
+        for value, count in counts.items():
+            value = str(value).strip()
+            key = value.lower()
+            if not key:
+                continue
+            if key not in self.counts:
+                self.counts[key] = 0
+                self.values[key] = value
+            self.counts[key] += count
+        self.keys = sorted(self.counts)
+        self._cache = {}
+
+    def add(self, value):
+        value = str(value).strip()
+        key = value.lower()
+        if not key:
+            return
+        if key not in self.counts:
+            self.counts[key] = 0
+            self.values[key] = value
+            insort(self.keys, key)
+        self.counts[key] += 1
+        for end in range(len(key) + 1):
+            self._cache.pop(key[:end], None)
+
+    def lookup(self, prefix):
+        """До limit значений, начинающихся с prefix (без учета регистра), самые частые первыми"""
+        prefix = prefix.strip().lower()
+        result = self._cache.get(prefix)
+        if result is None:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\uffff', start)
+            best = heapq.nlargest(self.limit, self.keys[start:end], key=self.counts.__getitem__)
+            if len(self._cache) >= SUGGEST_CACHE_SIZE:
+                self._cache = {}
+            result = self._cache[prefix] = [self.values[key] for key in best]
+        return result
+
+
+class SuggestionIndex:
+    """Подсказки для полей формы по накопленной истории продаж и подзаказов.
+
+    Только что сохраненная запись попадает в индекс сразу (add), без чтения
+    истории. refresh() (при запуске, после сверки и очистки) дописывает записи
+    после уже учтенных (app.history_since), пропуская добавленные через add,
+    и перестраивает индекс, только если история очищена или заменена.
+    lookup() не обращается к истории и занимает микросекунды, поэтому его
+    можно вызывать на каждое нажатие клавиши.
+    """
+
+    def __init__(self, app, limit=SUGGEST_LIMIT):
+        self.app = app
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.fields = {name: PrefixIndex(limit) for name in SUGGEST_FIELDS[SALES]}
+        # Сколько записей каждого вида уже учтено и поколения истории; None — индекс еще не построен
+        self.counted = None
+        self.generations = None
+        # Значения записей, учтенных через add, но еще не дочитанных из истории
+        self._added = {SALES: Counter(), PODZAKAZ: Counter()}
+
+    def refresh(self):
+        with self._refresh_lock:
+            if self.counted is None:
+                self._rebuild()
+                return
+            updates = {kind: self.app.history_since(kind, count) for kind, count in self.counted.items()}
+            if any(generation != self.generations[kind] for kind, (generation, _) in updates.items()):
+                self._rebuild()
+                return
+            for kind, (_, new_records) in updates.items():
+                self._extend(kind, new_records)
+
+    def _rebuild(self):
+        """Первое построение или очистка: строим индекс отдельно и подменяем целиком, чтобы подсказки не ждали"""
+        histories = {SALES: self.app.get_sales_history(), PODZAKAZ: self.app.get_podzakaz_history()}
+        fields = {name: PrefixIndex(self.limit) for name in SUGGEST_FIELDS[SALES]}
+        for name, index in fields.items():
+            counts = Counter()
+            for kind, history in histories.items():
+                if name in SUGGEST_FIELDS[kind]:
+                    # История из снимка считается по колонке, без сборки записей
+                    counts.update(value_counts(history, name))
+            index.extend_counts(counts)
+        generations = {kind: self.app.history_since(kind, len(history))[0] for kind, history in histories.items()}
+        with self._lock:
+            self.fields = fields
+            self.counted = {kind: len(history) for kind, history in histories.items()}
+            self.generations = generations
+            self._added = {SALES: Counter(), PODZAKAZ: Counter()}
+
+    def _extend(self, kind, new_records):
+        """Дописывает в индекс записи истории, кроме уже учтенных через add; вызывается под _refresh_lock"""
+        if not new_records:
+            return
+        names = SUGGEST_FIELDS[kind]
+        with self._lock:
+            added = self._added[kind]
+            records = []
+            for record in new_records:
+                values = tuple(getattr(record, name) for name in names)
+                if added[values]:
+                    added[values] -= 1
+                else:
+                    records.append(values)
+            self._added[kind] = +added
+            for position, name in enumerate(names):
+                index = self.fields[name]
+                if len(records) > 100:
+                    # Много записей сразу (импорт, сверка) — один раз пересортировать дешевле
+                    index.extend(values[position] for values in records)
+                else:
+                    for values in records:
+                        index.add(values[position])
+            self.counted[kind] += len(new_records)
+
+    def add(self, kind, record):
+        """Учитывает только что сохраненную запись вида kind, не читая историю"""
+        with self._refresh_lock, self._lock:
+            if self.counted is None:
+                # Индекс еще не построен — запись попадет в него при построении
+                return
+            values = tuple(getattr(record, name) for name in SUGGEST_FIELDS[kind])
+            for name, value in zip(SUGGEST_FIELDS[kind], values):
+                self.fields[name].add(value)
+            self._added[kind][values] += 1
+
+    def lookup(self, field, prefix):
+        """Подсказки для поля field ('product', 'color', 'size' или 'courier')"""
+        with self._lock:
+            return self.fields[field].lookup(prefix)
@@ -0,0 +1,430 @@
+"""Служба без окна: одна копия SalesApp на несколько касс.
+
+Кассы (приложение с SALES_SERVICE_URL) отправляют сохранения и читают
+историю через локальный HTTP/JSON API. Все записи проходят через одну
+очередь записи: единственный поток пишет их пачками (group commit) — одна
+запись в файл, один fsync и одно обновление итогов на пачку, поэтому строки
+разных касс не перемешиваются, а очистка не пересекается с записью.
+Чтения (история, статистика) обслуживаются параллельно.
+
+API:
+    POST /sales      {product_name, color, size, price, category, courier_name, courier_amount}
+    POST /podzakaz   {product_name, color, size, price, paid_amount, remaining_amount, client_link}
+    POST /payments   {order_id, amount}
+    POST /clear      {kind}
+    POST /sync
+    GET  /history?kind=sales|podzakaz&offset=0  -> {generation, rows}
+    GET  /statistics?kind=...    GET /balance?id=...    GET /open_podzakaz?client=...
+    GET  /balances?id=...&id=...  -> [баланс или null] в порядке id
+    GET  /metrics    GET /health
+Ответы на запись: {success, message}.
+
+Запуск: python service.py [--host 127.0.0.1] [--port 8780] [--no-sheets]
+Кассы:  SALES_SERVICE_URL=http://127.0.0.1:8780 python main.py
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from metrics import metrics
+from records import DATE_FORMAT, format_number, parse_number
+from sales_app import CATEGORIES, PartialImport
+from storage import PODZAKAZ, SALES, row_to_record
+
+# Поля запросов на сохранение в порядке колонок CSV (после даты)
+SAVE_FIELDS = {
+    SALES: ['product_name', 'color', 'size', 'price', 'category', 'courier_name', 'courier_amount'],
+    PODZAKAZ: ['product_name', 'color', 'size', 'price', 'paid_amount', 'remaining_amount', 'client_link'],
+}
+
+
+class WriteQueue:
+    """Очередь записи с одним потоком-писателем и групповой фиксацией.
+
+    Писатель забирает все накопившиеся операции (но не больше max_batch и
+    не дольше max_wait секунд ожидания) и сохраняет подряд идущие продажи и
+    подзаказы одной пачкой через SalesApp.import_rows с одним fsync.
+    Если пачка записалась не целиком, ответ у каждой операции свой:
+    сохраненные строки — успех, остальные — ошибка (их можно сохранить снова).
+    Остальные операции (доплата, очистка, сверка) выполняются по порядку
+    между пачками. submit() возвращает Future с результатом (успех, сообщение).
+    """
+
+    def __init__(self, app, max_batch=256, max_wait=0.002, sync_engine=None):
+        self.app = app
+        self.sync_engine = sync_engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._commit(batch)
+                    return
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        groups = {SALES: [], PODZAKAZ: []}
+        for operation, args, future in batch:
+            if operation in groups:
+                groups[operation].append((args[0], future))
+                continue
+            # Доплата, очистка и сверка видят все сохранения, пришедшие раньше них
+            self._flush(groups)
+            try:
+                future.set_result(getattr(self, '_' + operation)(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self._flush(groups)
+
+    def _flush(self, groups):
+        for kind, items in groups.items():
+            if not items:
+                continue
+            rows = [row for row, _ in items]
+            stored, error = len(rows), None
+            with metrics.timer('service.commit'):
+                try:
+                    self.app.import_rows(kind, rows)
+                except PartialImport as e:
+                    stored, error = e.stored, e
+                except Exception as e:
+                    stored, error = 0, e
+                try:
+                    self.app.storage.sync(kind)
+                except Exception as e:
+                    # Строки уже в истории: ответ с ошибкой заставил бы кассу сохранить их еще раз
+                    print(f"Ошибка сброса на диск: {e}")
+            # Ответ по каждой строке: сохраненные до сбоя записи пачки — успех, остальные — ошибка
+            message = ("✅ Данные сохранены!" if kind == SALES else "✅ Подзаказ сохранен!") + (
+                " Отправка в Google Таблицы идет в фоне" if self.app.outbox else "")
+            for index, (_, future) in enumerate(items):
+                future.set_result((True, message) if index < stored else (False, f"❌ Ошибка: {str(error)}"))
+            items.clear()
+
+    def _payment(self, paid_order, amount):
+        balance = self.app.payment_ledger().balance(paid_order)
+        if balance is None:
+            return False, "❌ Подзаказ не найден"
+        return self.app.add_payment(balance.record, amount)
+
+    def _clear(self, kind):
+        file_path = self.app.csv_file if kind == SALES else self.app.podzakaz_file
+        if self.app.clear_history(file_path):
+            return True, "✅ История очищена и перенесена в архив"
+        return False, "❌ Ошибка при очистке"
+
+    def _sync(self):
+        if self.sync_engine is None:
+            return False, "Сверка с Google Таблицами выключена"
+        result = self.sync_engine.sync()
+        return not result['errors'], result
+
+
+def balance_json(balance):
+    return {'order_id': balance.order_id, 'paid': format_number(balance.paid),
+            'remaining': format_number(balance.remaining)}
+
+
+def make_handler(app, writer):
+    # Метка запуска службы входит в поколение истории: после перезапуска касса перечитает историю
+    instance = uuid.uuid4().hex[:8]
+
+    class Handler(BaseHTTPRequestHandler):
+        # Соединения с кассами держим открытыми между запросами; без Nagle короткие ответы
+        # не ждут подтверждения предыдущего пакета (иначе +40 мс на запрос)
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            params = {name: values[0] for name, values in query.items()}
+            kind = params.get('kind', SALES)
+            try:
+                if url.path == '/health':
+                    return self._reply({'success': True})
+                if url.path == '/history':
+                    # Касса дочитывает только новые записи: offset — сколько у нее уже есть
+                    generation, records = app.history_since(kind, int(params.get('offset', 0)))
+                    if generation is None:
+                        return self._reply({'success': False, 'message': "Ошибка загрузки истории"}, 500)
+                    return self._reply({'generation': f"{instance}:{generation}",
+                                        'rows': [record.to_row() for record in records]})
+                if url.path == '/statistics':
+                    app.get_statistics(kind)
+                    stats = app.stats.snapshot(kind)
+                    if kind == PODZAKAZ:
+                        stats['paid'], stats['remaining'] = (float(value) for value in app.receivables())
+                    return self._reply(stats)
+                if url.path == '/balance':
+                    balance = app.payment_ledger().balance(params.get('id'))
+                    return self._reply(balance_json(balance) if balance else None)
+                if url.path == '/balances':
+                    ledger = app.payment_ledger()
+                    return self._reply([balance_json(balance) if balance else None
+                                        for balance in map(ledger.balance, query.get('id', []))])
+                if url.path == '/open_podzakaz':
+                    return self._reply([record.to_row() for record in app.open_podzakaz(params.get('client'))])
+                if url.path == '/metrics':
+                    return self._reply(metrics.snapshot())
+            except Exception as e:
+                return self._reply({'success': False, 'message': str(e)}, 500)
+            self._reply({'success': False, 'message': "Нет такого адреса"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                data = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._reply({'success': False, 'message': "Неверный JSON"}, 400)
+
+            path = urlparse(self.path).path
+            if path in ('/sales', '/podzakaz'):
+                kind = SALES if path == '/sales' else PODZAKAZ
+                row = [datetime.now().strftime(DATE_FORMAT)] + [str(data.get(name) or '') for name in SAVE_FIELDS[kind]]
+                future = writer.submit(kind, row)
+            elif path == '/payments':
+                future = writer.submit('payment', data.get('order_id'), str(data.get('amount') or ''))
+            elif path == '/clear':
+                future = writer.submit('clear', data.get('kind', SALES))
+            elif path == '/sync':
+                future = writer.submit('sync')
+            else:
+                return self._reply({'success': False, 'message': "Нет такого адреса"}, 404)
+
+            try:
+                success, message = future.result()
+            except Exception as e:
+                success, message = False, f"❌ Ошибка: {str(e)}"
+            self._reply({'success': success, 'message': message})
+
+        def _reply(self, result, status=200):
+            body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_service(app, host='127.0.0.1', port=8780, sync_engine=None):
+    """Запускает очередь записи и HTTP-сервер в фоновых потоках; возвращает (сервер, очередь, URL)"""
+    writer = WriteQueue(app, sync_engine=sync_engine)
+    server = ThreadingHTTPServer((host, port), make_handler(app, writer))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='service', daemon=True).start()
+    return server, writer, f"http://{host}:{server.server_address[1]}"
+
+
+class RemoteSalesApp:
+    """SalesApp для кассы, работающей через службу: те же методы, данные — по HTTP.
+
+    История кэшируется и дочитывается с конца (запрос с offset), поэтому
+    отчеты и поиск на кассе не перекачивают всю историю каждый раз.
+    Если служба недоступна, чтения возвращают пустые значения, а не падают.
+    """
+
+    # Сколько id подзаказов запрашивать за раз в /balances (длина адреса запроса)
+    BALANCES_CHUNK = 100
+
+    def __init__(self, service_url, timeout=30):
+        import requests
+
+        self.service_url = service_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.csv_file = 'sales_data.csv'
+        self.podzakaz_file = 'podzakaz_data.csv'
+        self.categories = list(CATEGORIES)
+        self.outbox = None
+        self._lock = threading.Lock()
+        self._history = {SALES: [], PODZAKAZ: []}
+        # Сколько раз история на службе оказывалась очищенной — поколение для history_since
+        self._generations = {SALES: 0, PODZAKAZ: 0}
+        # Поколение истории, которое сообщила служба (меняется при очистке и перезапуске службы)
+        self._service_generations = {SALES: None, PODZAKAZ: None}
+
+    def _get(self, path, default=None, **params):
+        """Ответ службы на GET-запрос или default, если служба недоступна или ответила ошибкой"""
+        try:
+            response = self.session.get(self.service_url + path, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            print(f"Нет связи со службой ({path}): {e}")
+            return default
+
+    def _post(self, path, data=None):
+        try:
+            response = self.session.post(self.service_url + path, json=data or {}, timeout=self.timeout)
+            result = response.json()
+            return result['success'], result['message']
+        except Exception as e:
+            return False, f"❌ Нет связи со службой: {str(e)}"
+
+    def save_sale(self, product_name, color, size, price, category, courier_name, courier_amount):
+        return self._post('/sales', dict(zip(SAVE_FIELDS[SALES], (
+            product_name, color, size, price, category, courier_name, courier_amount))))
+
+    def save_podzakaz(self, product_name, color, size, price, paid_amount, remaining_amount, client_link):
+        return self._post('/podzakaz', dict(zip(SAVE_FIELDS[PODZAKAZ], (
+            product_name, color, size, price, paid_amount, remaining_amount, client_link))))
+
+    def _refresh(self, kind):
+        """Дочитывает новые записи истории со службы; вызывается под блокировкой"""
+        history = self._history[kind]
+        generation = self._service_generations[kind]
+        result = self._get('/history', kind=kind, offset=len(history))
+        if result is not None and generation is not None and result['generation'] != generation:
+            # История на службе очищена (или служба перезапущена) — загружаем заново
+            history.clear()
+            self._generations[kind] += 1
+            result = self._get('/history', kind=kind, offset=0)
+        if result is not None:
+            self._service_generations[kind] = result['generation']
+            history.extend(row_to_record(kind, row) for row in result['rows'])
+        return history
+
+    def _load(self, kind):
+        with self._lock:
+            return list(self._refresh(kind))
+
+    def history_since(self, kind, position):
+        with self._lock:
+            # Сначала дочитываем: при очистке на службе _refresh меняет поколение
+            records = self._refresh(kind)[position:]
+            return self._generations[kind], records
+
+    def get_sales_history(self):
+        return self._load(SALES)
+
+    def get_podzakaz_history(self):
+        return self._load(PODZAKAZ)
+
+    def get_statistics(self, kind):
+        return self._get('/statistics', {'count': 0, 'revenue': 0.0, 'paid': 0.0, 'remaining': 0.0}, kind=kind)
+
+    def clear_history(self, file_path):
+        kind = SALES if file_path == self.csv_file else PODZAKAZ
+        return self._post('/clear', {'kind': kind})[0]
+
+    def add_payment(self, record, amount):
+        return self._post('/payments', {'order_id': record.record_id(), 'amount': amount})
+
+    @staticmethod
+    def _balance(record, data):
+        from payments import OrderBalance
+
+        if data is None:
+            return None
+        balance = OrderBalance(data['order_id'], record)
+        balance.paid = parse_number(data['paid']) or 0
+        balance.remaining = parse_number(data['remaining']) or 0
+        return balance
+
+    def order_balance(self, record):
+        return self._balance(record, self._get('/balance', id=record.record_id()))
+
+    def order_balances(self, records):
+        balances = []
+        for start in range(0, len(records), self.BALANCES_CHUNK):
+            chunk = records[start:start + self.BALANCES_CHUNK]
+            data = self._get('/balances', [None] * len(chunk), id=[record.record_id() for record in chunk])
+            balances.extend(self._balance(record, item) for record, item in zip(chunk, data))
+        return balances
+
+    def open_podzakaz(self, client=None):
+        params = {'client': client} if client is not None else {}
+        return [row_to_record(PODZAKAZ, row) for row in self._get('/open_podzakaz', [], **params)]
+
+    def receivables(self):
+        stats = self.get_statistics(PODZAKAZ)
+        return stats['paid'], stats['remaining']
+
+    def sync(self):
+        """Сверка с Google Таблицами на стороне службы; возвращает счетчики сверки"""
+        success, result = self._post('/sync')
+        if isinstance(result, dict):
+            return result
+        return {'pushed': 0, 'pulled': 0, 'payments': 0, 'requests': 0, 'errors': [] if success else [result]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служба приложения для нескольких касс")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--no-sheets', action='store_true', help="не отправлять записи в Google Таблицы")
+    args = parser.parse_args(argv)
+
+    from outbox import SyncOutbox
+    from sales_app import WEB_APP_URL, GoogleSheetsManager, SalesApp
+    from storage import DEFAULT_STORAGE, open_storage
+    from sync import SyncEngine, track_outbox
+
+    storage = open_storage(os.environ.get('SALES_STORAGE', DEFAULT_STORAGE))
+    if args.no_sheets:
+        app, sync_engine = SalesApp(storage=storage), None
+    else:
+        sheets_manager = GoogleSheetsManager(WEB_APP_URL)
+        outbox = SyncOutbox(sheets_manager)
+        track_outbox(outbox)
+        outbox.start()
+        app = SalesApp(sheets_manager, outbox=outbox, storage=storage)
+        sync_engine = SyncEngine(app, sheets_manager, outbox=outbox)
+    # Завершенные периоды ('partitioned') уходят в архив до приема записей
+    app.archive_closed_periods()
+
+    server, writer, url = start_service(app, args.host, args.port, sync_engine)
+    print(f"Служба запущена: {url}")
+    print(f"Кассы: SALES_SERVICE_URL={url} python main.py")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        writer.stop()
+        # Снимок истории: следующий запуск службы не будет разбирать журнал целиком
+        storage.save_snapshot()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
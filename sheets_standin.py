@@ -0,0 +1,195 @@
+"""Локальная замена Web App Google Apps Script для проверок без интернета.
+
+Понимает те же запросы, что и скрипт таблиц: {type: 'order' | 'podzakaz' |
+'payment', ...} -> {success, message}, пакеты {type: 'batch', rows: [...]}
+и выдачу изменений {type: 'changes', sheet, since, limit}. Строки хранятся
+в памяти, повтор строки с тем же idempotency_key не создает дубля.
+
+Можно добавить задержку, случайные ошибки, зависания дольше таймаута
+клиента и ограничение числа запросов в секунду — чтобы проверить отправку
+в плохой сети. Приложение направляется сюда переменной окружения:
+SALES_WEB_APP_URL=http://127.0.0.1:8765/exec python main.py
+
+Запуск: python sheets_standin.py [--port 8765] [--latency 0.3] [--jitter 0.1]
+        [--error-rate 0.05] [--http-error-rate 0.02] [--timeout-rate 0.01] [--hang 90]
+        [--rate-limit 20]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROW_TYPES = ('order', 'podzakaz', 'payment')
+
+
+class StandinSheets:
+    """Таблицы в памяти и настройки сбоев"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, http_error_rate=0.0,
+                 timeout_rate=0.0, hang=90.0, rate_limit=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.sheets = {row_type: [] for row_type in ROW_TYPES}
+        self.keys = set()
+        self.requests = 0
+        # Ограничение частоты: корзина токенов на rate_limit запросов в секунду
+        self._tokens = float(rate_limit)
+        self._refilled = time.monotonic()
+
+    def _allow(self):
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def fault(self):
+        """Сбой для очередного запроса: None, 'rate', 'http' или 'hang'"""
+        with self._lock:
+            self.requests += 1
+            if not self._allow():
+                return 'rate'
+            roll = self.random.random()
+        if roll < self.timeout_rate:
+            return 'hang'
+        if roll < self.timeout_rate + self.http_error_rate:
+            return 'http'
+        return None
+
+    def delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def save_row(self, data):
+        row_type = data.get('type')
+        if row_type not in ROW_TYPES:
+            return {'success': False, 'message': f"Неизвестный тип: {row_type}"}
+        if self.random.random() < self.error_rate:
+            return {'success': False, 'message': "Ошибка записи в таблицу (имитация)"}
+        with self._lock:
+            key = data.get('idempotency_key')
+            if key and key in self.keys:
+                return {'success': True, 'message': "Строка уже есть в таблице"}
+            if key:
+                self.keys.add(key)
+            self.sheets[row_type].append(data)
+        return {'success': True, 'message': "Данные сохранены"}
+
+    def changes(self, data):
+        sheet = self.sheets.get(data.get('sheet'), [])
+        start = int(data.get('since') or 0)
+        limit = int(data.get('limit') or 500)
+        with self._lock:
+            rows = sheet[start:start + limit]
+            total = len(sheet)
+        return {'success': True, 'rows': rows, 'cursor': str(start + len(rows)), 'has_more': start + len(rows) < total}
+
+    def handle(self, data):
+        if data.get('type') == 'batch':
+            results = [self.save_row(row) for row in data.get('rows', [])]
+            return {'success': all(item['success'] for item in results), 'message': "Пакет обработан", 'results': results}
+        if data.get('type') == 'changes':
+            return self.changes(data)
+        return self.save_row(data)
+
+
+def make_handler(sheets):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+
+            fault = sheets.fault()
+            if fault == 'rate':
+                return self._reply(429, {'success': False, 'message': "Слишком много запросов (имитация)"})
+            if fault == 'hang':
+                time.sleep(sheets.hang)
+            time.sleep(sheets.delay())
+            if fault == 'http':
+                return self._reply(500, {'success': False, 'message': "Внутренняя ошибка сервера (имитация)"})
+
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                return self._reply(400, {'success': False, 'message': "Неверный JSON"})
+            self._reply(200, sheets.handle(data))
+
+        def _reply(self, status, result):
+            body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент уже ушел по таймауту
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(sheets, host='127.0.0.1', port=0):
+    """Запускает сервер в фоновом потоке; возвращает (сервер, URL)"""
+    server = ThreadingHTTPServer((host, port), make_handler(sheets))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='sheets-standin', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/exec"
+
+
+def add_fault_arguments(parser):
+    """Параметры сбоев (общие с нагрузочной проверкой)"""
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунд")
+    parser.add_argument('--jitter', type=float, default=0.0, help="разброс задержки, секунд")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля строк с ответом success=false")
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help="доля запросов с ответом 500")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="доля запросов, зависающих на --hang секунд")
+    parser.add_argument('--hang', type=float, default=90.0, help="сколько висит зависший запрос, секунд")
+    parser.add_argument('--rate-limit', type=int, default=0, help="запросов в секунду (0 — без ограничения)")
+    parser.add_argument('--seed', type=int)
+
+
+def sheets_from_args(args):
+    return StandinSheets(args.latency, args.jitter, args.error_rate, args.http_error_rate,
+                         args.timeout_rate, args.hang, args.rate_limit, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная замена Web App Google Таблиц")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    sheets = sheets_from_args(args)
+    server, url = start_server(sheets, args.host, args.port)
+    print(f"Web App запущен: {url}")
+    print(f"Приложение: SALES_WEB_APP_URL={url} python main.py")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Запросов: {sheets.requests}, строк: "
+                  + ", ".join(f"{name} {len(rows)}" for name, rows in sheets.sheets.items()))
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""Двоичный снимок истории: при запуске открывается через mmap, разбирается только дописанный после него хвост.
+
+Снимок лежит рядом с историей (sales_data.log.snap, sales_data.csv.snap):
+  заголовок HEADER: метка, вид записей, число записей и различных строк,
+  сколько байт исходного файла покрыто снимком и контрольная сумма начала
+  и конца этого куска (по ней видно, что файл с тех пор только дописывался);
+  таблица строк: смещения (uint32, строк + 1) и UTF-8 байты всех различных
+  строк — товаров, цветов, размеров, категорий, курьеров, клиентов, — каждая один раз;
+  колонки фиксированной ширины в порядке полей записи: дата (int64, секунды),
+  строковые поля (и дополнительные, например номер подзаказа) — номер строки
+  в таблице (uint32), суммы — int64, и в конце
+  исходный текст неразобранных полей (Record.raw) — номер строки с JSON
+  в таблице (пустая строка, если все поля разобраны).
+Колонки читаются через memoryview поверх mmap без копирования, записи
+собираются только при обращении, поэтому в память попадают лишь страницы
+тех записей, которые действительно читались.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+from decimal import Decimal
+from sys import intern
+
+MAGIC = b'SALESNP3'
+HEADER = struct.Struct('<8sB7xQQQI4x')
+KIND_CODES = {'sales': 0, 'podzakaz': 1}
+
+# Суммы хранятся int64; значения ниже SPECIAL — служебные: пустая сумма или номер строки с дробной
+# (или не влезающей в int64) суммой
+NONE = -2 ** 63
+TEXT_BASE = NONE + 1
+SPECIAL = -2 ** 62
+
+# Сколько байт в начале и в конце покрытого куска входит в контрольную сумму
+FINGERPRINT_SIZE = 4096
+
+# По сколько записей разворачивать колонки при обходе снимка
+ITER_CHUNK = 4096
+
+_write_lock = threading.Lock()
+
+
+def snapshot_path(source_path):
+    return source_path + '.snap'
+
+
+def fingerprint(source_path, offset):
+    """Контрольная сумма начала и конца куска [0, offset) исходного файла (None, если файл короче)"""
+    try:
+        with open(source_path, 'rb') as file:
+            head = file.read(min(offset, FINGERPRINT_SIZE))
+            start = max(0, offset - FINGERPRINT_SIZE)
+            file.seek(start)
+            tail = file.read(offset - start)
+    except FileNotFoundError:
+        return None
+    if len(tail) != offset - start:
+        return None
+    return zlib.crc32(tail, zlib.crc32(head))
+
+
+def _pad(size):
+    return (size + 7) & ~7
+
+
+def _layout(record_type):
+    """Поля записи по порядку колонок: (имя, код массива, числовое ли поле)"""
+    columns = [('timestamp', 'q', True)]
+    for name in record_type.FIELDS + record_type.EXTRA_FIELDS:
+        number = name in record_type.NUMBER_FIELDS
+        columns.append((name, 'q' if number else 'I', number))
+    columns.append(('raw', 'I', False))
+    return columns
+
+
+def _encode_raw(raw):
+    return json.dumps(raw, ensure_ascii=False, sort_keys=True) if raw else ''
+
+
+def _decode_raw(text):
+    return json.loads(text) if text else None
+
+
+class Snapshot(Sequence):
+    """Записи снимка, открытого через mmap; запись собирается при обращении по номеру"""
+
+    def __init__(self, path, record_type):
+        self.path = path
+        self.record_type = record_type
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        (magic, kind_code, self.count, string_count,
+         self.source_offset, self.fingerprint) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не снимок истории")
+        self.kind_code = kind_code
+
+        position = HEADER.size
+        self._offsets = view[position:position + 4 * (string_count + 1)].cast('I')
+        position += 4 * (string_count + 1)
+        self._blob = view[position:position + self._offsets[string_count]]
+        position = _pad(position + self._offsets[string_count])
+        self._strings = [None] * string_count
+
+        self.columns = {}
+        for name, code, number in _layout(record_type):
+            size = self.count * (8 if code == 'q' else 4)
+            self.columns[name] = (view[position:position + size].cast(code), number)
+            position = _pad(position + size)
+        if position > len(self._mmap):
+            raise ValueError(f"{path}: снимок обрезан")
+
+    def string(self, index):
+        value = self._strings[index]
+        if value is None:
+            value = self._strings[index] = intern(
+                bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8'))
+        return value
+
+    def strings(self):
+        return [self.string(index) for index in range(len(self._strings))]
+
+    def value_counts(self, name):
+        """Сколько раз встречается каждое значение строкового поля name — по колонке, без сборки записей"""
+        counts = Counter()
+        for index, count in Counter(self.columns[name][0]).items():
+            counts[self.string(index)] += count
+        return counts
+
+    def number(self, value):
+        if value > SPECIAL:
+            return value
+        if value == NONE:
+            return None
+        text = self.string(value - TEXT_BASE)
+        return int(text) if text.lstrip('-').isdigit() else Decimal(text)
+
+    def record(self, position):
+        record = self.record_type.__new__(self.record_type)
+        for name, (column, number) in self.columns.items():
+            value = column[position]
+            if name == 'timestamp':
+                record.timestamp = value
+            elif number:
+                setattr(record, name, self.number(value))
+            elif name == 'raw':
+                record.raw = _decode_raw(self.string(value))
+            else:
+                setattr(record, name, self.string(value))
+        return record
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.record(position) for position in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.record(index)
+
+    def __iter__(self):
+        # Колонки разворачиваются кусками: так обход всей истории в разы быстрее, чем по записи
+        names = list(self.columns)
+        record_type = self.record_type
+        for start in range(0, self.count, ITER_CHUNK):
+            stop = min(start + ITER_CHUNK, self.count)
+            values = []
+            for name in names:
+                column, number = self.columns[name]
+                chunk = column[start:stop].tolist()
+                if name == 'timestamp':
+                    values.append(chunk)
+                elif number:
+                    values.append([value if value > SPECIAL else self.number(value) for value in chunk])
+                elif name == 'raw':
+                    values.append([_decode_raw(self.string(value)) for value in chunk])
+                else:
+                    values.append([self.string(value) for value in chunk])
+            for row in zip(*values):
+                record = record_type.__new__(record_type)
+                for name, value in zip(names, row):
+                    setattr(record, name, value)
+                yield record
+
+    def close(self):
+        self._offsets.release()
+        self._blob.release()
+        for column, _ in self.columns.values():
+            column.release()
+        self._mmap.close()
+
+
+class History(Sequence):
+    """История как список: записи снимка и дописанные после него (обычный список)"""
+
+    def __init__(self, base, tail):
+        self.base = base
+        self.tail = tail
+
+    def __len__(self):
+        return len(self.base) + len(self.tail)
+
+    def __getitem__(self, index):
+        size = len(self.base)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.base[start:min(stop, size)] + self.tail[max(start - size, 0):max(stop - size, 0)]
+            return [self[position] for position in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if index < size:
+            return self.base[index]
+        return self.tail[index - size]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.tail
+
+    def value_counts(self, name):
+        """Сколько раз встречается каждое значение строкового поля name"""
+        counts = self.base.value_counts(name)
+        counts.update(getattr(record, name) for record in self.tail)
+        return counts
+
+
+def value_counts(history, name):
+    """Частоты значений поля name в истории; у истории со снимком считаются по его колонке"""
+    if isinstance(history, History):
+        return history.value_counts(name)
+    return Counter(getattr(record, name) for record in history)
+
+
+def open_snapshot(source_path, kind, record_type):
+    """Снимок истории source_path, если он есть и файл с тех пор только дописывался; иначе None.
+
+    Сверяются только начало и конец покрытого снимком куска: приложение файл
+    только дописывает или заменяет целиком, а после правки истории вручную
+    снимок (*.snap) нужно удалить.
+    """
+    path = snapshot_path(source_path)
+    if os.path.exists(path + '.new'):
+        # Снимок, который не удалось подменить, пока старый был открыт (Windows)
+        try:
+            os.replace(path + '.new', path)
+        except OSError:
+            pass
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path, record_type)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Снимок {path} не прочитан: {e}")
+        return None
+    if (snapshot.kind_code != KIND_CODES[kind]
+            or fingerprint(source_path, snapshot.source_offset) != snapshot.fingerprint):
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def write_snapshot(source_path, kind, record_type, base, tail, source_offset):
+    """Записывает снимок: base — прошлый снимок (его колонки и строки копируются как есть) или None.
+
+    Файл пишется во временный и подменяет старый через os.replace.
+    """
+    strings = base.strings() if base is not None else []
+    ids = {value: index for index, value in enumerate(strings)}
+
+    def string_id(value):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(strings)
+            strings.append(value)
+        return index
+
+    def encode_number(value):
+        if value is None:
+            return NONE
+        if isinstance(value, int) and value > SPECIAL and value < 2 ** 63:
+            return value
+        return TEXT_BASE + string_id(str(value))
+
+    columns = []
+    for name, code, number in _layout(record_type):
+        column = array(code)
+        if base is not None:
+            column.frombytes(base.columns[name][0].cast('B'))
+        if name == 'timestamp':
+            column.extend(record.timestamp for record in tail)
+        elif number:
+            column.extend(encode_number(getattr(record, name)) for record in tail)
+        elif name == 'raw':
+            column.extend(string_id(_encode_raw(record.raw)) for record in tail)
+        else:
+            column.extend(string_id(getattr(record, name)) for record in tail)
+        columns.append(column)
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = array('I', [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    count = (len(base) if base is not None else 0) + len(tail)
+    check = fingerprint(source_path, source_offset)
+    if check is None:
+        return False
+
+    path = snapshot_path(source_path)
+    tmp_file = path + '.tmp'
+    with _write_lock, open(tmp_file, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, KIND_CODES[kind], count, len(strings), source_offset, check))
+        file.write(offsets.tobytes())
+        blob = b''.join(encoded)
+        file.write(blob)
+        position = HEADER.size + 4 * len(offsets) + len(blob)
+        file.write(b'\0' * (_pad(position) - position))
+        for column in columns:
+            data = column.tobytes()
+            file.write(data)
+            file.write(b'\0' * (_pad(len(data)) - len(data)))
+        file.flush()
+        os.fsync(file.fileno())
+    try:
+        os.replace(tmp_file, path)
+    except PermissionError:
+        # Windows не дает заменить файл, открытый через mmap; новый снимок подменит его при следующем открытии
+        os.replace(tmp_file, path + '.new')
+    return True
+
+
+def remove_snapshot(source_path):
+    """Удаляет снимки истории source_path (после очистки или замены файла)"""
+    path = snapshot_path(source_path)
+    for name in (path, path + '.new'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            # Открытый снимок в Windows не удалить; он и так не пройдет проверку по контрольной сумме
+            pass
+
+
+def attach_snapshot(cache, kind, record_type):
+    """Подключает к кэшу истории (HistoryCache или AppendLog) снимок его файла, если снимок подходит"""
+    snapshot = open_snapshot(cache.path, kind, record_type)
+    if snapshot is not None:
+        cache.seed(snapshot)
+    return snapshot
+
+
+def update_snapshot(cache, kind, record_type, min_tail=0):
+    """Записывает новый снимок кэша, если после прошлого разобрано не меньше min_tail записей (и хотя бы одна)"""
+    base, tail, offset = cache.snapshot_state()
+    if len(tail) < max(min_tail, 1):
+        return False
+    return write_snapshot(cache.path, kind, record_type, base, tail, offset)
@@ -0,0 +1,753 @@
+import csv
+import gzip
+from abc import ABC, abstractmethod
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+from append_log import AppendLog
+from history_cache import HistoryCache
+from records import PodzakazRecord, SaleRecord, parse_timestamp
+from snapshot import attach_snapshot, remove_snapshot, update_snapshot
+
+# Заголовки CSV-файлов с продажами и подзаказами
+SALES_HEADER = ['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Категория', 'Курьер', 'Сумма курьеру']
+PODZAKAZ_HEADER = ['Дата', 'Товар', 'Цвет', 'Размер', 'Цена', 'Сколько заплатили', 'Сколько осталось заплатить', 'Связь с клиентом']
+
+# Виды записей и их колонки в базе данных (в том же порядке, что и в CSV)
+SALES = 'sales'
+PODZAKAZ = 'podzakaz'
+HEADERS = {SALES: SALES_HEADER, PODZAKAZ: PODZAKAZ_HEADER}
+RECORD_TYPES = {SALES: SaleRecord, PODZAKAZ: PodzakazRecord}
+COLUMNS = {
+    SALES: ['date', 'product', 'color', 'size', 'price', 'category', 'courier', 'courier_amount'],
+    # order_id — номер подзаказа, необязательная девятая колонка строки (в заголовке CSV ее нет)
+    PODZAKAZ: ['date', 'product', 'color', 'size', 'price', 'paid', 'remaining', 'client_link', 'order_id'],
+}
+
+# Фильтры запросов: имя параметра -> колонка (и поле записи с тем же именем)
+FILTERS = {
+    SALES: {'category': 'category', 'courier': 'courier', 'product': 'product'},
+    PODZAKAZ: {'product': 'product', 'client': 'client_link'},
+}
+
+# Хранилище по умолчанию (переопределяется переменной окружения SALES_STORAGE)
+DEFAULT_STORAGE = 'log'
+
+
+def row_to_record(kind, row):
+    """Превращает строку CSV в запись SaleRecord или PodzakazRecord"""
+    return RECORD_TYPES[kind].from_row(row)
+
+
+def date_bounds(date_from=None, date_to=None):
+    """Границы диапазона дат для сравнения со строками 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (оба дня включительно)"""
+    lower = str(date_from)[:10] if date_from else None
+    # '~' больше любого символа времени, поэтому в диапазон попадает весь день date_to
+    upper = str(date_to)[:10] + '~' if date_to else None
+    return lower, upper
+
+
+def record_filter(kind, date_from=None, date_to=None, **filters):
+    """Функция-фильтр записей по периоду (оба дня включительно) и значениям полей из FILTERS[kind]"""
+    lower = parse_timestamp(str(date_from)[:10]) if date_from else None
+    upper = parse_timestamp(str(date_to)[:10]) + 86399 if date_to else None
+    keys = [(FILTERS[kind][name], value) for name, value in filters.items() if value is not None]
+
+    def matches(record):
+        return ((lower is None or record.timestamp >= lower)
+                and (upper is None or record.timestamp <= upper)
+                and all(getattr(record, key) == value for key, value in keys))
+    return matches
+
+
+def read_rows(kind, path):
+    """Строки CSV-файла или сжатого архива .csv.gz как есть, по одной (строки заголовка пропускаются)"""
+    header = HEADERS[kind]
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8-sig') as file:
+        for row in csv.reader(file):
+            if len(row) < len(header) or row[:len(header)] == header:
+                continue
+            yield row
+
+
+def read_records(kind, path):
+    """Записи из CSV-файла или сжатого архива .csv.gz по одной (строки заголовка пропускаются)"""
+    for row in read_rows(kind, path):
+        yield row_to_record(kind, row)
+
+
+def fsync_file(path):
+    """fsync файла по имени: данные, записанные через любые дескрипторы, уходят на диск"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def compress_to_archive(path, archive_path):
+    """Дописывает CSV-файл в сжатый архив отдельным блоком gzip и удаляет файл.
+
+    Файл сначала переименовывается (path.archiving) и сжимается уже под
+    новым именем: запись, пришедшая во время сжатия, создаст новый path,
+    а не потеряется при удалении. Архив собирается во временном файле и
+    подменяется атомарно, поэтому сбой посередине не портит уже
+    заархивированные данные; файл, оставшийся от прерванной архивации,
+    дописывается в архив при следующей.
+    """
+    os.makedirs(os.path.dirname(archive_path) or '.', exist_ok=True)
+    moving = path + '.archiving'
+    if os.path.exists(moving):
+        _append_to_archive(moving, archive_path)
+    os.replace(path, moving)
+    _append_to_archive(moving, archive_path)
+
+
+def _append_to_archive(path, archive_path):
+    tmp_file = archive_path + '.tmp'
+    with open(tmp_file, 'wb') as out:
+        if os.path.exists(archive_path):
+            with open(archive_path, 'rb') as existing:
+                shutil.copyfileobj(existing, out)
+        with open(path, 'rb') as source, gzip.GzipFile(fileobj=out, mode='wb') as packed:
+            shutil.copyfileobj(source, packed)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_file, archive_path)
+    os.remove(path)
+
+
+def archive_files(path):
+    """Архивы очищенной истории файла path (archive/<имя>-<время>.csv.gz), от старых к новым"""
+    archive_dir = os.path.join(os.path.dirname(path), 'archive')
+    prefix = os.path.splitext(os.path.basename(path))[0] + '-'
+    if not os.path.isdir(archive_dir):
+        return []
+    return [os.path.join(archive_dir, name) for name in sorted(os.listdir(archive_dir))
+            if name.startswith(prefix) and name.endswith('.csv.gz')]
+
+
+def archive_path_for(path):
+    """Путь нового архива для очистки файла path"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), 'archive',
+                        f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv.gz")
+
+
+class BaseStorage(ABC):
+    """Интерфейс хранилища продаж и подзаказов.
+
+    Записи передаются строками в порядке колонок HEADERS[kind],
+    история возвращается записями SaleRecord или PodzakazRecord.
+    """
+
+    @abstractmethod
+    def append(self, kind, row):
+        """Дописывает одну запись вида kind"""
+
+    def append_many(self, kind, rows):
+        """Дописывает сразу много записей (например, при импорте)"""
+        for row in rows:
+            self.append(kind, row)
+
+    @abstractmethod
+    def load(self, kind):
+        """Вся история вида kind в порядке добавления"""
+
+    @abstractmethod
+    def read_since(self, kind, position):
+        """(поколение, записи вида kind после первых position) — чтобы дочитывать историю без ее копирования.
+
+        Поколение меняется, когда история очищена или заменена: читатель,
+        у которого оно другое, должен перечитать историю с position=0.
+        """
+
+    def query(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        """История вида kind за период с фильтрами из FILTERS[kind] (с архивом — если include_archive)"""
+        return list(self.iter_records(kind, date_from, date_to, include_archive, **filters))
+
+    @abstractmethod
+    def iter_records(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        """Записи вида kind по одной, без загрузки всей истории в память"""
+
+    @abstractmethod
+    def clear(self, kind):
+        """Убирает историю вида kind в архив: она пропадает из load(), но доступна запросам с include_archive"""
+
+    def sync(self, kind):
+        """Сбрасывает записанное на диск (fsync) — один раз на пачку записей"""
+
+    def save_snapshot(self, min_tail=0):
+        """Записывает двоичные снимки истории (см. snapshot.py), если после прошлых набралось min_tail записей"""
+
+    def archive_closed(self, kind, keep=None):
+        """Убирает в архив завершенные периоды истории, если хранилище делит ее по периодам; возвращает их ключи.
+
+        Период, в котором есть запись с keep(запись) == True, остается в истории.
+        """
+        return []
+
+    def close(self):
+        pass
+
+
+class CsvStorage(BaseStorage):
+    """Хранение в CSV-файлах (прежний формат, оставлен для совместимости)"""
+
+    def __init__(self, sales_file='sales_data.csv', podzakaz_file='podzakaz_data.csv'):
+        self.files = {SALES: sales_file, PODZAKAZ: podzakaz_file}
+        # Дописывание и очистка (архивация файла) не идут одновременно
+        self._lock = threading.Lock()
+        self.create_files_if_not_exist()
+        # История кэшируется в памяти, при повторном открытии дочитываются только новые строки
+        self.caches = {
+            kind: HistoryCache(path, HEADERS[kind], RECORD_TYPES[kind].from_row)
+            for kind, path in self.files.items()
+        }
+        # Начало истории — из снимка через mmap, разбирается только хвост файла после него
+        for kind, cache in self.caches.items():
+            attach_snapshot(cache, kind, RECORD_TYPES[kind])
+
+    def create_files_if_not_exist(self):
+        """Создает файлы для хранения данных, если их нет"""
+        for kind, path in self.files.items():
+            if not os.path.exists(path):
+                with open(path, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(HEADERS[kind])
+
+    def append(self, kind, row):
+        with self._lock, open(self.files[kind], 'a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(row)
+
+    def append_many(self, kind, rows):
+        # Одна запись в файл через большой буфер вместо открытия файла на каждую строку
+        with self._lock, open(self.files[kind], 'a', newline='', encoding='utf-8', buffering=1024 * 1024) as file:
+            writer = csv.writer(file)
+            writer.writerows(rows)
+
+    def load(self, kind):
+        return self.caches[kind].get()
+
+    def read_since(self, kind, position):
+        return self.caches[kind].since(position)
+
+    def sync(self, kind):
+        fsync_file(self.files[kind])
+
+    def save_snapshot(self, min_tail=0):
+        for kind, cache in self.caches.items():
+            self.load(kind)
+            update_snapshot(cache, kind, RECORD_TYPES[kind], min_tail)
+
+    def archive_files(self, kind):
+        """Архивы истории вида kind, от старых к новым"""
+        return archive_files(self.files[kind])
+
+    def query(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        if include_archive:
+            return super().query(kind, date_from, date_to, include_archive, **filters)
+        # В CSV нет индексов — фильтруем кэшированную историю
+        matches = record_filter(kind, date_from, date_to, **filters)
+        return [record for record in self.load(kind) if matches(record)]
+
+    def iter_records(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        # Читаем файлы потоком, а не из кэша: в памяти одновременно только одна строка
+        matches = record_filter(kind, date_from, date_to, **filters)
+        paths = self.archive_files(kind) if include_archive else []
+        if os.path.exists(self.files[kind]):
+            paths.append(self.files[kind])
+        for path in paths:
+            for record in read_records(kind, path):
+                if matches(record):
+                    yield record
+
+    def clear(self, kind):
+        path = self.files[kind]
+        with self._lock:
+            if os.path.exists(path):
+                compress_to_archive(path, archive_path_for(path))
+            remove_snapshot(path)
+            self.create_files_if_not_exist()
+        self.caches[kind].invalidate()
+
+
+class LogStorage(BaseStorage):
+    """История в журналах только на дописывание (sales_data.log, podzakaz_data.log, см. append_log.py).
+
+    У каждой записи своя контрольная сумма. Сохранение возвращается только
+    после fsync, а записи, пришедшие одновременно, сбрасываются на диск одним
+    общим fsync. При открытии оборванная сбоем запись в конце журнала
+    отрезается (только процессом-владельцем журнала). Очистка переносит историю в archive/<имя>-<время>.csv.gz
+    (как у CSV) и атомарно заменяет журнал пустым. Начало истории при
+    открытии берется из двоичного снимка (sales_data.log.snap), если он есть.
+    """
+
+    def __init__(self, sales_file='sales_data.log', podzakaz_file='podzakaz_data.log', migrate_from=None):
+        self.logs = {
+            kind: AppendLog(path, RECORD_TYPES[kind].from_row)
+            for kind, path in {SALES: sales_file, PODZAKAZ: podzakaz_file}.items()
+        }
+        try:
+            for kind, log in self.logs.items():
+                # Переносит историю только владелец журнала: другой процесс дождется готового журнала
+                if migrate_from is not None and not os.path.exists(log.path) and log.acquire():
+                    # Строки CSV переносятся как есть во временный файл, и журнал появляется только целиком:
+                    # если перенос прервется, журнала не будет и при следующем запуске перенос повторится
+                    log.create(read_rows(kind, migrate_from.files[kind]))
+                    remove_snapshot(log.path)
+                log.open()
+                if log.truncated:
+                    print(f"Журнал {log.path}: отрезана оборванная запись ({log.truncated} байт)")
+                attach_snapshot(log, kind, RECORD_TYPES[kind])
+        except Exception:
+            # Отпускаем журналы, чтобы повторное открытие (в том числе в этом же процессе) стало их владельцем
+            self.close()
+            raise
+
+    def append(self, kind, row):
+        self.logs[kind].append([row])
+
+    def append_many(self, kind, rows):
+        self.logs[kind].append(rows)
+
+    def load(self, kind):
+        return self.logs[kind].read()
+
+    def read_since(self, kind, position):
+        return self.logs[kind].since(position)
+
+    def sync(self, kind):
+        # Записи и так на диске к возврату из append; на случай чужих пачек ждем их fsync
+        self.logs[kind].commit()
+
+    def save_snapshot(self, min_tail=0):
+        for kind, log in self.logs.items():
+            log.read()
+            update_snapshot(log, kind, RECORD_TYPES[kind], min_tail)
+
+    def archive_files(self, kind):
+        return archive_files(self.logs[kind].path)
+
+    def query(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        if include_archive:
+            return super().query(kind, date_from, date_to, include_archive, **filters)
+        matches = record_filter(kind, date_from, date_to, **filters)
+        return [record for record in self.load(kind) if matches(record)]
+
+    def iter_records(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        matches = record_filter(kind, date_from, date_to, **filters)
+        if include_archive:
+            for path in self.archive_files(kind):
+                for record in read_records(kind, path):
+                    if matches(record):
+                        yield record
+        for row in self.logs[kind].iter_rows():
+            record = row_to_record(kind, row)
+            if matches(record):
+                yield record
+
+    def clear(self, kind):
+        log = self.logs[kind]
+
+        def archive(records):
+            # Сначала архив, потом пустой журнал: при сбое между ними история останется в журнале.
+            # В архив идут строки журнала как есть, а не записи, собранные заново
+            if records:
+                tmp_file = log.path + '.csv'
+                with open(tmp_file, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(HEADERS[kind])
+                    writer.writerows(log.iter_rows())
+                compress_to_archive(tmp_file, archive_path_for(log.path))
+            return []
+
+        log.rewrite(archive)
+        remove_snapshot(log.path)
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+
+
+class SqliteStorage(BaseStorage):
+    """Хранение в SQLite (режим WAL, индексы по дате, категории, курьеру и товару)"""
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE IF NOT EXISTS sales (id INTEGER PRIMARY KEY, ' + ', '.join(f'{c} TEXT' for c in COLUMNS[SALES]) + ')',
+        'CREATE TABLE IF NOT EXISTS podzakaz (id INTEGER PRIMARY KEY, ' + ', '.join(f'{c} TEXT' for c in COLUMNS[PODZAKAZ]) + ')',
+        'CREATE INDEX IF NOT EXISTS sales_date ON sales (date)',
+        'CREATE INDEX IF NOT EXISTS sales_category ON sales (category, date)',
+        'CREATE INDEX IF NOT EXISTS sales_courier ON sales (courier, date)',
+        'CREATE INDEX IF NOT EXISTS sales_product ON sales (product)',
+        'CREATE INDEX IF NOT EXISTS podzakaz_date ON podzakaz (date)',
+        'CREATE INDEX IF NOT EXISTS podzakaz_product ON podzakaz (product)',
+        'CREATE INDEX IF NOT EXISTS podzakaz_client ON podzakaz (client_link, date)',
+        # Архив: очищенная история переносится сюда и доступна запросам с include_archive
+        'CREATE TABLE IF NOT EXISTS sales_archive (id INTEGER PRIMARY KEY, ' + ', '.join(f'{c} TEXT' for c in COLUMNS[SALES]) + ')',
+        'CREATE TABLE IF NOT EXISTS podzakaz_archive (id INTEGER PRIMARY KEY, ' + ', '.join(f'{c} TEXT' for c in COLUMNS[PODZAKAZ]) + ')',
+        'CREATE INDEX IF NOT EXISTS sales_archive_date ON sales_archive (date)',
+        'CREATE INDEX IF NOT EXISTS podzakaz_archive_date ON podzakaz_archive (date)',
+    ]
+
+    def __init__(self, db_file='sales.db', migrate_from=None):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        # Сохранение идет из фонового потока, чтение — из интерфейса; доступ защищен блокировкой
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            with self.conn:
+                for statement in self.SCHEMA:
+                    self.conn.execute(statement)
+                # Колонки, появившиеся позже (номер подзаказа), добавляем в таблицы старых баз
+                for kind in (SALES, PODZAKAZ):
+                    for table in (kind, f'{kind}_archive'):
+                        present = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+                        for column in COLUMNS[kind]:
+                            if column not in present:
+                                self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+
+        if migrate_from is not None:
+            self.migrate(migrate_from)
+        else:
+            # Новая база без старых файлов: переносить нечего, и CSV, появившиеся позже, не подмешиваются
+            with self._lock, self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('migrated', '')")
+
+    def migrate(self, source):
+        """Однократно переносит историю из другого хранилища (например, из CSV-файлов).
+
+        Перенос и отметка о нем в meta идут одной транзакцией: прерванный перенос
+        откатывается целиком и повторяется при следующем открытии.
+        """
+        with self._lock, self.conn:
+            done = self.conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+            if done:
+                return False
+            for kind in (SALES, PODZAKAZ):
+                columns = COLUMNS[kind]
+                self.conn.executemany(
+                    f'INSERT INTO {kind} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                    (self._values(kind, record.to_row()) for record in source.load(kind))
+                )
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (type(source).__name__,))
+        return True
+
+    @staticmethod
+    def _values(kind, row):
+        """Значения строки для INSERT: по колонке на значение, недостающие необязательные — ''"""
+        values = [str(value) for value in row[:len(COLUMNS[kind])]]
+        return values + [''] * (len(COLUMNS[kind]) - len(values))
+
+    def append(self, kind, row):
+        self.append_many(kind, [row])
+
+    def append_many(self, kind, rows):
+        columns = COLUMNS[kind]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f'INSERT INTO {kind} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                (self._values(kind, row) for row in rows)
+            )
+
+    def _select(self, table, where='', params=(), kind=None):
+        kind = kind or table
+        columns = COLUMNS[kind]
+        with self._lock:
+            rows = self.conn.execute(
+                f'SELECT {", ".join(columns)} FROM {table} {where} ORDER BY id', params
+            ).fetchall()
+        from_row = RECORD_TYPES[kind].from_row
+        return [from_row(row) for row in rows]
+
+    def load(self, kind):
+        return self._select(kind)
+
+    def read_since(self, kind, position):
+        # Строки удаляются только очисткой (все сразу), после нее id снова начинаются с 1,
+        # поэтому записи после первых position — это id > position
+        with self._lock:
+            cleared = self.conn.execute('SELECT value FROM meta WHERE key = ?', (f'cleared:{kind}',)).fetchone()
+            rows = self.conn.execute(
+                f'SELECT {", ".join(COLUMNS[kind])} FROM {kind} WHERE id > ? ORDER BY id', (position,)
+            ).fetchall()
+        from_row = RECORD_TYPES[kind].from_row
+        return (cleared[0] if cleared else '0'), [from_row(row) for row in rows]
+
+    def _where(self, kind, date_from=None, date_to=None, **filters):
+        lower, upper = date_bounds(date_from, date_to)
+        conditions, params = [], []
+        if lower is not None:
+            conditions.append('date >= ?')
+            params.append(lower)
+        if upper is not None:
+            conditions.append('date <= ?')
+            params.append(upper)
+        for name, value in filters.items():
+            if value is not None:
+                conditions.append(f'{FILTERS[kind][name]} = ?')
+                params.append(value)
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return where, params
+
+    def query(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        where, params = self._where(kind, date_from, date_to, **filters)
+        archived = self._select(f'{kind}_archive', where, params, kind) if include_archive else []
+        return archived + self._select(kind, where, params)
+
+    def iter_records(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        # Отдельное соединение для чтения: в режиме WAL оно не мешает записи и не держит блокировку
+        where, params = self._where(kind, date_from, date_to, **filters)
+        from_row = RECORD_TYPES[kind].from_row
+        tables = [f'{kind}_archive', kind] if include_archive else [kind]
+        conn = sqlite3.connect(self.db_file)
+        try:
+            for table in tables:
+                cursor = conn.execute(f'SELECT {", ".join(COLUMNS[kind])} FROM {table} {where} ORDER BY id', params)
+                for row in cursor:
+                    yield from_row(row)
+        finally:
+            conn.close()
+
+    def clear(self, kind):
+        columns = ', '.join(COLUMNS[kind])
+        with self._lock, self.conn:
+            self.conn.execute(f'INSERT INTO {kind}_archive ({columns}) SELECT {columns} FROM {kind} ORDER BY id')
+            self.conn.execute(f'DELETE FROM {kind}')
+            # Счетчик очисток — поколение истории для read_since
+            key = f'cleared:{kind}'
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) '
+                'VALUES (?, COALESCE((SELECT value FROM meta WHERE key = ?), 0) + 1)', (key, key))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class PartitionedCsvStorage(BaseStorage):
+    """История в CSV-файлах по периодам: data/sales/2024-05.csv, data/podzakaz/2024-05.csv.
+
+    Новые записи дописываются в файл своего периода, поэтому файлы не
+    разрастаются, а запросы за период читают только подходящие файлы.
+    Закрытые периоды и очищенную историю можно убрать в сжатый архив
+    data/archive/<вид>/<период>.csv.gz — из load() они пропадают, но
+    остаются доступны запросам с include_archive.
+    """
+
+    # Длина ключа периода, который берется из начала даты 'ГГГГ-ММ-ДД ...'
+    PERIODS = {'year': 4, 'month': 7, 'day': 10}
+    MIGRATED_MARKER = '.migrated'
+    # Папка, в которой перенос из старых файлов собирает периоды, прежде чем переложить их на место
+    STAGING_DIR = '.migrating'
+
+    def __init__(self, data_dir='data', period='month', legacy_files=None):
+        if period not in self.PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        self.data_dir = data_dir
+        self.period = period
+        self.key_length = self.PERIODS[period]
+        self.caches = {}
+        # Дописывание и перенос периодов в архив не идут одновременно
+        self._lock = threading.Lock()
+        # Поколение истории для read_since: меняется, когда записи убраны или вставлены не в конец
+        self._generations = {kind: 0 for kind in HEADERS}
+        # Файлы периодов, дописанные после последнего sync()
+        self._unsynced = {kind: set() for kind in HEADERS}
+        for kind in HEADERS:
+            os.makedirs(os.path.join(data_dir, kind), exist_ok=True)
+        if legacy_files:
+            self.migrate(legacy_files)
+
+    def partition_key(self, row):
+        return row[0][:self.key_length]
+
+    def partition_path(self, kind, key):
+        return os.path.join(self.data_dir, kind, f'{key}.csv')
+
+    def archive_path(self, kind, key):
+        return os.path.join(self.data_dir, 'archive', kind, f'{key}.csv.gz')
+
+    def partitions(self, kind):
+        """Ключи периодов с активными файлами, по возрастанию"""
+        names = os.listdir(os.path.join(self.data_dir, kind))
+        return sorted(name[:-4] for name in names if name.endswith('.csv'))
+
+    def archived_partitions(self, kind):
+        archive_dir = os.path.join(self.data_dir, 'archive', kind)
+        if not os.path.isdir(archive_dir):
+            return []
+        return sorted(name[:-7] for name in os.listdir(archive_dir) if name.endswith('.csv.gz'))
+
+    def migrate(self, legacy_files):
+        """Разово раскладывает по периодам историю из старых файлов sales_data.csv / podzakaz_data.csv.
+
+        Старые файлы не удаляются, а метка в data_dir не дает перенести их повторно.
+        Периоды сначала собираются целиком в data_dir/.migrating и только потом
+        перекладываются на место: перенос, прерванный при сборке, начинается
+        заново, а прерванный при перекладывании — доделывается, записи не удваиваются.
+        """
+        marker = os.path.join(self.data_dir, self.MIGRATED_MARKER)
+        if os.path.exists(marker):
+            return
+        staging_dir = os.path.join(self.data_dir, self.STAGING_DIR)
+        ready = os.path.join(staging_dir, self.MIGRATED_MARKER)
+        if not os.path.exists(ready):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            staging = PartitionedCsvStorage(staging_dir, self.period)
+            for kind, path in legacy_files.items():
+                if not os.path.exists(path):
+                    continue
+                header = HEADERS[kind]
+                chunk = []
+                with open(path, 'r', newline='', encoding='utf-8-sig') as file:
+                    for row in csv.reader(file):
+                        if len(row) < len(header) or row[:len(header)] == header:
+                            continue
+                        chunk.append(row)
+                        if len(chunk) >= 10000:
+                            staging.append_many(kind, chunk)
+                            chunk = []
+                staging.append_many(kind, chunk)
+                staging.sync(kind)
+            self._write_marker(ready)
+
+        # Собранные периоды перекладываются по одному; после сбоя оставшиеся доложатся при следующем запуске
+        for kind in HEADERS:
+            for name in os.listdir(os.path.join(staging_dir, kind)):
+                os.replace(os.path.join(staging_dir, kind, name), os.path.join(self.data_dir, kind, name))
+        self._write_marker(marker)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def _write_marker(path):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _cache(self, kind, key):
+        cache = self.caches.get((kind, key))
+        if cache is None:
+            cache = self.caches[(kind, key)] = HistoryCache(
+                self.partition_path(kind, key), HEADERS[kind], RECORD_TYPES[kind].from_row)
+        return cache
+
+    def append(self, kind, row):
+        self.append_many(kind, [row])
+
+    def append_many(self, kind, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.partition_key(row), []).append(row)
+        with self._lock:
+            partitions = self.partitions(kind)
+            if partitions and min(groups, default=partitions[-1]) < partitions[-1]:
+                # Записи задним числом попадают в середину истории — читатели хвоста перечитают ее
+                self._generations[kind] += 1
+            for key, group in groups.items():
+                path = self.partition_path(kind, key)
+                self._unsynced[kind].add(path)
+                is_new = not os.path.exists(path)
+                with open(path, 'a', newline='', encoding='utf-8', buffering=1 << 20) as file:
+                    writer = csv.writer(file)
+                    if is_new:
+                        writer.writerow(HEADERS[kind])
+                    writer.writerows(group)
+
+    def load(self, kind):
+        # Каждый период кэшируется отдельно, при новой записи дочитывается только его файл
+        history = []
+        for key in self.partitions(kind):
+            history.extend(self._cache(kind, key).get())
+        return history
+
+    def read_since(self, kind, position):
+        return self._generations[kind], self.load(kind)[position:]
+
+    def _overlapping(self, keys, date_from, date_to):
+        # Ключ периода — начало даты, поэтому сравниваем с началом границ той же длины
+        # (границы могут быть date или datetime, как и в record_filter)
+        low = str(date_from)[:self.key_length] if date_from else None
+        high = str(date_to)[:self.key_length] if date_to else None
+        return [key for key in keys if (low is None or key >= low) and (high is None or key <= high)]
+
+    def query(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        if include_archive:
+            return super().query(kind, date_from, date_to, include_archive, **filters)
+        matches = record_filter(kind, date_from, date_to, **filters)
+        return [record
+                for key in self._overlapping(self.partitions(kind), date_from, date_to)
+                for record in self._cache(kind, key).get()
+                if matches(record)]
+
+    def iter_records(self, kind, date_from=None, date_to=None, include_archive=False, **filters):
+        matches = record_filter(kind, date_from, date_to, **filters)
+        paths = []
+        if include_archive:
+            paths += [self.archive_path(kind, key)
+                      for key in self._overlapping(self.archived_partitions(kind), date_from, date_to)]
+        paths += [self.partition_path(kind, key)
+                  for key in self._overlapping(self.partitions(kind), date_from, date_to)]
+        for path in paths:
+            for record in read_records(kind, path):
+                if matches(record):
+                    yield record
+
+    def sync(self, kind):
+        paths, self._unsynced[kind] = self._unsynced[kind], set()
+        for path in paths:
+            if os.path.exists(path):
+                fsync_file(path)
+
+    def archive(self, kind, keys):
+        """Переносит периоды keys в сжатый архив"""
+        with self._lock:
+            for key in keys:
+                compress_to_archive(self.partition_path(kind, key), self.archive_path(kind, key))
+                self.caches.pop((kind, key), None)
+            if keys:
+                self._generations[kind] += 1
+
+    def archive_closed(self, kind, keep=None):
+        """Архивирует все периоды, кроме текущего (и тех, где есть запись с keep(запись)); возвращает их ключи"""
+        current = datetime.now().strftime('%Y-%m-%d')[:self.key_length]
+        keys = [key for key in self.partitions(kind) if key < current]
+        if keep is not None:
+            keys = [key for key in keys if not any(keep(record) for record in self._cache(kind, key).get())]
+        self.archive(kind, keys)
+        return keys
+
+    def clear(self, kind):
+        self.archive(kind, self.partitions(kind))
+
+
+def open_storage(backend=DEFAULT_STORAGE, sales_file='sales_data.csv', podzakaz_file='podzakaz_data.csv',
+                 db_file='sales.db', data_dir='data'):
+    """Создает хранилище по имени: 'log', 'csv', 'partitioned' или 'sqlite' (с переносом истории из CSV при первом запуске)"""
+    if backend == 'log':
+        log_files = [os.path.splitext(path)[0] + '.log' for path in (sales_file, podzakaz_file)]
+        migrate_from = None
+        if (not all(os.path.exists(path) for path in log_files)
+                and (os.path.exists(sales_file) or os.path.exists(podzakaz_file))):
+            migrate_from = CsvStorage(sales_file, podzakaz_file)
+        return LogStorage(*log_files, migrate_from=migrate_from)
+    if backend == 'sqlite':
+        # Перенесена ли история, решает отметка в базе: прерванный перенос повторится, даже если файл базы уже есть
+        migrate_from = None
+        if os.path.exists(sales_file) or os.path.exists(podzakaz_file):
+            migrate_from = CsvStorage(sales_file, podzakaz_file)
+        return SqliteStorage(db_file, migrate_from=migrate_from)
+    if backend == 'partitioned':
+        return PartitionedCsvStorage(data_dir, legacy_files={SALES: sales_file, PODZAKAZ: podzakaz_file})
+    if backend == 'csv':
+        return CsvStorage(sales_file, podzakaz_file)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from records import parse_number
+from storage import PODZAKAZ, SALES, row_to_record
+
+# Тип записи в запросе к Web App: обычные заказы и подзаказы попадают в разные таблицы
+SHEETS_TYPES = {SALES: 'order', PODZAKAZ: 'podzakaz'}
+SHEETS_KINDS = {sheets_type: kind for kind, sheets_type in SHEETS_TYPES.items()}
+
+STATE_FILE = 'sync_state.json'
+
+# Поля данных Web App в порядке колонок CSV
+PAYLOAD_FIELDS = {
+    SALES: ['date', 'product', 'color', 'size', 'price', 'category', 'courier', 'courier_amount'],
+    PODZAKAZ: ['date', 'product', 'color', 'size', 'price', 'paid', 'remaining', 'client_link'],
+}
+
+
+def row_from_payload(kind, data):
+    """Строка истории (в порядке колонок CSV) из строки таблицы, полученной от Web App"""
+    row = []
+    for field in PAYLOAD_FIELDS[kind]:
+        value = data.get(field)
+        value = '' if value is None else str(value).strip()
+        if field == 'date':
+            # Таблица может вернуть дату в ISO-формате: 2024-05-01T10:00:00.000Z
+            value = value.replace('T', ' ')[:19]
+        row.append(value)
+    if kind == PODZAKAZ:
+        # Номер подзаказа сохраняется вместе со строкой, чтобы доплаты находили ее и на других кассах
+        row.append(str(data.get('order_id') or data.get('id') or ''))
+    return row
+
+
+def acks_file(state_file=STATE_FILE):
+    """Файл подтверждений журнала отправки рядом с состоянием сверки"""
+    return state_file + '.acks'
+
+
+def track_outbox(outbox, state_file=STATE_FILE):
+    """Записывает строки, которые журнал отправки доставил в таблицу, в файл подтверждений.
+
+    Сверка забирает этот файл и не отправляет такие строки второй раз. Файл
+    только дописывается, поэтому подтверждения может записывать любой процесс
+    (приложение, служба, импорт), а не только тот, что ведет сверку.
+    Строки, отклоненные Web App (файл отклоненных), тоже считаются
+    доставленными: повтор их не примет.
+    """
+    path = acks_file(state_file)
+
+    def on_sent(outcomes):
+        lines = [json.dumps([SHEETS_KINDS[entry['type']], entry['data'].get('id')], ensure_ascii=False)
+                 for entry, success, _ in outcomes
+                 if (success or entry.get('dead')) and entry['type'] in SHEETS_KINDS]
+        if not lines:
+            return
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    outbox.add_listener(on_sent)
+
+
+class SyncEngine:
+    """Двусторонняя сверка локальной истории с Google Таблицами.
+
+    Отправка: новые записи доставляет журнал отправки (SyncOutbox), а сверка
+    только досылает то, что в него не попало (например, импорт с --no-sheets).
+    Для каждого вида хранится отметка — сколько записей истории уже есть
+    в таблице, id и время последней из них. Подтверждения журнала
+    (track_outbox) сдвигают отметку, а записи после нее, которые журнал еще
+    отправляет или уже отправил, сверка пропускает — каждая строка уходит
+    в таблицу один раз (скрипт таблиц повторы не отсеивает).
+    Получение: Web App выдает строки, измененные после курсора; новые строки
+    дописываются в локальную историю, а доплаты по подзаказам — в журнал оплат.
+
+    Отметки и курсоры хранятся в JSON-файле, поэтому прерванная сверка
+    продолжается с того же места. sync() нужно вызывать в том же потоке,
+    что и сохранения (в приложении — в потоке сохранения), чтобы полученные
+    строки не перемешались с новыми записями.
+    """
+
+    def __init__(self, app, sheets_manager, state_file=STATE_FILE, batch_size=200, outbox=None):
+        self.app = app
+        self.sheets_manager = sheets_manager
+        self.state_file = state_file
+        self.batch_size = batch_size
+        # Журнал отправки (track_outbox должен быть подключен до его запуска): его записи сверка не досылает
+        self.outbox = outbox
+        self._lock = threading.Lock()
+        # Первый запуск: до сверки записи уже уходили в таблицу через журнал отправки
+        self._first_run = not os.path.exists(state_file)
+        self.state = self._load()
+        # Идентификаторы локальных записей (для сверки полученных строк) и сколько записей уже учтено
+        self._known = {SALES: set(), PODZAKAZ: set()}
+        self._known_count = {SALES: 0, PODZAKAZ: 0}
+
+    def _load(self):
+        state = {'push': {}, 'pull': {}, 'acked': {}, 'last_sync': None}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as file:
+                    state.update(json.load(file))
+            except Exception as e:
+                print(f"Ошибка загрузки состояния синхронизации: {e}")
+        for kind in (SALES, PODZAKAZ):
+            state['push'].setdefault(kind, {'position': 0, 'last_id': None})
+            state['pull'].setdefault(kind, None)
+            state['acked'].setdefault(kind, {})
+        return state
+
+    def _save(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def _history(self, kind):
+        return self.app.get_sales_history() if kind == SALES else self.app.get_podzakaz_history()
+
+    def _known_ids(self, kind, history):
+        if len(history) < self._known_count[kind]:
+            self._known[kind] = set()
+            self._known_count[kind] = 0
+        known = self._known[kind]
+        known.update(record.record_id() for record in history[self._known_count[kind]:])
+        self._known_count[kind] = len(history)
+        return known
+
+    def pending(self, kind):
+        """Сколько записей истории еще не подтверждено таблицей"""
+        return max(0, len(self._history(kind)) - self.state['push'][kind]['position'])
+
+    def _take_acks(self):
+        """Переносит подтверждения журнала отправки из файла подтверждений в состояние"""
+        path = acks_file(self.state_file)
+        taken = path + '.taken'
+        if not os.path.exists(taken):
+            if not os.path.exists(path):
+                return
+            try:
+                # Переименование, а не чтение с удалением: подтверждения, дописанные тем временем, не потеряются
+                os.replace(path, taken)
+            except OSError:
+                # Файл сейчас дописывает другой процесс (Windows) — заберем при следующей сверке
+                return
+        with open(taken, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    kind, record_id = json.loads(line)
+                except ValueError:
+                    # Оборванная при сбое последняя строка
+                    continue
+                if kind in self.state['acked'] and record_id:
+                    acked = self.state['acked'][kind]
+                    acked[record_id] = acked.get(record_id, 0) + 1
+        self._save()
+        os.remove(taken)
+
+    def _unsent(self, kind):
+        """Записи после отметки; если история изменилась не только дописыванием, отметка находится заново"""
+        mark = self.state['push'][kind]
+        position = mark['position']
+        _, records = self.app.history_since(kind, max(position - 1, 0))
+        if not position:
+            return records
+        if records and records[0].record_id() == mark['last_id']:
+            return records[1:]
+
+        # Очистка, архив, импорт задним числом: ищем последнюю отправленную запись,
+        # а если ее больше нет — пропускаем записи не новее нее (они уже в таблице)
+        history = self._history(kind)
+        position = next((index + 1 for index in range(len(history) - 1, -1, -1)
+                         if history[index].record_id() == mark['last_id']), None)
+        if position is None:
+            timestamp = mark.get('timestamp')
+            position = 0
+            while position < len(history) and (timestamp is None or history[position].timestamp <= timestamp):
+                position += 1
+        mark['position'] = position
+        if position:
+            mark['last_id'] = history[position - 1].record_id()
+            mark['timestamp'] = history[position - 1].timestamp
+        self._save()
+        return history[position:]
+
+    def _advance(self, kind, records):
+        """Сдвигает отметку через подряд идущие подтвержденные записи (records — записи после отметки)"""
+        mark = self.state['push'][kind]
+        acked = self.state['acked'][kind]
+        passed = 0
+        for record in records:
+            record_id = record.record_id()
+            if not acked.get(record_id):
+                break
+            acked[record_id] -= 1
+            mark['position'] += 1
+            mark['last_id'] = record_id
+            mark['timestamp'] = record.timestamp
+            passed += 1
+        # Подтверждения записей, оставшихся до отметки (например, при первом запуске), больше не нужны
+        remaining = Counter(record.record_id() for record in records[passed:])
+        self.state['acked'][kind] = {record_id: min(count, remaining[record_id])
+                                     for record_id, count in acked.items() if count and remaining[record_id]}
+        self._save()
+
+    def push(self, kind, result):
+        """Досылает записи после отметки, которых нет в журнале отправки; возвращает False, если отправка прервалась"""
+        records = self._unsent(kind)
+        acked = Counter(self.state['acked'][kind])
+        queued = self.outbox.pending_ids(SHEETS_TYPES[kind]) if self.outbox is not None else set()
+        missing = []
+        for record in records:
+            record_id = record.record_id()
+            if acked[record_id]:
+                acked[record_id] -= 1
+            elif record_id not in queued:
+                missing.append(record)
+
+        success = True
+        for offset in range(0, len(missing), self.batch_size):
+            chunk = missing[offset:offset + self.batch_size]
+            rows = [(SHEETS_TYPES[kind], self.app.sheets_payload(kind, record.to_row())) for record in chunk]
+            results = self.sheets_manager.save_batch(rows)
+            result['requests'] += 1
+
+            sent = 0
+            for ok, message in results:
+                if not ok:
+                    result['errors'].append(message)
+                    break
+                sent += 1
+            self._acknowledge(kind, [record.record_id() for record in chunk[:sent]])
+            result['pushed'] += sent
+            if sent < len(chunk):
+                success = False
+                break
+        self._advance(kind, records)
+        return success
+
+    def _acknowledge(self, kind, record_ids):
+        acked = self.state['acked'][kind]
+        for record_id in record_ids:
+            acked[record_id] = acked.get(record_id, 0) + 1
+        if record_ids:
+            self._save()
+
+    def pull(self, kind, result):
+        """Забирает изменения таблицы после курсора; возвращает False при ошибке"""
+        if not hasattr(self.sheets_manager, 'fetch_changes'):
+            return True
+        cursor = self.state['pull'][kind]
+        while True:
+            success, rows, next_cursor, has_more = self.sheets_manager.fetch_changes(
+                SHEETS_TYPES[kind], cursor, self.batch_size)
+            if not success:
+                if self.sheets_manager.changes_supported is not False:
+                    result['errors'].append("Не удалось получить изменения из Google Таблиц")
+                    return False
+                return True
+            result['requests'] += 1
+
+            self._apply(kind, rows, result)
+            cursor = self.state['pull'][kind] = next_cursor
+            self._save()
+            if not has_more or not rows:
+                return True
+
+    def _apply(self, kind, rows, result):
+        history = self._history(kind)
+        known = self._known_ids(kind, history)
+        new_rows = []
+        for data in rows:
+            record_id = data.get('id')
+            if record_id and record_id in known:
+                if kind == PODZAKAZ:
+                    self._apply_payment(record_id, data, result)
+                continue
+
+            row = row_from_payload(kind, data)
+            if not row[0] or not row[1]:
+                continue
+            local_id = row_to_record(kind, row).record_id()
+            if local_id in known:
+                continue
+            known.add(local_id)
+            new_rows.append(row)
+
+        if not new_rows:
+            return
+        self.app.import_rows(kind, new_rows, push_to_sheets=False)
+        result['pulled'] += len(new_rows)
+
+        # Полученные строки уже есть в таблице — отправлять их не нужно
+        history = self._history(kind)
+        self._acknowledge(kind, [record.record_id() for record in history[len(history) - len(new_rows):]])
+        self._known_count[kind] = len(history)
+
+    def _apply_payment(self, record_id, data, result):
+        # В таблице подзаказ оплачен больше, чем локально, — записываем разницу как доплату
+        ledger = self.app.payment_ledger()
+        balance = ledger.balance(record_id)
+        paid = parse_number(str(data.get('paid') or ''))
+        if balance is None or paid is None or paid <= balance.paid:
+            return
+        try:
+            ledger.add_payment(record_id, paid - balance.paid)
+            result['payments'] += 1
+        except ValueError as e:
+            result['errors'].append(f"Подзаказ {record_id}: {e}")
+
+    def sync(self):
+        """Отправляет новые записи и забирает изменения таблиц; возвращает счетчики сверки"""
+        result = {'pushed': 0, 'pulled': 0, 'payments': 0, 'requests': 0, 'errors': []}
+        with self._lock:
+            if self._first_run:
+                # Накопленную историю считаем отправленной, иначе первая сверка выгрузила бы ее целиком
+                for kind in (SALES, PODZAKAZ):
+                    history = self._history(kind)
+                    if history:
+                        self.state['push'][kind] = {'position': len(history), 'last_id': history[-1].record_id(),
+                                                    'timestamp': history[-1].timestamp}
+                self._first_run = False
+                self._save()
+            self._take_acks()
+            for kind in (SALES, PODZAKAZ):
+                if self.push(kind, result):
+                    self.pull(kind, result)
+            if not result['errors']:
+                self.state['last_sync'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self._save()
+        return result
@@ -0,0 +1,23 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from storage import HEADERS
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Тест в своей временной папке: приложение работает с файлами в текущей папке"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+
+    def write_csv(self, path, kind, rows):
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(HEADERS[kind])
+            writer.writerows(rows)
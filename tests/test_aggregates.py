@@ -0,0 +1,93 @@
+"""Итоги для карточек статистики (aggregates.py): обновление при сохранении и журнал изменений.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import json
+import os
+import unittest
+
+from aggregates import AggregateStore
+from records import PodzakazRecord, SaleRecord
+from storage import PODZAKAZ, SALES
+from tests import TempDirTestCase
+
+SALES_RECORDS = [
+    SaleRecord.from_row(['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', '']),
+    SaleRecord.from_row(['2024-05-01 12:00:00', 'Юбка', 'черный', 'S', '1500', 'Resale', 'Вася', '300']),
+    # Цена не разобралась — запись считается, но выручку не меняет
+    SaleRecord.from_row(['2024-05-02 11:00:00', 'Платье', 'белый', 'L', 'договорная', 'SET', 'Вася', '500']),
+]
+PODZAKAZ_RECORDS = [
+    PodzakazRecord.from_row(['2024-05-03 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1']),
+]
+
+
+class AggregateStoreTest(TempDirTestCase):
+    def test_totals_by_category_courier_and_day(self):
+        store = AggregateStore()
+        store.add(SALES, SALES_RECORDS[0])
+        store.add_many(SALES, SALES_RECORDS[1:])
+        store.add_many(PODZAKAZ, PODZAKAZ_RECORDS)
+
+        stats = store.get(SALES)
+        self.assertEqual((stats['count'], stats['revenue']), (3, 6500))
+        self.assertEqual(stats['categories'], {'SET': {'count': 2, 'revenue': 5000},
+                                               'Resale': {'count': 1, 'revenue': 1500}})
+        self.assertEqual(stats['couriers'], {'Вася': {'count': 2, 'revenue': 1500, 'payout': 800}})
+        self.assertEqual(stats['days']['2024-05-01'], {'count': 2, 'revenue': 6500})
+
+        podzakaz = store.get(PODZAKAZ)
+        self.assertEqual((podzakaz['count'], podzakaz['paid'], podzakaz['remaining']), (1, 5000, 15000))
+
+    def test_saved_totals_are_loaded_back(self):
+        store = AggregateStore()
+        # Первая запись создает файл итогов, следующие дописываются в журнал
+        store.add(SALES, SALES_RECORDS[0])
+        self.assertFalse(os.path.exists(store.journal_file))
+        store.add_many(SALES, SALES_RECORDS[1:])
+        self.assertTrue(os.path.exists(store.journal_file))
+
+        self.assertEqual(AggregateStore().get(SALES), store.get(SALES))
+
+    def test_journal_is_compacted_into_stats_file(self):
+        store = AggregateStore(compact_every=2)
+        for record in SALES_RECORDS:
+            store.add(SALES, record)
+        self.assertLessEqual(store._journal_size, 2)
+
+        with open('stats.json', encoding='utf-8') as file:
+            saved = json.load(file)
+        reloaded = AggregateStore(compact_every=2)
+        self.assertEqual(reloaded.get(SALES)['count'], 3)
+        self.assertEqual(reloaded.generation, saved['generation'])
+
+    def test_journal_of_previous_stats_file_is_ignored(self):
+        store = AggregateStore()
+        store.add(SALES, SALES_RECORDS[0])
+        store.add_many(SALES, SALES_RECORDS[1:])
+        with open(store.journal_file, encoding='utf-8') as file:
+            journal = file.read()
+
+        # Сбой между записью нового файла итогов и удалением старого журнала
+        store.rebuild(SALES, SALES_RECORDS[:1])
+        with open(store.journal_file, 'w', encoding='utf-8') as file:
+            file.write(journal + '{"оборванная строка')
+        self.assertEqual(AggregateStore().get(SALES)['count'], 1)
+
+    def test_rebuild_and_reset(self):
+        store = AggregateStore()
+        store.add_many(SALES, SALES_RECORDS)
+        store.rebuild(SALES, SALES_RECORDS[:2])
+        self.assertEqual(store.get(SALES)['count'], 2)
+        store.reset(SALES)
+        self.assertEqual(AggregateStore().get(SALES)['count'], 0)
+
+    def test_copy_does_not_change_totals(self):
+        store = AggregateStore()
+        store.add(SALES, SALES_RECORDS[0])
+        store.get(SALES)['categories']['SET']['count'] = 100
+        self.assertEqual(store.get(SALES)['categories']['SET']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Массовый импорт из CSV (bulk_import.py): проверка строк, повторы и запись пачками.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import unittest
+
+from bulk_import import import_csv, normalize_amount, normalize_date, normalize_row
+from sales_app import SalesApp
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['15.03.2024 10:05', 'Платье', 'красный', 'M', '5 000', 'SET', '', ''],
+    ['2024-03-16', 'Юбка', 'черный', 'S', '1500,50', 'Resale', 'Вася', '300'],
+    # Повтор первой строки после приведения к формату приложения
+    ['2024-03-15 10:05:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    ['31.02.2024', 'Платье', 'белый', 'L', '7000', 'SET', '', ''],
+    ['2024-03-17', 'Платье', 'белый', 'L', 'договорная', 'SET', '', ''],
+    ['2024-03-18', 'Пальто', 'серый', 'L', '9000', 'SET', '', ''],
+]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def enqueue_many(self, data_type, payloads):
+        self.sent.append((data_type, len(payloads)))
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_dates(self):
+        self.assertEqual(normalize_date('2024-03-15'), '2024-03-15 00:00:00')
+        self.assertEqual(normalize_date('15.03.2024 9:05'), '2024-03-15 09:05:00')
+        self.assertEqual(normalize_date('2024-3-5T10:00:30'), '2024-03-05 10:00:30')
+        self.assertIsNone(normalize_date('31.02.2024'))
+        self.assertIsNone(normalize_date('вчера'))
+
+    def test_amounts(self):
+        self.assertEqual(normalize_amount('1 500,50'), '1500.5')
+        self.assertEqual(normalize_amount('2000.0 ₸'), '2000')
+        self.assertEqual(normalize_amount(''), '')
+        self.assertIsNone(normalize_amount('-100'))
+        self.assertIsNone(normalize_amount('много'))
+
+    def test_rows(self):
+        self.assertEqual(normalize_row(SALES, SALE_ROWS[0]),
+                         ['2024-03-15 10:05:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''])
+        self.assertIsNone(normalize_row(SALES, SALE_ROWS[0][:7]))
+        self.assertIsNone(normalize_row(PODZAKAZ, ['2024-03-15', 'Пальто', 'серый', 'L', '', '0', '0', 'client']))
+
+
+class ImportCsvTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outbox = FakeOutbox()
+        self.app = SalesApp(outbox=self.outbox, storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+
+    def test_valid_rows_are_imported_in_chunks(self):
+        self.write_csv('import.csv', SALES, SALE_ROWS)
+        result = import_csv(self.app, 'import.csv', chunk_size=2)
+
+        self.assertEqual(result, {'imported': 3, 'duplicates': 1, 'invalid': 2})
+        self.assertEqual([record.product for record in self.app.get_sales_history()], ['Платье', 'Юбка', 'Пальто'])
+        self.assertEqual(self.app.get_statistics(SALES)['revenue'], 15500.5)
+        self.assertEqual(self.outbox.sent, [('order', 2), ('order', 1)])
+
+    def test_repeated_import_adds_nothing(self):
+        self.write_csv('import.csv', SALES, SALE_ROWS)
+        import_csv(self.app, 'import.csv', push_to_sheets=False)
+        result = import_csv(self.app, 'import.csv', push_to_sheets=False)
+        self.assertEqual(result, {'imported': 0, 'duplicates': 4, 'invalid': 2})
+        self.assertEqual(self.outbox.sent, [])
+
+    def test_podzakaz_without_header_gets_order_ids(self):
+        with open('import.csv', 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerow(['2024-03-15', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client'])
+
+        with self.assertRaises(ValueError):
+            import_csv(self.app, 'import.csv')
+        self.assertEqual(import_csv(self.app, 'import.csv', PODZAKAZ)['imported'], 1)
+
+        order = self.app.get_podzakaz_history()[0]
+        self.assertEqual(len(order.order_id), 16)
+        self.assertEqual(self.app.order_balance(order).remaining, 15000)
+
+
+if __name__ == '__main__':
+    unittest.main()
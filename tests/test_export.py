@@ -0,0 +1,77 @@
+"""Потоковое чтение истории (storage.read_records, iter_records) и выгрузка с отбором (export.py).
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import gzip
+import json
+import os
+import unittest
+from unittest import mock
+
+import export
+from storage import HEADERS, SALES, open_storage, read_records
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-04-30 18:00:00', 'Платье', 'красный', 'M', '5000', 'Resale', '', ''],
+    ['2024-05-01 10:00:00', 'Юбка', 'черный', 'S', '1500', 'Resale', 'Вася', '300'],
+    ['2024-05-02 11:00:00', 'Платье', 'белый', 'L', '7000', 'SET', 'Вася', '500'],
+    ['2024-05-31 23:59:59', 'Пальто', 'серый', 'L', '9000', 'Resale', '', ''],
+]
+
+
+class ReadRecordsTest(TempDirTestCase):
+    def test_plain_and_compressed_files_are_read_lazily(self):
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        with open('sales_data.csv', 'rb') as source, gzip.open('sales_data.csv.gz', 'wb') as target:
+            target.write(source.read())
+
+        for path in ('sales_data.csv', 'sales_data.csv.gz'):
+            with self.subTest(path=path):
+                records = read_records(SALES, path)
+                self.assertIs(iter(records), records)
+                self.assertEqual(next(records).to_row(), SALE_ROWS[0])
+                self.assertEqual([record.product for record in records], ['Юбка', 'Платье', 'Пальто'])
+
+    def test_iter_records_filters_while_reading(self):
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        storage = open_storage('csv')
+        records = storage.iter_records(SALES, '2024-05-01', '2024-05-31', category='Resale')
+        self.assertIs(iter(records), records)
+        self.assertEqual([record.product for record in records], ['Юбка', 'Пальто'])
+
+
+class ExportTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        patcher = mock.patch.dict(os.environ, {'SALES_STORAGE': 'csv'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_month_of_one_category_to_csv(self):
+        self.assertEqual(export.main(['resale.csv', '--month', '2024-05', '--category', 'Resale']), 0)
+        with open('resale.csv', newline='', encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows, [HEADERS[SALES], SALE_ROWS[1], SALE_ROWS[3]])
+
+    def test_courier_to_json(self):
+        export.main(['vasya.json', '--from', '2024-05-02', '--courier', 'Вася'])
+        with open('vasya.json', encoding='utf-8') as file:
+            exported = json.load(file)
+        self.assertEqual([(row['Товар'], row['Курьер']) for row in exported], [('Платье', 'Вася')])
+
+    def test_empty_selection_is_valid_json(self):
+        self.assertEqual(export.export_records(iter([]), SALES, 'empty.json'), 0)
+        with open('empty.json', encoding='utf-8') as file:
+            self.assertEqual(json.load(file), [])
+        with self.assertRaises(ValueError):
+            export.export_records([], SALES, 'out.xml', 'xml')
+
+    def test_month_bounds(self):
+        self.assertEqual(export.month_bounds('2024-02'), ('2024-02-01', '2024-02-29'))
+
+
+if __name__ == '__main__':
+    unittest.main()
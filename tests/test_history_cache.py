@@ -0,0 +1,101 @@
+"""Кэш истории из CSV (history_cache.py): дочитывание хвоста и перечитывание замененного файла.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import os
+import unittest
+
+from history_cache import HistoryCache
+from records import SaleRecord
+from storage import HEADERS, SALES
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    ['2024-05-02 11:00:00', 'Юбка', 'черный', 'S', '1500', 'SET', 'Вася', '300'],
+    ['2024-05-03 12:00:00', 'Платье', 'белый', 'L', '7000', 'SET', 'Вася', '500'],
+]
+
+
+def csv_line(row):
+    return ','.join(row) + '\r\n'
+
+
+class HistoryCacheTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS[:2])
+        self.parsed = []
+        self.cache = HistoryCache('sales_data.csv', HEADERS[SALES], self.parse_row)
+
+    def parse_row(self, row):
+        self.parsed.append(row)
+        return SaleRecord.from_row(row)
+
+    def append(self, text):
+        with open('sales_data.csv', 'a', newline='', encoding='utf-8') as file:
+            file.write(text)
+
+    def products(self):
+        return [record.product for record in self.cache.get()]
+
+    def test_only_appended_rows_are_parsed(self):
+        self.assertEqual(self.products(), ['Платье', 'Юбка'])
+        self.assertEqual(len(self.parsed), 2)
+
+        self.append(csv_line(SALE_ROWS[2]))
+        self.assertEqual(self.products(), ['Платье', 'Юбка', 'Платье'])
+        self.assertEqual(len(self.parsed), 3)
+
+        self.products()
+        self.assertEqual(len(self.parsed), 3)
+
+    def test_unfinished_line_waits_for_its_end(self):
+        self.products()
+        line = csv_line(SALE_ROWS[2])
+        self.append(line[:15])
+        self.assertEqual(len(self.products()), 2)
+        self.append(line[15:])
+        self.assertEqual(len(self.products()), 3)
+
+    def test_since_returns_new_records_of_same_generation(self):
+        generation, records = self.cache.since(0)
+        self.assertEqual(len(records), 2)
+        self.append(csv_line(SALE_ROWS[2]))
+        new_generation, records = self.cache.since(2)
+        self.assertEqual(new_generation, generation)
+        self.assertEqual([record.to_row() for record in records], SALE_ROWS[2:])
+
+    def test_cleared_or_replaced_file_is_read_again(self):
+        generation, _ = self.cache.since(0)
+
+        # Очистка истории: файл укорочен до заголовка
+        self.write_csv('sales_data.csv', SALES, [])
+        cleared, records = self.cache.since(0)
+        self.assertNotEqual(cleared, generation)
+        self.assertEqual(records, [])
+
+        # Файл заменен другим (новый inode)
+        self.write_csv('replacement.csv', SALES, SALE_ROWS[2:])
+        os.replace('replacement.csv', 'sales_data.csv')
+        replaced, records = self.cache.since(0)
+        self.assertNotEqual(replaced, cleared)
+        self.assertEqual([record.color for record in records], ['белый'])
+
+    def test_rewrite_with_same_size_is_noticed_by_mtime(self):
+        self.products()
+        stat = os.stat('sales_data.csv')
+        with open('sales_data.csv', 'r+', newline='', encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+            rows[1][2] = 'синий  '
+            file.seek(0)
+            csv.writer(file).writerows(rows)
+        self.assertEqual(os.path.getsize('sales_data.csv'), stat.st_size)
+        os.utime('sales_data.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual([record.color for record in self.cache.get()], ['синий  ', 'черный'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Страницы истории (main.HistoryView): карточки строятся один раз и обновляются по разнице.
+
+Нужен пакет flet; без него тесты пропускаются.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import importlib.util
+import time
+import unittest
+from unittest import mock
+
+from sales_app import SalesApp
+from storage import SALES, open_storage
+from tests import TempDirTestCase
+
+HAS_FLET = importlib.util.find_spec('flet') is not None
+if HAS_FLET:
+    import flet as ft
+
+    import main
+    from outbox import SyncOutbox
+
+
+class FakePage:
+    """Страница без окна: хранит элементы и считает обновления"""
+
+    def __init__(self):
+        self.controls = []
+        self.overlay = []
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+class AcceptingSheets:
+    """Таблицы, которые принимают все строки и не выдают изменений"""
+
+    changes_supported = False
+
+    def __init__(self, web_app_url):
+        self.web_app_url = web_app_url
+
+    def save_batch(self, rows):
+        return [(True, "ok")] * len(rows)
+
+    def save_to_sheets(self, data_type, data):
+        return True, "ok"
+
+    def fetch_changes(self, data_type, since=None, limit=500):
+        return False, [], since, False
+
+
+def walk(control):
+    yield control
+    for name in ('controls', 'content'):
+        value = getattr(control, name, None)
+        if isinstance(value, list):
+            for child in value:
+                yield from walk(child)
+        elif value is not None and not isinstance(value, str):
+            yield from walk(value)
+
+
+@unittest.skipUnless(HAS_FLET, "нужен пакет flet")
+class HistoryViewTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        app = SalesApp(storage=open_storage('log'))
+        app.import_rows(SALES, [[f'2024-05-01 10:{minute:02d}:00', f'Платье {minute}', 'красный', 'M', '5000',
+                                 'SET', '', ''] for minute in range(40)], push_to_sheets=False)
+        app.storage.close()
+
+        outboxes = []
+
+        class ClosingOutbox(SyncOutbox):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                outboxes.append(self)
+
+        for name, value in (('GoogleSheetsManager', AcceptingSheets), ('SyncOutbox', ClosingOutbox)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: [outbox.close() for outbox in outboxes])
+
+        self.page = FakePage()
+        main.main(self.page)
+
+    def controls(self, cls, predicate=lambda control: True):
+        return [control for root in self.page.controls if root.visible
+                for control in walk(root) if isinstance(control, cls) and predicate(control)]
+
+    def click(self, text):
+        button = self.controls((ft.ElevatedButton, ft.OutlinedButton), lambda button: button.text == text)[0]
+        button.on_click(None)
+
+    def cards(self):
+        return self.controls(ft.Card)
+
+    def stat(self, label):
+        cards = self.controls(ft.Container, lambda control: isinstance(control.content, ft.Column)
+                              and control.content.controls and getattr(control.content.controls[0], 'value', None) == label)
+        return cards[0].content.controls[1].value
+
+    def save_sale(self, product):
+        fields = {field.label: field for field in self.controls(ft.TextField)}
+        fields["Название товара"].value = product
+        fields["Цвет"].value = "синий"
+        fields["Размер"].value = "S"
+        fields["Цена"].value = "7000"
+        self.controls(ft.Dropdown)[0].value = "SET"
+        self.click("Сохранить")
+        result = self.controls(ft.Text, lambda text: (text.value or '').startswith("⏳ Сохранение"))[0]
+        deadline = time.monotonic() + 10
+        while result.value.startswith("⏳") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(result.value.startswith("✅"), result.value)
+
+    def test_switching_pages_keeps_the_cards(self):
+        self.click("История продаж")
+        cards = self.cards()
+        self.assertEqual(len(cards), main.HISTORY_PAGE_SIZE)
+        self.assertEqual(self.stat("Всего продаж"), "40")
+
+        self.click("Назад к добавлению заказов")
+        self.assertEqual(self.cards(), [])
+        self.click("История продаж")
+        self.assertEqual([id(card) for card in self.cards()], [id(card) for card in cards])
+
+    def test_new_save_inserts_only_its_card(self):
+        self.click("История продаж")
+        cards = self.cards()
+        self.click("Назад к добавлению заказов")
+
+        self.save_sale("Пиджак")
+        self.click("История продаж")
+        updated = self.cards()
+        self.assertEqual(len(updated), main.HISTORY_PAGE_SIZE + 1)
+        self.assertNotIn(id(updated[0]), [id(card) for card in cards])
+        self.assertEqual([id(card) for card in updated[1:]], [id(card) for card in cards])
+        self.assertEqual(self.stat("Всего продаж"), "41")
+
+
+if __name__ == '__main__':
+    unittest.main()
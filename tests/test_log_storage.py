@@ -0,0 +1,173 @@
+"""Журнал истории (append_log.py, LogStorage): восстановление хвоста, перенос из CSV и очистка.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import gzip
+import os
+import unittest
+
+from append_log import MAGIC, AppendLog, encode_row
+from storage import HEADERS, PODZAKAZ, SALES, CsvStorage, LogStorage, open_storage
+from tests import TempDirTestCase
+
+SALE = ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', '']
+# Сумма с пробелом разбирается в число, а в файле должна остаться как была
+SALE_SPACED = ['2024-05-02 11:00:00', 'Юбка', 'черный', 'S', '1 500', 'SET', 'Вася', '300']
+PODZAKAZ_ROW = ['2024-05-03 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1b2c3']
+
+
+class TornTailTest(TempDirTestCase):
+    def test_torn_record_is_cut_off(self):
+        log = AppendLog('sales_data.log')
+        log.open()
+        log.append([SALE])
+        log.close()
+        with open('sales_data.log', 'ab') as file:
+            # Сбой посреди записи: половина строки без перевода строки
+            file.write(encode_row(SALE_SPACED)[:20])
+
+        log = AppendLog('sales_data.log')
+        log.open()
+        self.assertEqual(log.truncated, 20)
+        log.append([SALE_SPACED])
+        self.assertEqual(log.read(), [SALE, SALE_SPACED])
+        log.close()
+
+    def test_record_with_bad_checksum_at_the_end_is_cut_off(self):
+        log = AppendLog('sales_data.log')
+        log.open()
+        log.append([SALE, SALE_SPACED])
+        log.close()
+        with open('sales_data.log', 'r+b') as file:
+            # Портим последний байт данных последней записи (перед переводом строки)
+            file.seek(-2, os.SEEK_END)
+            file.write(b'#')
+
+        log = AppendLog('sales_data.log')
+        log.open()
+        self.assertEqual(log.truncated, len(encode_row(SALE_SPACED)))
+        self.assertEqual(log.read(), [SALE])
+        log.close()
+
+    def test_only_the_owner_cuts_the_tail(self):
+        owner = AppendLog('sales_data.log')
+        owner.open()
+        owner.append([SALE])
+        with open('sales_data.log', 'ab') as file:
+            # Владелец как раз дописывает запись
+            file.write(encode_row(SALE_SPACED)[:20])
+        size = os.path.getsize('sales_data.log')
+
+        reader = AppendLog('sales_data.log')
+        reader.open()
+        self.assertFalse(reader.owner)
+        self.assertEqual(reader.truncated, 0)
+        self.assertEqual(os.path.getsize('sales_data.log'), size)
+        self.assertEqual(reader.read(), [SALE])
+        reader.close()
+        owner.close()
+
+        # Владелец завершился, не дописав запись, — хвост отрезает следующий владелец
+        log = AppendLog('sales_data.log')
+        log.open()
+        self.assertTrue(log.owner)
+        self.assertEqual(log.truncated, 20)
+        log.close()
+
+    def test_second_storage_does_not_cut_the_tail(self):
+        storage = open_storage('log')
+        self.addCleanup(storage.close)
+        storage.append(SALES, SALE)
+        with open('sales_data.log', 'ab') as file:
+            file.write(encode_row(SALE_SPACED)[:20])
+
+        other = open_storage('log')
+        other.close()
+        self.assertEqual(list(AppendLog('sales_data.log').iter_rows()), [SALE])
+        with open('sales_data.log', 'rb') as file:
+            self.assertTrue(file.read().endswith(encode_row(SALE_SPACED)[:20]))
+
+    def test_not_a_log_is_rejected(self):
+        with open('sales_data.log', 'wb') as file:
+            file.write(b'garbage\n')
+        with self.assertRaises(ValueError):
+            AppendLog('sales_data.log').open()
+
+
+class MigrationTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_csv('sales_data.csv', SALES, [SALE, SALE_SPACED])
+        self.write_csv('podzakaz_data.csv', PODZAKAZ, [PODZAKAZ_ROW])
+
+    def test_csv_rows_are_copied_as_is(self):
+        storage = open_storage('log')
+        self.addCleanup(storage.close)
+        self.assertEqual(list(storage.logs[SALES].iter_rows()), [SALE, SALE_SPACED])
+        self.assertEqual(list(storage.logs[PODZAKAZ].iter_rows()), [PODZAKAZ_ROW])
+        self.assertEqual([record.product for record in storage.load(SALES)], ['Платье', 'Юбка'])
+
+    def test_interrupted_migration_is_repeated(self):
+        def failing_rows(kind, path):
+            yield SALE
+            raise OSError("сбой во время переноса")
+
+        import storage as storage_module
+        original = storage_module.read_rows
+        storage_module.read_rows = failing_rows
+        try:
+            with self.assertRaises(OSError):
+                LogStorage(migrate_from=CsvStorage())
+        finally:
+            storage_module.read_rows = original
+        # Недописанный перенос не оставляет журнал, который выглядел бы перенесенным
+        self.assertFalse(os.path.exists('sales_data.log'))
+
+        storage = open_storage('log')
+        self.addCleanup(storage.close)
+        self.assertEqual(list(storage.logs[SALES].iter_rows()), [SALE, SALE_SPACED])
+        self.assertEqual(list(storage.logs[PODZAKAZ].iter_rows()), [PODZAKAZ_ROW])
+
+    def test_existing_log_is_not_migrated_again(self):
+        storage = open_storage('log')
+        storage.append(SALES, SALE)
+        storage.close()
+
+        storage = open_storage('log')
+        self.addCleanup(storage.close)
+        self.assertEqual(len(storage.load(SALES)), 3)
+
+
+class ClearTest(TempDirTestCase):
+    def test_clear_archives_log_rows_as_is(self):
+        storage = LogStorage()
+        self.addCleanup(storage.close)
+        storage.append_many(SALES, [SALE, SALE_SPACED])
+        storage.append(PODZAKAZ, PODZAKAZ_ROW)
+
+        storage.clear(SALES)
+
+        self.assertEqual(storage.load(SALES), [])
+        with open('sales_data.log', 'rb') as file:
+            self.assertEqual(file.read(), MAGIC)
+        archives = storage.archive_files(SALES)
+        self.assertEqual(len(archives), 1)
+        with gzip.open(archives[0], 'rt', newline='', encoding='utf-8') as file:
+            self.assertEqual(list(csv.reader(file)), [HEADERS[SALES], SALE, SALE_SPACED])
+        # Другой вид записей очистка не трогает
+        self.assertEqual(len(storage.load(PODZAKAZ)), 1)
+
+        storage.append(SALES, SALE)
+        self.assertEqual(len(storage.load(SALES)), 1)
+        self.assertEqual(len(storage.query(SALES, include_archive=True)), 3)
+
+    def test_clear_of_empty_log_writes_no_archive(self):
+        storage = LogStorage()
+        self.addCleanup(storage.close)
+        storage.clear(SALES)
+        self.assertEqual(storage.archive_files(SALES), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
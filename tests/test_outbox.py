@@ -0,0 +1,165 @@
+"""Журнал отправки в Google Таблицы (outbox.py): повторы, отклоненные строки и сбои отправки.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import json
+import os
+import threading
+import unittest
+
+from outbox import Rejected, SyncOutbox
+from tests import TempDirTestCase
+
+
+class ScriptedSheets:
+    """Менеджер таблиц, который отвечает на пакеты по очереди заданными ответами.
+
+    Ответ — список (успех, сообщение), функция от пакета или исключение.
+    Когда ответы заканчиваются, все строки принимаются.
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.batches = []
+
+    def save_batch(self, rows):
+        self.batches.append(rows)
+        answer = self.answers.pop(0) if self.answers else None
+        if answer is None:
+            return [(True, "ok")] * len(rows)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer(rows) if callable(answer) else answer
+
+    def save_to_sheets(self, data_type, data):
+        return self.save_batch([(data_type, data)])[0]
+
+
+class OutboxTestCase(TempDirTestCase):
+    def make_outbox(self, sheets, **options):
+        options = {'base_delay': 0.01, 'max_delay': 0.05, 'batch_max_age': 0, **options}
+        outbox = SyncOutbox(sheets, **options)
+        self.addCleanup(outbox.close)
+        return outbox
+
+    def wait_outcomes(self, outbox, count):
+        """Запускает отправку и ждет count вызовов подписчика; возвращает их итоги"""
+        calls = []
+        done = threading.Event()
+
+        def on_result(outcomes):
+            calls.append(outcomes)
+            if len(calls) >= count:
+                done.set()
+
+        outbox.add_listener(on_result)
+        outbox.start()
+        self.assertTrue(done.wait(10), "отправка не завершилась")
+        outbox.stop(5)
+        return calls
+
+
+class RetryTest(OutboxTestCase):
+    def test_network_error_is_retried_until_delivered(self):
+        sheets = ScriptedSheets(lambda rows: [(False, "нет связи")] * len(rows))
+        outbox = self.make_outbox(sheets)
+        outbox.enqueue('order', {'id': 'a'})
+        calls = self.wait_outcomes(outbox, 2)
+
+        self.assertFalse(calls[0][0][1])
+        self.assertTrue(calls[1][0][1])
+        self.assertEqual(outbox.pending_count(), 0)
+        self.assertEqual(outbox.last_error, "")
+        self.assertFalse(os.path.exists('sync_outbox.jsonl'))
+
+    def test_exception_in_send_fails_whole_batch_and_is_retried(self):
+        sheets = ScriptedSheets(ConnectionError("обрыв"))
+        outbox = self.make_outbox(sheets)
+        outbox.enqueue_many('order', [{'id': 'a'}, {'id': 'b'}])
+        calls = self.wait_outcomes(outbox, 2)
+
+        self.assertEqual([success for _, success, _ in calls[0]], [False, False])
+        self.assertIn("обрыв", calls[0][0][2])
+        self.assertEqual([success for _, success, _ in calls[1]], [True, True])
+        self.assertEqual(outbox.pending_count(), 0)
+
+    def test_short_answer_leaves_unanswered_rows_pending(self):
+        sheets = ScriptedSheets([(True, "ok")])
+        outbox = self.make_outbox(sheets)
+        outbox.enqueue_many('order', [{'id': 'a'}, {'id': 'b'}])
+        calls = self.wait_outcomes(outbox, 2)
+
+        self.assertEqual([success for _, success, _ in calls[0]], [True, False])
+        self.assertEqual([entry['data']['id'] for entry, _, _ in calls[1]], ['b'])
+        self.assertEqual(len(sheets.batches), 2)
+
+    def test_pending_rows_survive_restart(self):
+        outbox = SyncOutbox(ScriptedSheets())
+        outbox.enqueue('order', {'id': 'a'})
+        outbox.close()
+
+        outbox = self.make_outbox(ScriptedSheets())
+        self.assertEqual(outbox.pending_ids('order'), {'a'})
+
+
+class DeadLetterTest(OutboxTestCase):
+    def reject(self, rows):
+        return [(False, Rejected("неверная строка"))] * len(rows)
+
+    def test_row_rejected_max_times_goes_to_dead_file(self):
+        sheets = ScriptedSheets(self.reject, self.reject)
+        outbox = self.make_outbox(sheets, max_rejections=2)
+        outbox.enqueue('order', {'id': 'a'})
+        calls = self.wait_outcomes(outbox, 2)
+
+        entry = calls[1][0][0]
+        self.assertTrue(entry.get('dead'))
+        self.assertEqual(outbox.dead_count, 1)
+        self.assertEqual(outbox.pending_count(), 0)
+        with open(outbox.dead_file, encoding='utf-8') as file:
+            dead = [json.loads(line) for line in file]
+        self.assertEqual([row['data'] for row in dead], [{'id': 'a'}])
+        self.assertEqual(dead[0]['error'], "неверная строка")
+
+    def test_rejections_are_counted_across_restarts(self):
+        outbox = self.make_outbox(ScriptedSheets(self.reject), max_rejections=2)
+        outbox.enqueue('order', {'id': 'a'})
+        self.wait_outcomes(outbox, 1)
+        outbox.close()
+
+        # После перезапуска одного отказа достаточно: первый записан в журнал
+        outbox = self.make_outbox(ScriptedSheets(self.reject), max_rejections=2)
+        self.assertEqual(outbox._pending[0]['rejections'], 1)
+        calls = self.wait_outcomes(outbox, 1)
+        self.assertTrue(calls[0][0][0].get('dead'))
+        self.assertEqual(outbox.pending_count(), 0)
+
+
+class ListenerTest(OutboxTestCase):
+    def test_listener_runs_before_journal_is_removed(self):
+        outbox = self.make_outbox(ScriptedSheets())
+        seen = []
+        outbox.add_listener(lambda outcomes: seen.append(os.path.exists('sync_outbox.jsonl')))
+        outbox.enqueue('order', {'id': 'a'})
+        self.wait_outcomes(outbox, 1)
+
+        self.assertEqual(seen, [True])
+        self.assertFalse(os.path.exists('sync_outbox.jsonl'))
+
+    def test_listener_error_is_reported_in_last_error(self):
+        outbox = self.make_outbox(ScriptedSheets())
+
+        def broken(outcomes):
+            raise ValueError("сломан")
+
+        outbox.add_listener(broken)
+        outbox.enqueue('order', {'id': 'a'})
+        self.wait_outcomes(outbox, 1)
+
+        self.assertEqual(outbox.handler_errors, 1)
+        self.assertIn("сломан", outbox.last_error)
+        self.assertEqual(outbox.pending_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Журнал доплат по подзаказам (payments.py) и выгрузка подзаказов с номером (export.py).
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import csv
+import json
+import unittest
+
+from export import export_records
+from payments import PaymentLedger
+from records import PodzakazRecord
+from tests import TempDirTestCase
+
+ORDERS = [
+    PodzakazRecord.from_row(['2024-05-01 10:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'anna', 'p1']),
+    PodzakazRecord.from_row(['2024-05-02 11:00:00', 'Куртка', 'синий', 'M', '9000', '9000', '0', 'anna', 'p2']),
+    PodzakazRecord.from_row(['2024-05-03 12:00:00', 'Платье', 'белый', 'S', '7000', '2000', '5000', 'olga', 'p3']),
+]
+
+
+class LedgerTest(TempDirTestCase):
+    def make_ledger(self, orders=ORDERS):
+        ledger = PaymentLedger()
+        ledger.ensure_loaded(lambda: list(orders))
+        return ledger
+
+    def test_balances_from_history(self):
+        ledger = self.make_ledger()
+        self.assertEqual(ledger.receivables, 20000)
+        self.assertEqual(ledger.total_paid, 16000)
+        self.assertEqual(ledger.client_balance('anna'), 15000)
+        self.assertEqual([balance.order_id for balance in ledger.list_open()], ['p3', 'p1'])
+        self.assertEqual([balance.order_id for balance in ledger.list_open('olga')], ['p3'])
+
+    def test_payment_updates_balances_and_survives_reload(self):
+        ledger = self.make_ledger()
+        balance = ledger.add_payment('p1', '10000')
+        self.assertEqual((balance.paid, balance.remaining), (15000, 5000))
+        ledger.add_payment('p1', 5000)
+        self.assertEqual(ledger.receivables, 5000)
+        self.assertEqual(ledger.client_balance('anna'), 0)
+        self.assertEqual([balance.order_id for balance in ledger.list_open()], ['p3'])
+
+        # Доплаты читаются из журнала на диске поверх сохраненных строк подзаказов
+        reloaded = self.make_ledger()
+        self.assertEqual((reloaded.balance('p1').paid, reloaded.balance('p1').remaining), (20000, 0))
+        self.assertEqual(reloaded.receivables, 5000)
+
+    def test_invalid_payments_are_refused(self):
+        ledger = self.make_ledger()
+        with self.assertRaises(ValueError):
+            ledger.add_payment('p3', '6000')
+        with self.assertRaises(ValueError):
+            ledger.add_payment('p3', '0')
+        with self.assertRaises(KeyError):
+            ledger.add_payment('missing', '100')
+        self.assertEqual(ledger.receivables, 20000)
+
+    def test_order_saved_after_load_is_counted_once(self):
+        ledger = self.make_ledger(ORDERS[:2])
+        ledger.add_orders([ORDERS[2], ORDERS[2]])
+        self.assertEqual(ledger.receivables, 20000)
+
+    def test_invalidated_index_is_rebuilt_from_history(self):
+        ledger = self.make_ledger(ORDERS[:2])
+        ledger.invalidate()
+        ledger.ensure_loaded(lambda: list(ORDERS))
+        self.assertEqual(ledger.balance('p3').remaining, 5000)
+
+
+class ExportTest(TempDirTestCase):
+    def test_csv_export_keeps_order_id(self):
+        old = PodzakazRecord.from_row(ORDERS[0].to_row()[:8])
+        self.assertEqual(export_records(ORDERS[:1] + [old], 'podzakaz', 'out.csv'), 2)
+        with open('out.csv', newline='', encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0][-1], 'Номер подзаказа')
+        self.assertEqual(rows[1], ORDERS[0].to_row())
+        self.assertEqual(rows[2], ORDERS[0].to_row()[:8] + [''])
+
+    def test_json_export_keeps_order_id(self):
+        export_records(ORDERS[:1], 'podzakaz', 'out.json')
+        with open('out.json', encoding='utf-8') as file:
+            exported = json.load(file)
+        self.assertEqual(exported[0]['Номер подзаказа'], 'p1')
+        self.assertEqual(exported[0]['Связь с клиентом'], 'anna')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Записи истории (records.py): разбор строк, исходный текст неразобранных полей и идентификаторы.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import unittest
+from decimal import Decimal
+
+from records import PodzakazRecord, Record, SaleRecord, parse_number, parse_timestamp
+
+SALE = ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', 'Вася', '300']
+PODZAKAZ = ['2024-05-03 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1b2c3']
+
+
+class ParseTest(unittest.TestCase):
+    def test_numbers(self):
+        self.assertEqual(parse_number('5000'), 5000)
+        self.assertEqual(parse_number('1 500'), 1500)
+        self.assertEqual(parse_number('12,50'), Decimal('12.5'))
+        self.assertIsNone(parse_number(''))
+        self.assertIsNone(parse_number('1 500 тг'))
+        self.assertIsNone(parse_number('nan'))
+
+    def test_timestamp(self):
+        self.assertEqual(parse_timestamp('1970-01-02 00:00:01'), 86401)
+        self.assertEqual(parse_timestamp('15.03.2024 10:00'), 0)
+
+
+class RecordTest(unittest.TestCase):
+    def test_base_record_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Record()
+
+    def test_rows_round_trip(self):
+        sale = SaleRecord.from_row(SALE)
+        self.assertEqual(sale.price, 5000)
+        self.assertEqual(sale.courier_amount, 300)
+        self.assertEqual(sale.to_row(), SALE)
+
+        podzakaz = PodzakazRecord.from_row(PODZAKAZ)
+        self.assertEqual((podzakaz.paid, podzakaz.remaining), (5000, 15000))
+        self.assertEqual(podzakaz.to_row(), PODZAKAZ)
+
+    def test_unparsed_fields_keep_their_text(self):
+        row = ['15.03.2024 10:00', 'Юбка', 'черный', 'S', '1 500 тг', 'SET', '', '']
+        record = SaleRecord.from_row(row)
+        self.assertEqual(record.timestamp, 0)
+        self.assertIsNone(record.price)
+        self.assertEqual(record.date, '15.03.2024 10:00')
+        self.assertEqual(record.to_row(), row)
+
+    def test_record_id(self):
+        self.assertEqual(SaleRecord.from_row(SALE).record_id(), SaleRecord.from_row(list(SALE)).record_id())
+        self.assertNotEqual(SaleRecord.from_row(SALE).record_id(),
+                            SaleRecord.from_row(SALE[:4] + ['5001'] + SALE[5:]).record_id())
+        # Номер подзаказа — его идентификатор; у старых строк без номера — хэш строки
+        self.assertEqual(PodzakazRecord.from_row(PODZAKAZ).record_id(), 'a1b2c3')
+        old = PodzakazRecord.from_row(PODZAKAZ[:8])
+        self.assertEqual(old.to_row(), PODZAKAZ[:8])
+        self.assertEqual(len(old.record_id()), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Отчеты (reports.py): выручка по периодам и сводка за период по колонкам истории.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import unittest
+from datetime import date
+
+from reports import ReportEngine
+from sales_app import SalesApp
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-04-30 18:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    ['2024-05-01 10:00:00', 'Юбка', 'черный', 'S', '1500', 'Без категории', 'Вася', '300'],
+    ['2024-05-02 11:00:00', 'Платье', 'белый', 'L', '7000', 'SET', 'Вася', '500'],
+    ['2024-05-20 12:00:00', 'Платье', 'красный', 'M', '6000', 'SET', 'Петя', '400'],
+]
+PODZAKAZ_ROWS = [
+    ['2024-04-29 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1b2c3'],
+    ['2024-05-03 12:00:00', 'Куртка', 'синий', 'M', '9000', '9000', '0', 'other', 'd4e5f6'],
+]
+
+
+class ReportTestCase(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = SalesApp(storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+        self.reports = ReportEngine(self.app)
+
+    def add(self, kind, rows):
+        self.app.import_rows(kind, rows, push_to_sheets=False)
+
+
+class RevenueByPeriodTest(ReportTestCase):
+    def test_months_and_weeks(self):
+        self.add(SALES, SALE_ROWS)
+        self.assertEqual(self.reports.revenue_by_period('month'), [
+            {'period': '2024-04', 'count': 1, 'revenue': 5000},
+            {'period': '2024-05', 'count': 3, 'revenue': 14500},
+        ])
+        self.assertEqual([row['period'] for row in self.reports.revenue_by_period('week')],
+                         ['2024-W18', '2024-W21'])
+        self.assertEqual(self.reports.revenue_by_period('month', PODZAKAZ), [])
+
+    def test_backdated_records_update_cached_period(self):
+        self.add(SALES, SALE_ROWS[2:])
+        self.assertEqual(self.reports.revenue_by_period('month'), [{'period': '2024-05', 'count': 2, 'revenue': 13000}])
+
+        # Импорт задним числом: записи дописываются не по порядку дат
+        self.add(SALES, SALE_ROWS[:2])
+        self.assertEqual(self.reports.revenue_by_period('month'), [
+            {'period': '2024-04', 'count': 1, 'revenue': 5000},
+            {'period': '2024-05', 'count': 3, 'revenue': 14500},
+        ])
+
+
+class SummaryTest(ReportTestCase):
+    def expected_may(self):
+        return {
+            'date_from': '2024-05-01',
+            'date_to': '2024-05-31',
+            'count': 3,
+            'revenue': 14500,
+            'top_products': [{'name': 'Платье', 'count': 2, 'revenue': 13000},
+                             {'name': 'Юбка', 'count': 1, 'revenue': 1500}],
+            'top_colors': [{'name': 'белый', 'count': 1, 'revenue': 7000},
+                           {'name': 'красный', 'count': 1, 'revenue': 6000},
+                           {'name': 'черный', 'count': 1, 'revenue': 1500}],
+            'top_sizes': [{'name': 'L', 'count': 1, 'revenue': 7000},
+                          {'name': 'M', 'count': 1, 'revenue': 6000},
+                          {'name': 'S', 'count': 1, 'revenue': 1500}],
+            'categories': {'SET': {'count': 2, 'revenue': 13000},
+                           'Без категории': {'count': 1, 'revenue': 1500}},
+            'couriers': [{'name': 'Вася', 'count': 2, 'payout': 800, 'revenue': 8500},
+                         {'name': 'Петя', 'count': 1, 'payout': 400, 'revenue': 6000}],
+        }
+
+    def test_month_report(self):
+        self.add(SALES, SALE_ROWS)
+        self.assertEqual(self.reports.month_report(2024, 5), self.expected_may())
+
+    def test_out_of_order_history_gives_same_report(self):
+        self.add(SALES, SALE_ROWS[::-1])
+        self.assertEqual(self.reports.month_report(2024, 5), self.expected_may())
+        self.assertEqual(self.reports.summary(date(2024, 4, 30), date(2024, 5, 1))['revenue'], 6500)
+
+    def test_podzakaz_summary(self):
+        self.add(PODZAKAZ, PODZAKAZ_ROWS)
+        report = self.reports.summary(date(2024, 4, 1), date(2024, 5, 31), PODZAKAZ)
+        self.assertEqual((report['count'], report['revenue'], report['paid'], report['remaining']),
+                         (2, 29000, 14000, 15000))
+        self.assertNotIn('couriers', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Сохранение записей (sales_app.SalesApp): запись в хранилище и сбои после нее.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import unittest
+from unittest import mock
+
+from sales_app import SAVED_MESSAGES, SalesApp
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE = ('Платье', 'красный', 'M', '5000', 'SET', 'Вася', '300')
+PODZAKAZ_VALUES = ('Пальто', 'серый', 'L', '20000', '5000', '15000', 'client')
+
+
+class FakeSheets:
+    def __init__(self, answer=(True, "ok")):
+        self.answer = answer
+        self.sent = []
+
+    def save_to_sheets(self, data_type, data):
+        self.sent.append((data_type, data))
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+
+class SaveTestCase(TempDirTestCase):
+    def make_app(self, **options):
+        app = SalesApp(storage=open_storage('log'), **options)
+        self.addCleanup(app.storage.close)
+        return app
+
+
+class SaveTest(SaveTestCase):
+    def test_saved_row_is_stored_counted_and_sent(self):
+        sheets = FakeSheets()
+        app = self.make_app(sheets_manager=sheets)
+        self.assertEqual(app.save_sale(*SALE), (True, SAVED_MESSAGES[SALES][1]))
+        self.assertEqual(app.save_podzakaz(*PODZAKAZ_VALUES), (True, SAVED_MESSAGES[PODZAKAZ][1]))
+
+        self.assertEqual(app.get_statistics(SALES)['count'], 1)
+        order = app.get_podzakaz_history()[0]
+        self.assertEqual(app.order_balance(order).remaining, 15000)
+        self.assertEqual([data_type for data_type, _ in sheets.sent], ['order', 'podzakaz'])
+        self.assertEqual(sheets.sent[1][1]['order_id'], order.record_id())
+
+    def test_without_sheets_row_is_saved_locally(self):
+        app = self.make_app()
+        self.assertEqual(app.save_sale(*SALE), (True, SAVED_MESSAGES[SALES][2]))
+
+
+class SaveFailureTest(SaveTestCase):
+    def test_storage_failure_is_a_failed_save(self):
+        sheets = FakeSheets()
+        app = self.make_app(sheets_manager=sheets)
+        with mock.patch.object(app.storage, 'append', side_effect=OSError("диск заполнен")):
+            success, message = app.save_sale(*SALE)
+        self.assertFalse(success)
+        self.assertIn("диск заполнен", message)
+        self.assertEqual(sheets.sent, [])
+        self.assertEqual(app.get_statistics(SALES)['count'], 0)
+
+    def test_sheets_failure_keeps_the_local_row(self):
+        for answer in ((False, "нет связи"), ConnectionError("обрыв")):
+            with self.subTest(answer=answer):
+                app = self.make_app(sheets_manager=FakeSheets(answer))
+                success, message = app.save_sale(*SALE)
+                # Запись уже в истории: повторное сохранение задвоило бы ее
+                self.assertTrue(success)
+                self.assertTrue(message.startswith("⚠"))
+                app.clear_history(app.csv_file)
+
+    def test_index_failures_do_not_fail_the_save(self):
+        app = self.make_app()
+        app.get_statistics(SALES)
+        app.payment_ledger()
+        with mock.patch.object(app.stats, 'add_many', side_effect=ValueError("итоги")), \
+                mock.patch.object(app.payments, 'add_orders', side_effect=ValueError("остатки")):
+            self.assertTrue(app.save_sale(*SALE)[0])
+            self.assertTrue(app.save_podzakaz(*PODZAKAZ_VALUES)[0])
+
+        # Итоги и остатки сверяются с историей при следующем обращении
+        self.assertEqual(app.get_statistics(SALES)['count'], 1)
+        self.assertEqual(app.payment_ledger().receivables, 15000)
+
+
+if __name__ == '__main__':
+    unittest.main()
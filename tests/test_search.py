@@ -0,0 +1,79 @@
+"""Поиск по истории (search.py): слова, даты и подзаказы с остатком к оплате.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import unittest
+from datetime import date
+
+from sales_app import SalesApp
+from search import SearchIndex
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-05-02 11:00:00', 'Платье', 'белый', 'L', '7000', 'SET', 'Вася', '500'],
+    # Импорт старых продаж дописывает их после новых
+    ['2024-04-30 18:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    ['2024-05-01 10:00:00', 'Юбка', 'черный', 'S', '1500', 'Без категории', 'Вася', '300'],
+]
+PODZAKAZ_ROWS = [
+    ['2024-04-29 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', '+77010000001', 'a1b2c3'],
+    ['2024-05-03 12:00:00', 'Куртка', 'синий', 'M', '9000', '9000', '0', '+77010000002', 'd4e5f6'],
+]
+
+
+class SearchTestCase(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = SalesApp(storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+        self.app.import_rows(SALES, SALE_ROWS, push_to_sheets=False)
+        self.app.import_rows(PODZAKAZ, PODZAKAZ_ROWS, push_to_sheets=False)
+        self.index = SearchIndex(self.app)
+
+    def products(self, kind, *args, **options):
+        return [record.product for record in self.index.search(kind, *args, **options)]
+
+
+class TextSearchTest(SearchTestCase):
+    def test_words_match_by_prefix_newest_first(self):
+        self.assertEqual(self.products(SALES, 'плат'), ['Платье', 'Платье'])
+        self.assertEqual(self.products(SALES, 'плат бел'), ['Платье'])
+        self.assertEqual(self.products(SALES, courier='вася'), ['Юбка', 'Платье'])
+        self.assertEqual(self.products(PODZAKAZ, client='+7701000000'), ['Куртка', 'Пальто'])
+        self.assertEqual(self.products(SALES, 'пальто'), [])
+
+    def test_new_records_are_found(self):
+        self.products(SALES, 'юбка')
+        self.app.import_rows(SALES, [['2024-05-04 09:00:00', 'Юбка', 'серый', 'M', '1800', 'SET', '', '']],
+                             push_to_sheets=False)
+        self.assertEqual(self.products(SALES, 'юбка'), ['Юбка', 'Юбка'])
+
+
+class DateSearchTest(SearchTestCase):
+    def test_out_of_order_history(self):
+        self.assertEqual(self.products(SALES, date_from=date(2024, 5, 1)), ['Юбка', 'Платье'])
+        self.assertEqual(self.products(SALES, date_to=date(2024, 4, 30)), ['Платье'])
+        self.assertEqual(self.products(SALES, 'плат', date(2024, 4, 1), date(2024, 4, 30)), ['Платье'])
+        self.assertEqual(self.products(SALES, date_from=date(2024, 6, 1)), [])
+
+    def test_records_appended_after_query_are_in_range(self):
+        self.products(SALES, date_from=date(2024, 5, 1))
+        self.app.import_rows(SALES, [['2024-04-15 09:00:00', 'Юбка', 'серый', 'M', '1800', 'SET', '', '']],
+                             push_to_sheets=False)
+        self.assertEqual(self.products(SALES, date_to=date(2024, 4, 30)), ['Юбка', 'Платье'])
+
+
+class UnpaidSearchTest(SearchTestCase):
+    def test_unpaid_follows_payments(self):
+        self.assertEqual(self.products(PODZAKAZ, unpaid=True), ['Пальто'])
+        self.assertEqual(self.products(PODZAKAZ, 'пальто', unpaid=True), ['Пальто'])
+
+        order = self.app.get_podzakaz_history()[0]
+        self.assertTrue(self.app.add_payment(order, '15000')[0])
+        self.assertEqual(self.products(PODZAKAZ, unpaid=True), [])
+        self.assertEqual(self.products(PODZAKAZ, 'пальто'), ['Пальто'])
+
+
+if __name__ == '__main__':
+    unittest.main()
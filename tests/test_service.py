@@ -0,0 +1,115 @@
+"""Служба для нескольких касс (service.py): очередь записи и HTTP API.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+from urllib.request import Request, urlopen
+
+from sales_app import SalesApp
+from service import WriteQueue, start_service
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SALE = ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', '']
+
+
+class ImportTest(unittest.TestCase):
+    def test_service_tools_do_not_load_the_ui(self):
+        code = "import sys, service, bulk_import, loadtest; print('main' in sys.modules, 'flet' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['False', 'False'])
+
+
+class ServiceTestCase(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = SalesApp(storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+
+
+class WriteQueueTest(ServiceTestCase):
+    def test_saves_are_committed_in_one_batch(self):
+        writer = WriteQueue(self.app, max_wait=0.5)
+        self.addCleanup(writer.stop)
+        futures = [writer.submit(SALES, SALE), writer.submit(SALES, SALE[:1] + ['Юбка'] + SALE[2:])]
+        self.assertEqual([future.result(5)[0] for future in futures], [True, True])
+        self.assertEqual([record.product for record in self.app.get_sales_history()], ['Платье', 'Юбка'])
+        self.assertEqual(self.app.get_statistics(SALES)['count'], 2)
+
+    def test_partly_written_batch_answers_each_row(self):
+        append_many = self.app.storage.append_many
+
+        def write_first_row_only(kind, rows):
+            append_many(kind, rows[:1])
+            raise OSError("диск заполнен")
+
+        self.app.storage.append_many = write_first_row_only
+        writer = WriteQueue(self.app, max_wait=0.5)
+        self.addCleanup(writer.stop)
+        futures = [writer.submit(SALES, SALE), writer.submit(SALES, SALE[:1] + ['Юбка'] + SALE[2:])]
+        results = [future.result(5) for future in futures]
+
+        # Первая строка сохранена — повторять ее нельзя, вторая нет — ее можно сохранить снова
+        self.assertEqual([success for success, _ in results], [True, False])
+        self.assertIn("диск заполнен", results[1][1])
+        self.assertEqual([record.product for record in self.app.get_sales_history()], ['Платье'])
+        self.assertEqual(self.app.get_statistics(SALES)['count'], 1)
+
+    def test_failure_after_write_is_not_a_failed_save(self):
+        def broken(*args):
+            raise ValueError("итоги")
+
+        self.app.stats.add_many = broken
+        writer = WriteQueue(self.app)
+        self.addCleanup(writer.stop)
+        self.assertTrue(writer.submit(SALES, SALE).result(5)[0])
+        self.assertEqual(len(self.app.get_sales_history()), 1)
+
+
+class HttpTest(ServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        server, writer, self.url = start_service(self.app, port=0)
+        self.addCleanup(writer.stop)
+        self.addCleanup(server.shutdown)
+
+    def request(self, path, data=None):
+        body = None if data is None else json.dumps(data).encode('utf-8')
+        with urlopen(Request(self.url + path, data=body), timeout=5) as response:
+            return json.loads(response.read())
+
+    def test_saved_podzakaz_shows_up_in_history_and_balances(self):
+        result = self.request('/podzakaz', {'product_name': 'Пальто', 'color': 'серый', 'size': 'L',
+                                            'price': '20000', 'paid_amount': '5000',
+                                            'remaining_amount': '15000', 'client_link': 'client'})
+        self.assertTrue(result['success'])
+
+        history = self.request(f'/history?kind={PODZAKAZ}&offset=0')
+        self.assertEqual(len(history['rows']), 1)
+        order = history['rows'][0][8]
+        self.assertEqual(self.request(f'/history?kind={PODZAKAZ}&offset=1'),
+                         {'generation': history['generation'], 'rows': []})
+
+        balances = self.request(f'/balances?id={order}&id=missing')
+        self.assertEqual(balances, [{'order_id': order, 'paid': '5000', 'remaining': '15000'}, None])
+
+        self.assertTrue(self.request('/payments', {'order_id': order, 'amount': '15000'})['success'])
+        self.assertEqual(self.request(f'/balance?id={order}')['remaining'], '0')
+
+    def test_clear_changes_history_generation(self):
+        self.request('/sales', dict(zip(['product_name', 'color', 'size', 'price', 'category'], SALE[1:6])))
+        before = self.request(f'/history?kind={SALES}&offset=0')
+        self.assertTrue(self.request('/clear', {'kind': SALES})['success'])
+        after = self.request(f'/history?kind={SALES}&offset=0')
+        self.assertNotEqual(after['generation'], before['generation'])
+        self.assertEqual(after['rows'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
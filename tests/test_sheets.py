@@ -0,0 +1,119 @@
+"""Отправка в Google Таблицы (sales_app.GoogleSheetsManager): пакетные запросы и отправка по одной строке.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import importlib.util
+import unittest
+
+from outbox import Rejected
+from sales_app import GoogleSheetsManager
+
+ROWS = [('order', {'id': 'a', 'product': 'Платье'}), ('podzakaz', {'id': 'b', 'product': 'Пальто'})]
+
+
+class FakeResponse:
+    def __init__(self, status_code, result):
+        self.status_code = status_code
+        self.result = result
+
+    def json(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeSession:
+    """Сессия, которая отвечает на запросы по очереди; ответ — (код, JSON) или исключение"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.payloads = []
+
+    def post(self, url, json=None, timeout=None):
+        self.payloads.append(json)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(*answer)
+
+
+def ok(message='ok'):
+    return 200, {'success': True, 'message': message}
+
+
+class SheetsTestCase(unittest.TestCase):
+    def make_manager(self, *answers):
+        manager = GoogleSheetsManager('http://sheets.test/exec')
+        manager._session = self.session = FakeSession(*answers)
+        return manager
+
+
+class SaveBatchTest(SheetsTestCase):
+    def test_rows_are_sent_in_one_request(self):
+        manager = self.make_manager((200, {'success': True, 'results': [
+            {'success': True, 'message': 'ok'}, {'success': False, 'message': 'нет листа'}]}))
+        results = manager.save_batch(ROWS)
+
+        self.assertEqual(len(self.session.payloads), 1)
+        self.assertEqual(self.session.payloads[0]['type'], GoogleSheetsManager.BATCH_TYPE)
+        self.assertEqual([row['type'] for row in self.session.payloads[0]['rows']], ['order', 'podzakaz'])
+        self.assertEqual(results[0], (True, 'ok'))
+        self.assertFalse(results[1][0])
+        self.assertIsInstance(results[1][1], Rejected)
+        self.assertTrue(manager.batch_supported)
+
+    def test_old_script_switches_to_single_rows(self):
+        manager = self.make_manager((200, {'success': False, 'message': 'Неизвестный тип'}), ok(), ok())
+        self.assertEqual(manager.save_batch(ROWS), [(True, 'ok'), (True, 'ok')])
+        self.assertIs(manager.batch_supported, False)
+
+        # Дальше строки идут по одной без пакетного запроса
+        self.session.answers = [ok()]
+        self.assertEqual(manager.save_batch(ROWS[:1]), [(True, 'ok')])
+        self.assertEqual([payload['type'] for payload in self.session.payloads], ['batch', 'order', 'podzakaz', 'order'])
+
+    def test_incomplete_answer_sends_this_batch_by_rows(self):
+        manager = self.make_manager((200, {'success': True, 'results': [{'success': True}]}), ok(), ok())
+        self.assertEqual(manager.save_batch(ROWS), [(True, 'ok'), (True, 'ok')])
+        self.assertIsNone(manager.batch_supported)
+
+    def test_server_error_fails_batch_without_fallback(self):
+        manager = self.make_manager((500, ValueError("не JSON")))
+        results = manager.save_batch(ROWS)
+        self.assertEqual([success for success, _ in results], [False, False])
+        self.assertIn("500", results[0][1])
+        self.assertEqual(len(self.session.payloads), 1)
+        self.assertIsNone(manager.batch_supported)
+
+    def test_connection_error_fails_every_row(self):
+        manager = self.make_manager(ConnectionError("нет сети"))
+        results = manager.save_batch(ROWS)
+        self.assertEqual([success for success, _ in results], [False, False])
+        self.assertIn("нет сети", results[1][1])
+        self.assertEqual(manager.save_batch([]), [])
+
+
+class SaveToSheetsTest(SheetsTestCase):
+    def test_refused_row_is_rejected_and_server_error_is_retryable(self):
+        manager = self.make_manager((200, {'success': False, 'message': 'плохая строка'}),
+                                    (503, {'success': False, 'message': 'перегружен'}))
+        success, message = manager.save_to_sheets('order', {'id': 'a'})
+        self.assertFalse(success)
+        self.assertIsInstance(message, Rejected)
+
+        success, message = manager.save_to_sheets('order', {'id': 'a'})
+        self.assertFalse(success)
+        self.assertNotIsInstance(message, Rejected)
+
+
+@unittest.skipUnless(importlib.util.find_spec('requests'), "нужен пакет requests")
+class SessionTest(unittest.TestCase):
+    def test_one_pooled_session_is_reused(self):
+        manager = GoogleSheetsManager('http://sheets.test/exec', pool_size=3)
+        session = manager.session
+        self.assertIs(manager.session, session)
+        self.assertEqual(session.get_adapter('https://script.google.com')._pool_maxsize, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Двоичный снимок истории (snapshot.py): запись, открытие через mmap и проверка, что файл только дописывался.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import os
+import unittest
+from decimal import Decimal
+
+from records import SaleRecord
+from snapshot import Snapshot, open_snapshot, snapshot_path, value_counts, write_snapshot
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    # Неразобранная дата хранится в снимке исходным текстом, сумма с пробелом — числом
+    ['15.03.2024 10:00', 'Юбка', 'черный', 'S', '1 500', 'SET', 'Вася', '300'],
+    ['2024-05-02 11:00:00', 'Платье', 'белый', 'L', '12.50', 'SET', 'Вася', ''],
+]
+PODZAKAZ_ROWS = [
+    ['2024-05-03 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1b2c3'],
+]
+TAIL_ROW = ['2024-05-04 09:00:00', 'Пиджак', 'синий', 'M', '7000', 'Resale', '', '']
+
+
+def rows(records):
+    return [record.to_row() for record in records]
+
+
+# Разобранные суммы запись возвращает в своем формате ('1 500' -> '1500'), как и без снимка
+SALES_SAVED = rows(SaleRecord.from_row(row) for row in SALE_ROWS)
+
+
+class SnapshotFileTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        self.records = [SaleRecord.from_row(row) for row in SALE_ROWS]
+        self.offset = os.path.getsize('sales_data.csv')
+
+    def test_records_round_trip(self):
+        self.assertTrue(write_snapshot('sales_data.csv', SALES, SaleRecord, None, self.records, self.offset))
+        snapshot = open_snapshot('sales_data.csv', SALES, SaleRecord)
+        self.addCleanup(snapshot.close)
+
+        self.assertIsInstance(snapshot, Snapshot)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(rows(snapshot), SALES_SAVED)
+        self.assertEqual(snapshot[-1].price, Decimal('12.50'))
+        self.assertEqual(rows(snapshot[1:]), SALES_SAVED[1:])
+        self.assertEqual(snapshot[1].raw, {'date': '15.03.2024 10:00'})
+        self.assertEqual(value_counts(snapshot, 'courier'), {'': 1, 'Вася': 2})
+
+    def test_snapshot_of_rewritten_file_is_ignored(self):
+        write_snapshot('sales_data.csv', SALES, SaleRecord, None, self.records, self.offset)
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS[::-1])
+        self.assertIsNone(open_snapshot('sales_data.csv', SALES, SaleRecord))
+        self.assertIsNone(open_snapshot('sales_data.csv', PODZAKAZ, SaleRecord))
+
+    def test_broken_snapshot_is_ignored(self):
+        with open(snapshot_path('sales_data.csv'), 'wb') as file:
+            file.write(b'not a snapshot')
+        self.assertIsNone(open_snapshot('sales_data.csv', SALES, SaleRecord))
+
+
+class StorageSnapshotTest(TempDirTestCase):
+    def reopen(self, backend):
+        storage = open_storage(backend)
+        self.addCleanup(storage.close)
+        return storage
+
+    @staticmethod
+    def cache(storage, kind):
+        return storage.caches[kind] if hasattr(storage, 'caches') else storage.logs[kind]
+
+    def test_history_starts_from_snapshot_and_reads_only_the_tail(self):
+        for backend in ('csv', 'log'):
+            with self.subTest(backend=backend):
+                os.mkdir(backend)
+                os.chdir(backend)
+                self.addCleanup(os.chdir, self.directory)
+
+                storage = open_storage(backend)
+                storage.append_many(SALES, SALE_ROWS)
+                storage.append_many(PODZAKAZ, PODZAKAZ_ROWS)
+                storage.save_snapshot()
+                storage.append(SALES, TAIL_ROW)
+                storage.close()
+
+                storage = self.reopen(backend)
+                cache = self.cache(storage, SALES)
+                self.assertIsInstance(cache.base, Snapshot)
+                self.assertEqual(rows(storage.load(SALES)), SALES_SAVED + [TAIL_ROW])
+                self.assertEqual(rows(cache.records), [TAIL_ROW])
+                self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS)
+                self.assertEqual(rows(storage.read_since(SALES, 2)[1]), SALES_SAVED[2:] + [TAIL_ROW])
+
+                # Хвост короче min_tail — снимок не переписывается
+                storage.save_snapshot(min_tail=2)
+                storage.close()
+                storage = self.reopen(backend)
+                self.assertEqual(len(self.cache(storage, SALES).base), 3)
+
+                # Новый снимок продолжает прошлый: хвост переходит в снимок
+                storage.save_snapshot()
+                storage.close()
+                storage = self.reopen(backend)
+                self.assertEqual(len(self.cache(storage, SALES).base), 4)
+                self.assertEqual(rows(storage.load(SALES)), SALES_SAVED + [TAIL_ROW])
+
+    def test_cleared_history_drops_the_snapshot(self):
+        storage = open_storage('log')
+        storage.append_many(SALES, SALE_ROWS)
+        storage.save_snapshot()
+        storage.clear(SALES)
+        storage.close()
+
+        storage = self.reopen('log')
+        self.assertIsNone(storage.logs[SALES].base)
+        self.assertEqual(storage.load(SALES), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Хранилища истории (storage.py): одинаковое поведение всех видов и перенос из CSV.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import os
+import unittest
+from datetime import date
+from unittest import mock
+
+from storage import PODZAKAZ, SALES, CsvStorage, PartitionedCsvStorage, SqliteStorage, open_storage
+from tests import TempDirTestCase
+
+BACKENDS = ('csv', 'log', 'sqlite', 'partitioned')
+
+SALE_ROWS = [
+    ['2024-04-30 18:00:00', 'Платье', 'красный', 'M', '5000', 'SET', '', ''],
+    ['2024-05-01 10:00:00', 'Юбка', 'черный', 'S', '1500', 'Без категории', 'Вася', '300'],
+    ['2024-05-02 11:00:00', 'Платье', 'белый', 'L', '7000', 'SET', 'Вася', '500'],
+]
+PODZAKAZ_ROWS = [
+    ['2024-04-29 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1b2c3'],
+    ['2024-05-03 12:00:00', 'Куртка', 'синий', 'M', '9000', '9000', '0', 'other', 'd4e5f6'],
+]
+
+
+def rows(records):
+    return [record.to_row() for record in records]
+
+
+class BackendParityTest(TempDirTestCase):
+    """Одни и те же действия дают одинаковый результат во всех хранилищах"""
+
+    def run_scenario(self, backend):
+        os.mkdir(backend)
+        os.chdir(backend)
+        self.addCleanup(os.chdir, self.directory)
+        storage = open_storage(backend)
+        self.addCleanup(storage.close)
+        storage.append(SALES, SALE_ROWS[0])
+        storage.append_many(SALES, SALE_ROWS[1:])
+        storage.append_many(PODZAKAZ, PODZAKAZ_ROWS)
+
+        result = {
+            'load': (rows(storage.load(SALES)), rows(storage.load(PODZAKAZ))),
+            'may': rows(storage.query(SALES, date(2024, 5, 1), date(2024, 5, 31))),
+            'courier': rows(storage.query(SALES, courier='Вася', product='Платье')),
+            'client': rows(storage.query(PODZAKAZ, client='client')),
+            'iter': rows(storage.iter_records(SALES, date_from=date(2024, 5, 2))),
+        }
+        generation, tail = storage.read_since(SALES, 1)
+        result['since'] = rows(tail)
+
+        storage.clear(SALES)
+        cleared, tail = storage.read_since(SALES, 0)
+        result['cleared'] = (cleared != generation, rows(tail), rows(storage.load(SALES)))
+        result['archive'] = rows(storage.query(SALES, include_archive=True))
+        result['podzakaz_kept'] = rows(storage.load(PODZAKAZ))
+        return result
+
+    def test_backends_agree(self):
+        expected = {
+            'load': (SALE_ROWS, PODZAKAZ_ROWS),
+            'may': SALE_ROWS[1:],
+            'courier': SALE_ROWS[2:],
+            'client': PODZAKAZ_ROWS[:1],
+            'iter': SALE_ROWS[2:],
+            'since': SALE_ROWS[1:],
+            'cleared': (True, [], []),
+            'archive': SALE_ROWS,
+            'podzakaz_kept': PODZAKAZ_ROWS,
+        }
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(self.run_scenario(backend), expected)
+
+
+class SqliteMigrationTest(TempDirTestCase):
+    def test_history_is_moved_once(self):
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        self.write_csv('podzakaz_data.csv', PODZAKAZ, PODZAKAZ_ROWS)
+        storage = open_storage('sqlite')
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+        self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS)
+        storage.close()
+
+        storage = open_storage('sqlite')
+        self.assertEqual(len(storage.load(SALES)), len(SALE_ROWS))
+        storage.close()
+
+    def test_interrupted_migration_is_rolled_back_and_repeated(self):
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        self.write_csv('podzakaz_data.csv', PODZAKAZ, PODZAKAZ_ROWS)
+        source = CsvStorage('sales_data.csv', 'podzakaz_data.csv')
+        # Продажи перенесены, а на подзаказах перенос прерывается
+        with mock.patch.object(source, 'load', side_effect=[source.load(SALES), OSError("сбой")]):
+            with self.assertRaises(OSError):
+                SqliteStorage('sales.db', migrate_from=source)
+
+        storage = open_storage('sqlite')
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+        self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS)
+        storage.close()
+
+    def test_csv_added_after_new_database_is_not_mixed_in(self):
+        open_storage('sqlite').close()
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        storage = open_storage('sqlite')
+        self.assertEqual(storage.load(SALES), [])
+        storage.close()
+
+
+class PartitionedMigrationTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_csv('sales_data.csv', SALES, SALE_ROWS)
+        self.write_csv('podzakaz_data.csv', PODZAKAZ, PODZAKAZ_ROWS)
+
+    def test_history_is_split_by_month(self):
+        storage = open_storage('partitioned')
+        self.assertEqual(storage.partitions(SALES), ['2024-04', '2024-05'])
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+        self.assertFalse(os.path.exists(os.path.join('data', PartitionedCsvStorage.STAGING_DIR)))
+
+        storage = open_storage('partitioned')
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+
+    def test_crash_while_building_starts_over(self):
+        original = PartitionedCsvStorage.append_many
+
+        def crash_on_podzakaz(storage, kind, chunk):
+            if kind == PODZAKAZ:
+                raise OSError("сбой")
+            original(storage, kind, chunk)
+
+        with mock.patch.object(PartitionedCsvStorage, 'append_many', crash_on_podzakaz):
+            with self.assertRaises(OSError):
+                open_storage('partitioned')
+        self.assertEqual(PartitionedCsvStorage('data').load(SALES), [])
+
+        storage = open_storage('partitioned')
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+        self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS)
+
+    def test_crash_while_moving_finishes_without_duplicates(self):
+        original = os.replace
+        moved = []
+
+        def crash_after_first(source, target):
+            if moved:
+                raise OSError("сбой")
+            moved.append(target)
+            original(source, target)
+
+        with mock.patch('storage.os.replace', crash_after_first):
+            with self.assertRaises(OSError):
+                open_storage('partitioned')
+
+        storage = open_storage('partitioned')
+        self.assertEqual(rows(storage.load(SALES)), SALE_ROWS)
+        self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS)
+        self.assertFalse(os.path.exists(os.path.join('data', PartitionedCsvStorage.STAGING_DIR)))
+
+
+
+class PartitionedArchiveTest(TempDirTestCase):
+    def test_closed_periods_move_to_archive(self):
+        storage = open_storage('partitioned')
+        storage.append_many(SALES, SALE_ROWS)
+        generation, _ = storage.read_since(SALES, 0)
+
+        # Все периоды продаж уже закончились
+        self.assertEqual(storage.archive_closed(SALES), ['2024-04', '2024-05'])
+        self.assertEqual(storage.load(SALES), [])
+        self.assertNotEqual(storage.read_since(SALES, 0)[0], generation)
+        self.assertTrue(os.path.exists(storage.archive_path(SALES, '2024-05')))
+        self.assertEqual(rows(storage.query(SALES, include_archive=True)), SALE_ROWS)
+
+    def test_period_with_kept_record_stays(self):
+        storage = open_storage('partitioned')
+        storage.append_many(PODZAKAZ, PODZAKAZ_ROWS)
+        kept = storage.archive_closed(PODZAKAZ, keep=lambda record: record.remaining > 0)
+        self.assertEqual(kept, ['2024-05'])
+        self.assertEqual(rows(storage.load(PODZAKAZ)), PODZAKAZ_ROWS[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Подсказки для полей формы (search.PrefixIndex, SuggestionIndex): частые значения по началу слова.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import unittest
+
+from records import SaleRecord
+from sales_app import SalesApp
+from search import PrefixIndex, SuggestionIndex
+from storage import PODZAKAZ, SALES, open_storage
+from tests import TempDirTestCase
+
+SALE_ROWS = [
+    ['2024-05-01 10:00:00', 'Платье', 'красный', 'M', '5000', 'SET', 'Вася', '300'],
+    ['2024-05-02 10:00:00', 'Платье', 'розовый', 'M', '5000', 'SET', 'Вася', '300'],
+    ['2024-05-03 10:00:00', 'Пальто', 'красный', 'L', '9000', 'SET', 'Петя', '300'],
+]
+PODZAKAZ_ROWS = [
+    ['2024-05-04 12:00:00', 'Пальто', 'серый', 'L', '20000', '5000', '15000', 'client', 'a1'],
+    ['2024-05-05 12:00:00', 'Пальто', 'серый', 'XL', '20000', '5000', '15000', 'client', 'b2'],
+]
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def test_most_frequent_first_case_insensitive(self):
+        index = PrefixIndex(limit=2)
+        index.extend(['Платье', 'платье', 'Пальто', 'Пиджак', 'Пиджак', 'Пиджак', 'Юбка', ' '])
+        self.assertEqual(index.lookup('п'), ['Пиджак', 'Платье'])
+        self.assertEqual(index.lookup('ПЛ'), ['Платье'])
+        self.assertEqual(index.lookup('х'), [])
+
+    def test_added_value_resets_cached_answers(self):
+        index = PrefixIndex()
+        index.extend(['Платье'])
+        self.assertEqual(index.lookup('п'), ['Платье'])
+        index.add('Пальто')
+        index.add('Пальто')
+        self.assertEqual(index.lookup('п'), ['Пальто', 'Платье'])
+        self.assertEqual(index.lookup('пла'), ['Платье'])
+
+
+class SuggestionIndexTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = SalesApp(storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+        self.app.import_rows(SALES, SALE_ROWS, push_to_sheets=False)
+        self.app.import_rows(PODZAKAZ, PODZAKAZ_ROWS, push_to_sheets=False)
+        self.suggestions = SuggestionIndex(self.app)
+        self.suggestions.refresh()
+
+    def test_values_from_sales_and_podzakaz(self):
+        self.assertEqual(self.suggestions.lookup('product', 'п'), ['Пальто', 'Платье'])
+        self.assertEqual(self.suggestions.lookup('color', 'к'), ['красный'])
+        self.assertEqual(self.suggestions.lookup('size', 'x'), ['XL'])
+        # Курьеры есть только у продаж
+        self.assertEqual(self.suggestions.lookup('courier', ''), ['Вася', 'Петя'])
+
+    def test_saved_record_is_counted_once(self):
+        self.app.save_sale('Пиджак', 'синий', 'S', '7000', 'SET', '', '')
+        self.suggestions.add(SALES, SaleRecord.from_row(['', 'Пиджак', 'синий', 'S', '7000', 'SET', '', '']))
+        self.assertEqual(self.suggestions.lookup('product', 'пи'), ['Пиджак'])
+
+        # refresh дочитывает историю, но запись, уже учтенную через add, не считает второй раз
+        self.suggestions.refresh()
+        self.assertEqual(self.suggestions.fields['product'].counts['пиджак'], 1)
+        self.assertEqual(self.suggestions.counted[SALES], 4)
+
+    def test_cleared_history_rebuilds_the_index(self):
+        self.app.clear_history(self.app.csv_file)
+        self.suggestions.refresh()
+        self.assertEqual(self.suggestions.lookup('courier', ''), [])
+        self.assertEqual(self.suggestions.lookup('product', 'п'), ['Пальто'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""Сверка с Google Таблицами (sync.py): отметка отправленного, продолжение после сбоя и получение изменений.
+
+Запуск: python -m pytest tests (или python -m unittest discover tests)
+"""
+import threading
+import unittest
+from collections import Counter
+
+from outbox import SyncOutbox
+from sales_app import SalesApp
+from storage import PODZAKAZ, SALES, open_storage
+from sync import SyncEngine, track_outbox
+from tests import TempDirTestCase
+
+
+class FakeSheets:
+    """Таблицы в памяти: принимают строки пакетами и выдают изменения по курсору (номеру строки журнала)"""
+
+    changes_supported = None
+
+    def __init__(self):
+        self.rows = []
+        self.changes = []
+        self.requests = 0
+        # Сколько строк еще принять до «обрыва связи»; None — без ограничений
+        self.accept = None
+
+    def save_batch(self, rows):
+        self.requests += 1
+        results = []
+        for data_type, data in rows:
+            if self.accept is not None:
+                if self.accept <= 0:
+                    results.append((False, "нет связи"))
+                    continue
+                self.accept -= 1
+            self.rows.append(dict(data, type=data_type))
+            results.append((True, "ok"))
+        return results
+
+    def save_to_sheets(self, data_type, data):
+        return self.save_batch([(data_type, data)])[0]
+
+    def fetch_changes(self, data_type, since=None, limit=500):
+        self.changes_supported = True
+        position = int(since or 0)
+        rows = [row for row in self.changes if row['type'] == data_type]
+        chunk = rows[position:position + limit]
+        return True, chunk, str(position + len(chunk)), position + len(chunk) < len(rows)
+
+    def ids(self):
+        return Counter(row['id'] for row in self.rows)
+
+
+class SyncTestCase(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = SalesApp(storage=open_storage('log'))
+        self.addCleanup(self.app.storage.close)
+        self.sheets = FakeSheets()
+
+    def save_sales(self, count, prefix='Платье'):
+        for number in range(count):
+            self.app.save_sale(f'{prefix} {number}', 'красный', 'M', '5000', 'SET', '', '')
+
+
+class PayloadTest(SyncTestCase):
+    def test_payload_has_record_id_and_idempotency_key(self):
+        self.save_sales(1)
+        self.app.save_podzakaz('Пальто', 'серый', 'L', '20000', '5000', '15000', 'client')
+        sale = self.app.get_sales_history()[0]
+        order = self.app.get_podzakaz_history()[0]
+
+        payload = self.app.sheets_payload(SALES, sale.to_row())
+        self.assertEqual(payload['id'], sale.record_id())
+        self.assertEqual(payload['idempotency_key'], f"order:{sale.record_id()}")
+        payload = self.app.sheets_payload(PODZAKAZ, order.to_row())
+        self.assertEqual(payload['order_id'], order.order_id)
+        self.assertEqual(payload['idempotency_key'], f"podzakaz:{order.order_id}")
+
+
+class PushTest(SyncTestCase):
+    def test_only_rows_after_the_mark_are_sent_in_batches(self):
+        self.save_sales(3, 'Старое')
+        engine = SyncEngine(self.app, self.sheets, batch_size=200)
+        # Первая сверка считает накопленную историю уже отправленной
+        self.assertEqual(engine.sync()['pushed'], 0)
+
+        # Неделя без связи
+        self.save_sales(450)
+        result = engine.sync()
+        self.assertEqual(result['pushed'], 450)
+        # Три пакетных запроса и по одному запросу изменений на вид записей
+        self.assertEqual((self.sheets.requests, result['requests']), (3, 5))
+        self.assertEqual(engine.pending(SALES), 0)
+
+        self.assertEqual(engine.sync()['pushed'], 0)
+        self.assertEqual(len(self.sheets.rows), 450)
+
+    def test_interrupted_push_resumes_without_duplicates(self):
+        SyncEngine(self.app, self.sheets).sync()
+        self.save_sales(300)
+        self.sheets.accept = 250
+        result = SyncEngine(self.app, self.sheets, batch_size=100).sync()
+        self.assertEqual(result['pushed'], 250)
+        self.assertTrue(result['errors'])
+
+        # Перезапуск: новая сверка читает отметку из файла состояния
+        self.sheets.accept = None
+        self.assertEqual(SyncEngine(self.app, self.sheets, batch_size=100).sync()['pushed'], 50)
+        ids = self.sheets.ids()
+        self.assertEqual(len(ids), 300)
+        self.assertEqual(max(ids.values()), 1)
+
+
+class OutboxAckTest(SyncTestCase):
+    def test_rows_delivered_by_outbox_are_not_sent_again(self):
+        SyncEngine(self.app, self.sheets).sync()
+        outbox = SyncOutbox(self.sheets, base_delay=0.01, batch_max_age=0)
+        self.addCleanup(outbox.close)
+        track_outbox(outbox)
+        delivered = threading.Event()
+        outbox.add_listener(lambda outcomes: outbox.pending_count() or delivered.set())
+        self.app.outbox = outbox
+
+        self.save_sales(5)
+        outbox.start()
+        self.assertTrue(delivered.wait(10))
+        outbox.stop(5)
+
+        result = SyncEngine(self.app, self.sheets).sync()
+        self.assertEqual(result['pushed'], 0)
+        self.assertEqual(len(self.sheets.rows), 5)
+
+    def test_rows_waiting_in_outbox_are_skipped(self):
+        SyncEngine(self.app, self.sheets).sync()
+        outbox = SyncOutbox(self.sheets)
+        self.addCleanup(outbox.close)
+        self.app.outbox = outbox
+        self.save_sales(2)
+
+        engine = SyncEngine(self.app, self.sheets, outbox=outbox)
+        self.assertEqual(engine.sync()['pushed'], 0)
+        self.assertEqual(engine.pending(SALES), 2)
+
+
+class PullTest(SyncTestCase):
+    def test_remote_rows_and_payments_are_applied_once(self):
+        self.app.save_podzakaz('Пальто', 'серый', 'L', '20000', '5000', '15000', 'client')
+        order = self.app.get_podzakaz_history()[0]
+        engine = SyncEngine(self.app, self.sheets)
+        engine.sync()
+
+        self.sheets.changes = [
+            {'type': 'order', 'id': 'remote1', 'date': '2024-05-01T10:00:00.000Z', 'product': 'Юбка',
+             'color': 'черный', 'size': 'S', 'price': 1500, 'category': 'SET', 'courier': '', 'courier_amount': ''},
+            # В таблице внесли доплату по подзаказу этой кассы
+            {**self.app.sheets_payload(PODZAKAZ, order.to_row()), 'type': 'podzakaz', 'paid': '12000'},
+        ]
+        result = engine.sync()
+        self.assertEqual((result['pulled'], result['payments'], result['pushed']), (1, 1, 0))
+        self.assertEqual([record.date for record in self.app.get_sales_history()], ['2024-05-01 10:00:00'])
+        self.assertEqual(self.app.order_balance(order).remaining, 8000)
+
+        # Те же изменения еще раз (курсор сброшен) ничего не меняют
+        engine.state['pull'] = {SALES: None, PODZAKAZ: None}
+        result = engine.sync()
+        self.assertEqual((result['pulled'], result['payments']), (0, 0))
+        self.assertEqual(len(self.app.get_sales_history()), 1)
+        self.assertEqual(self.sheets.rows, [])
+
+
+if __name__ == '__main__':
+    unittest.main()